@@ -0,0 +1,64 @@
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+
+from . import run as RUN
+
+def main(argv=None):
+    """
+    Run the benchmarks and compare them against a baseline.
+
+    Parameters:
+    -----------
+    argv - list - Command line arguments (sys.argv[1:] if not set)
+    -----------
+
+    Returns:
+    --------
+    Int - exit code, 1 if any of the stages regressed
+    --------
+    """
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Time the PyD3DBSP readers on synthetic files.')
+    parser.add_argument('-s', '--size', choices=sorted(RUN.SIZES), default='small', help='size preset of the synthetic files')
+    parser.add_argument('-r', '--repeat', type=int, default=7, help='number of timed runs of each stage')
+    parser.add_argument('--stage', action='append', dest='stages', choices=RUN.STAGES, help='run only this stage (can be repeated)')
+    parser.add_argument('--fixtures', help='directory the synthetic files are written to and reused from (temporary if not set)')
+    parser.add_argument('-o', '--output', help='write the results into this JSON file')
+    parser.add_argument('-b', '--baseline', help='compare the results against this JSON file')
+    parser.add_argument('-t', '--threshold', type=float, default=0.25, help='allowed slowdown compared to the baseline (0.25 = 25%%)')
+    parser.add_argument('--statistic', choices=('min', 'median', 'mean'), default='min', help='statistic compared against the baseline')
+    args = parser.parse_args(argv)
+
+    fixturedir = args.fixtures or tempfile.mkdtemp(prefix='pyd3dbsp_bench_')
+    try:
+        results = RUN.run_benchmarks(fixturedir, args.size, args.repeat, args.stages)
+    finally:
+        if(not args.fixtures):
+            shutil.rmtree(fixturedir, ignore_errors=True)
+
+    rows = None
+    if(args.baseline):
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+        try:
+            rows = RUN.compare(results, baseline, args.threshold, args.statistic)
+        except ValueError as e:
+            print(str(e))
+            return 1
+
+    RUN.print_results(results, rows)
+
+    if(args.output):
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=1)
+
+    regressions = [row[0] for row in rows or [] if row[4] == 'regression']
+    if(regressions):
+        print("Regressed: " + ', '.join(regressions))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
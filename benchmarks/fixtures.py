@@ -0,0 +1,330 @@
+import os
+import struct
+
+import numpy as np
+
+from pyd3dbsp import read_d3dbsp as D3DBSPREADER
+from pyd3dbsp import read_xmodel as XMODELREADER
+from pyd3dbsp import read_material as MATERIALREADER
+from pyd3dbsp import read_texture as TEXTUREREADER
+
+LUMP_COUNT = 39 # number of lumps in the lump table
+
+def _fill_vertex_fields(rng, records, spread=1000.0):
+    """
+    Fill the common vertex fields of a structured array with random values.
+
+    Parameters:
+    -----------
+    rng     - numpy Generator   - Random number generator
+    records - numpy array       - Structured array with pos, norm, clr and uv fields
+    spread  - float             - Range of the positions
+    -----------
+    """
+    count = len(records)
+    for axis in 'xyz':
+        records['pos_' + axis] = rng.uniform(-spread, spread, count)
+    normals = rng.normal(size=(count, 3))
+    normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-6)
+    records['norm_x'], records['norm_y'], records['norm_z'] = normals.T
+    for channel in 'rgba':
+        records['clr_' + channel] = rng.integers(0, 256, count)
+    records['uv_u'] = rng.uniform(0, 4, count)
+    records['uv_v'] = rng.uniform(0, 4, count)
+
+def _entity_lump(rng, entity_count, models):
+    """
+    Create the entity lump: a worldspawn and prop entities with origin, angles and modelscale.
+
+    Parameters:
+    -----------
+    rng             - numpy Generator   - Random number generator
+    entity_count    - int               - Number of prop entities
+    models          - list              - Model names the props use
+    -----------
+
+    Returns:
+    --------
+    Bytes - null terminated entity string
+    --------
+    """
+    lines = ['{', '"classname" "worldspawn"', '"_color" "1 0.95 0.9"', '}']
+    origins = rng.uniform(-4096, 4096, (entity_count, 3))
+    angles = rng.uniform(0, 360, (entity_count, 3))
+    for i in range(entity_count):
+        lines += [
+            '{',
+            '"classname" "misc_model"',
+            '"model" "xmodel/' + models[i % len(models)] + '"',
+            '"origin" "%.3f %.3f %.3f"' % tuple(origins[i]),
+            '"angles" "%.3f %.3f %.3f"' % tuple(angles[i]),
+            '"modelscale" "%.2f"' % (0.5 + (i % 4) * 0.25),
+            '}'
+        ]
+    return ('\n'.join(lines) + '\n').encode('utf-8') + b'\x00'
+
+def write_d3dbsp(filepath, trianglesoups=1000, vertices=32, triangles=24, materials=64, entities=500, seed=0):
+    """
+    Write a .d3dbsp file with random geometry and entities.
+
+    Parameters:
+    -----------
+    filepath        - string    - Path to the file
+    trianglesoups   - int       - Number of trianglesoups
+    vertices        - int       - Number of vertices of each trianglesoup
+    triangles       - int       - Number of triangles of each trianglesoup
+    materials       - int       - Number of materials
+    entities        - int       - Number of prop entities
+    seed            - int       - Seed of the random number generator
+    -----------
+    """
+    rng = np.random.default_rng(seed)
+
+    material_records = np.zeros(materials, dtype=D3DBSPREADER.dtype_D3DBSPMaterial)
+    material_records['name'] = [('bench/material_' + str(i)).encode('utf-8') for i in range(materials)]
+
+    soup_records = np.zeros(trianglesoups, dtype=D3DBSPREADER.dtype_D3DBSPTriangleSoup)
+    soup_records['material_id'] = rng.integers(0, materials, trianglesoups)
+    soup_records['draw_order'] = rng.integers(0, 3, trianglesoups)
+    soup_records['vertex_offset'] = np.arange(trianglesoups) * vertices
+    soup_records['vertex_length'] = vertices
+    soup_records['triangle_length'] = triangles * 3
+    soup_records['triangle_offset'] = np.arange(trianglesoups) * triangles * 3
+
+    vertex_records = np.zeros(trianglesoups * vertices, dtype=D3DBSPREADER.dtype_D3DBSPVertex)
+    _fill_vertex_fields(rng, vertex_records)
+
+    # triangle indices are relative to the first vertex of the trianglesoup
+    indices = rng.integers(0, vertices, (trianglesoups * triangles, 3))
+    triangle_records = np.zeros(trianglesoups * triangles, dtype=D3DBSPREADER.dtype_D3DBSPTriangle)
+    triangle_records['v1'], triangle_records['v2'], triangle_records['v3'] = indices.T
+
+    lump_data = {
+        D3DBSPREADER.LUMP.MATERIALS.value : material_records.tobytes(),
+        D3DBSPREADER.LUMP.TRIANGLESOUPS.value : soup_records.tobytes(),
+        D3DBSPREADER.LUMP.VERTICES.value : vertex_records.tobytes(),
+        D3DBSPREADER.LUMP.TRIANGLES.value : triangle_records.tobytes(),
+        D3DBSPREADER.LUMP.ENTITIES.value : _entity_lump(rng, entities, ['bench_prop_' + str(i) for i in range(8)])
+    }
+
+    offset = struct.calcsize(D3DBSPREADER.fmt_D3DBSPHeader) + LUMP_COUNT * struct.calcsize(D3DBSPREADER.fmt_D3DBSPLump)
+    lumps = []
+    body = []
+    for i in range(LUMP_COUNT):
+        data = lump_data.get(i, b'')
+        lumps.append(struct.pack(D3DBSPREADER.fmt_D3DBSPLump, len(data), offset))
+        # lumps start at 4 byte boundaries
+        data += b'\x00' * (-len(data) % 4)
+        body.append(data)
+        offset += len(data)
+
+    with open(filepath, 'wb') as file:
+        file.write(struct.pack(D3DBSPREADER.fmt_D3DBSPHeader, D3DBSPREADER.D3DBSPENUMS.MAGIC.value.encode('utf-8'), D3DBSPREADER.D3DBSPENUMS.VERSION.value))
+        file.write(b''.join(lumps))
+        for data in body:
+            file.write(data)
+
+def write_iwi(filepath, width=1024, height=1024, texture_format=TEXTUREREADER.TextureFormat.DXT1, seed=0):
+    """
+    Write an .iwi file with random block compressed data and all three mip levels.
+
+    Parameters:
+    -----------
+    filepath        - string        - Path to the file
+    width           - int           - Width of the texture
+    height          - int           - Height of the texture
+    texture_format  - TextureFormat - DXT1, DXT3 or DXT5
+    seed            - int           - Seed of the random number generator
+    -----------
+    """
+    rng = np.random.default_rng(seed)
+    block_size = TEXTUREREADER.BLOCK_SIZES[texture_format.value]
+    header_size = struct.calcsize(TEXTUREREADER.fmt_TEXTHeader)
+
+    # the smallest mip level is stored first, the texture itself last
+    levels = []
+    for level in range(TEXTUREREADER.MAX_MIP_LEVEL + 1):
+        level_width = max(1, width >> level)
+        level_height = max(1, height >> level)
+        size = ((level_width + 3) // 4) * ((level_height + 3) // 4) * block_size
+        levels.append(rng.integers(0, 256, size, dtype=np.uint8).tobytes())
+
+    offsets = [0] * len(levels)
+    offset = header_size
+    for level in reversed(range(len(levels))):
+        offsets[level] = offset
+        offset += len(levels[level])
+
+    with open(filepath, 'wb') as file:
+        file.write(struct.pack(TEXTUREREADER.fmt_TEXTHeader,
+            TEXTUREREADER.TextureEnums.MAGIC.value.encode('utf-8'), TEXTUREREADER.TextureEnums.VERSION.value,
+            texture_format.value, TEXTUREREADER.TextureUsage.Color.value,
+            width, height, offset, offsets[0], offsets[1], offsets[2]))
+        for level in reversed(range(len(levels))):
+            file.write(levels[level])
+
+def write_xmodel(filepath, xmodelsurfname, materials):
+    """
+    Write an xmodel file with a single LOD.
+
+    Parameters:
+    -----------
+    filepath        - string    - Path to the file
+    xmodelsurfname  - string    - Name of the xmodelsurf of the LOD
+    materials       - list      - Material names of the LOD
+    -----------
+    """
+    data = [struct.pack('<H', XMODELREADER.XMODELENUMS.VERSION.value), b'\x00' * 25]
+    data.append(struct.pack('<f', 0.0) + xmodelsurfname.encode('utf-8') + b'\x00')
+    # the rest of the 4 LODs don't have a name
+    for i in range(3):
+        data.append(struct.pack('<f', 0.0) + b'\x00')
+    data.append(b'\x00' * 4 + struct.pack('<I', 0))
+    data.append(struct.pack('<H', len(materials)) + b''.join(name.encode('utf-8') + b'\x00' for name in materials))
+    with open(filepath, 'wb') as file:
+        file.write(b''.join(data))
+
+def _physiqued_vertices(rng, vertices, max_weights):
+    """
+    Create the vertex data of a physiqued mesh, every vertex is followed by its weights.
+
+    Parameters:
+    -----------
+    rng         - numpy Generator   - Random number generator
+    vertices    - int               - Number of vertices
+    max_weights - int               - Maximum number of weights of a vertex
+    -----------
+
+    Returns:
+    --------
+    Bytes - vertex data
+    --------
+    """
+    vertex_dtype = XMODELREADER.dtype_XMODELSURFPhysiqueVertex
+    weight_dtype = XMODELREADER.dtype_XMODELSURFWeight
+    records = np.zeros(vertices, dtype=vertex_dtype)
+    _fill_vertex_fields(rng, records, 64.0)
+    weight_counts = rng.integers(0, max_weights + 1, vertices)
+    records['weight_count'] = weight_counts
+    records['bone'] = rng.integers(0, 32, vertices)
+
+    # a padding byte follows the weights of a vertex if it has any
+    sizes = vertex_dtype.itemsize + weight_counts * weight_dtype.itemsize + (weight_counts > 0)
+    starts = np.zeros(vertices, dtype=np.int64)
+    np.cumsum(sizes[:-1], out=starts[1:])
+    data = np.zeros(int(sizes.sum()), dtype=np.uint8)
+    data[starts[:, None] + np.arange(vertex_dtype.itemsize)] = records.view(np.uint8).reshape(vertices, -1)
+
+    weights = np.zeros(int(weight_counts.sum()), dtype=weight_dtype)
+    weights['bone'] = rng.integers(0, 32, len(weights))
+    weights['pos_x'], weights['pos_y'], weights['pos_z'] = rng.uniform(-8, 8, (3, len(weights)))
+    weights['influence'] = rng.integers(0, 65536, len(weights))
+    local = np.arange(len(weights)) - np.repeat(np.cumsum(weight_counts) - weight_counts, weight_counts)
+    weight_starts = np.repeat(starts + vertex_dtype.itemsize, weight_counts) + local * weight_dtype.itemsize
+    data[weight_starts[:, None] + np.arange(weight_dtype.itemsize)] = weights.view(np.uint8).reshape(len(weights), -1)
+    return data.tobytes()
+
+def write_xmodelsurf(filepath, meshes=4, vertices=2000, triangles=3000, physiqued=False, max_weights=3, seed=0):
+    """
+    Write an xmodelsurf file with random meshes.
+
+    Parameters:
+    -----------
+    filepath    - string    - Path to the file
+    meshes      - int       - Number of meshes
+    vertices    - int       - Number of vertices of each mesh
+    triangles   - int       - Number of triangles of each mesh
+    physiqued   - boolean   - Whether the meshes are physiqued (variable size vertices with weights) or rigid
+    max_weights - int       - Maximum number of weights of a physiqued vertex
+    seed        - int       - Seed of the random number generator
+    -----------
+    """
+    rng = np.random.default_rng(seed)
+    data = [struct.pack(XMODELREADER.fmt_XMODELSURFHeader, XMODELREADER.XMODELENUMS.VERSION.value, meshes)]
+    for i in range(meshes):
+        if(physiqued):
+            data.append(struct.pack(XMODELREADER.fmt_XMODELSURFMeshHeader, vertices, triangles, XMODELREADER.XMODELENUMS.PHYSIQUED.value))
+            data.append(b'\x00' * 2) # padding
+            data.append(_physiqued_vertices(rng, vertices, max_weights))
+        else:
+            data.append(struct.pack(XMODELREADER.fmt_XMODELSURFMeshHeader, vertices, triangles, vertices))
+            records = np.zeros(vertices, dtype=XMODELREADER.dtype_XMODELSURFVertex)
+            _fill_vertex_fields(rng, records, 64.0)
+            data.append(records.tobytes())
+        data.append(rng.integers(0, vertices, triangles * 3).astype('<u2').tobytes())
+    with open(filepath, 'wb') as file:
+        file.write(b''.join(data))
+
+def write_material(filepath, name, maps, materialtype='world_phong'):
+    """
+    Write a material file.
+
+    Parameters:
+    -----------
+    filepath        - string        - Path to the file
+    name            - string        - Name of the material
+    maps            - dictionary    - Image name of each map type (colorMap, specularMap, ...)
+    materialtype    - string        - Type of the material
+    -----------
+    """
+    header_size = struct.calcsize(MATERIALREADER.fmt_MTLHeader)
+    block_size = struct.calcsize(MATERIALREADER.fmt_MTLMapInfoBlock)
+    colormap = maps.get('colorMap', '')
+
+    # the type, the name and the color map are read by their distance from each other
+    strings = [materialtype, name, colormap]
+    for maptype, mapname in maps.items():
+        strings += [maptype, mapname]
+    offsets = []
+    offset = header_size + len(maps) * block_size
+    for string in strings:
+        offsets.append(offset)
+        offset += len(string.encode('utf-8')) + 1
+
+    data = [struct.pack(MATERIALREADER.fmt_MTLHeader, offsets[1], offsets[2], len(maps), offsets[0], header_size)]
+    for i in range(len(maps)):
+        data.append(struct.pack(MATERIALREADER.fmt_MTLMapInfoBlock, offsets[3 + i * 2], offsets[4 + i * 2]))
+    data += [string.encode('utf-8') + b'\x00' for string in strings]
+    with open(filepath, 'wb') as file:
+        file.write(b''.join(data))
+
+def write_fixtures(directory, size):
+    """
+    Write all the fixtures of a size preset, files that already exist are kept.
+
+    Parameters:
+    -----------
+    directory   - string        - Output directory
+    size        - dictionary    - Size preset, see SIZES in benchmarks.run
+    -----------
+
+    Returns:
+    --------
+    Dictionary - path of each fixture
+    --------
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {
+        'd3dbsp': os.path.join(directory, 'bench.d3dbsp'),
+        'dxt1': os.path.join(directory, 'bench_dxt1.iwi'),
+        'dxt5': os.path.join(directory, 'bench_dxt5.iwi'),
+        'xmodel': os.path.join(directory, 'bench_xmodel'),
+        'xmodelsurf': os.path.join(directory, 'bench_xmodelsurf'),
+        'xmodel_physiqued': os.path.join(directory, 'bench_xmodel_physiqued'),
+        'xmodelsurf_physiqued': os.path.join(directory, 'bench_xmodelsurf_physiqued'),
+        'material': os.path.join(directory, 'bench_material')
+    }
+    if(all(os.path.isfile(path) for path in paths.values())):
+        return paths
+
+    write_d3dbsp(paths['d3dbsp'], size['trianglesoups'], size['soup_vertices'], size['soup_triangles'], size['materials'], size['entities'])
+    write_iwi(paths['dxt1'], size['texture'], size['texture'], TEXTUREREADER.TextureFormat.DXT1)
+    write_iwi(paths['dxt5'], size['texture'], size['texture'], TEXTUREREADER.TextureFormat.DXT5, seed=1)
+    # every mesh of the xmodelsurf has its own material
+    materials = ['bench/material_' + str(i) for i in range(size['meshes'])]
+    write_xmodel(paths['xmodel'], os.path.basename(paths['xmodelsurf']), materials)
+    write_xmodelsurf(paths['xmodelsurf'], size['meshes'], size['mesh_vertices'], size['mesh_triangles'])
+    write_xmodel(paths['xmodel_physiqued'], os.path.basename(paths['xmodelsurf_physiqued']), materials)
+    write_xmodelsurf(paths['xmodelsurf_physiqued'], size['meshes'], size['mesh_vertices'], size['mesh_triangles'], physiqued=True, seed=1)
+    write_material(paths['material'], 'bench_material', {'colorMap': 'bench_color', 'specularMap': 'bench_spec', 'normalMap': 'bench_normal', 'detailMap': 'bench_detail'})
+    return paths
@@ -0,0 +1,265 @@
+import io
+import os
+import gc
+import sys
+import time
+import platform
+import contextlib
+
+import numpy as np
+
+from pyd3dbsp import read_d3dbsp as D3DBSPREADER
+from pyd3dbsp import read_xmodel as XMODELREADER
+from pyd3dbsp import read_material as MATERIALREADER
+from pyd3dbsp import read_texture as TEXTUREREADER
+from pyd3dbsp import texture_decoder as DECODER
+from pyd3dbsp import binary_cursor as CURSOR
+from pyd3dbsp import entities as ENTITIES
+from pyd3dbsp import surface as SURFACE
+
+from . import fixtures as FIXTURES
+
+RESULTS_VERSION = 1 # version of the results file format
+MIN_RUN_TIME = 0.05 # short stages are repeated within a run until it takes at least this many seconds
+
+"""
+STAGES tuple that defines the names of the benchmarked stages in the order they run.
+"""
+STAGES = (
+    'd3dbsp_lumps',
+    'surface_build',
+    'entity_parse',
+    'dxt1_decode',
+    'dxt5_decode',
+    'iwi_load',
+    'xmodel_parse',
+    'xmodel_parse_physiqued',
+    'material_parse'
+)
+
+"""
+SIZES dictionary that defines the fixture sizes of each preset.
+"""
+SIZES = {
+    'small': {
+        'trianglesoups': 2000, 'soup_vertices': 24, 'soup_triangles': 16, 'materials': 64, 'entities': 500,
+        'texture': 256,
+        'meshes': 2, 'mesh_vertices': 1000, 'mesh_triangles': 1500
+    },
+    'medium': {
+        'trianglesoups': 20000, 'soup_vertices': 32, 'soup_triangles': 24, 'materials': 256, 'entities': 5000,
+        'texture': 1024,
+        'meshes': 4, 'mesh_vertices': 5000, 'mesh_triangles': 8000
+    },
+    'large': {
+        'trianglesoups': 60000, 'soup_vertices': 48, 'soup_triangles': 32, 'materials': 512, 'entities': 20000,
+        'texture': 2048,
+        'meshes': 8, 'mesh_vertices': 20000, 'mesh_triangles': 30000
+    }
+}
+
+def _read_lumps(path):
+    d3dbsp = D3DBSPREADER.D3DBSP()
+    d3dbsp.open_d3dbsp(path)
+    d3dbsp._set_columns(
+        d3dbsp.get_lump(D3DBSPREADER.LUMP.MATERIALS),
+        d3dbsp.get_lump(D3DBSPREADER.LUMP.TRIANGLESOUPS),
+        d3dbsp.get_lump(D3DBSPREADER.LUMP.VERTICES),
+        d3dbsp.get_lump(D3DBSPREADER.LUMP.TRIANGLES)
+    )
+    return d3dbsp
+
+def _raw_texture(path):
+    texture = TEXTUREREADER.Texture()
+    with CURSOR.BinaryCursor.open(path) as cursor:
+        texture._read_header(cursor)
+        cursor.seek(texture.header.texture_ofs)
+        return cursor.read_bytes(texture.header.filesize - texture.header.texture_ofs), texture.width, texture.height
+
+def _load_xmodel(path, read_weights=False):
+    xmodel = XMODELREADER.XModel()
+    if(not xmodel.load_xmodel(path, os.path.dirname(path) + os.sep, read_weights=read_weights)):
+        raise ValueError("Could not load " + path)
+    return xmodel
+
+def _load_material(path):
+    material = MATERIALREADER.MTL()
+    material.load_material(path)
+    return material
+
+def _stages(paths):
+    """
+    Create the benchmarked stages. Inputs of a stage are prepared once, so only the stage itself is timed.
+
+    Parameters:
+    -----------
+    paths - dictionary - Path of each fixture, see fixtures.write_fixtures
+    -----------
+
+    Returns:
+    --------
+    Dictionary - (function, number of processed items, item name) of each stage
+    --------
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        d3dbsp = _read_lumps(paths['d3dbsp'])
+        columns = (d3dbsp.materials, d3dbsp.trianglesoups, d3dbsp.positions, d3dbsp.normals, d3dbsp.colors, d3dbsp.uvs, d3dbsp.indices)
+        entity_data = bytes(d3dbsp.lumpdir[D3DBSPREADER.LUMP.ENTITIES])
+        vertex_count = len(d3dbsp.positions)
+        soup_count = len(d3dbsp.trianglesoups)
+        entity_count = len(ENTITIES.parse_entities(entity_data))
+        d3dbsp.close()
+
+    dxt1 = _raw_texture(paths['dxt1'])
+    dxt5 = _raw_texture(paths['dxt5'])
+
+    def read_lumps():
+        _read_lumps(paths['d3dbsp']).close()
+
+    return {
+        'd3dbsp_lumps': (read_lumps, vertex_count, 'vertices'),
+        'surface_build': (lambda: SURFACE.from_trianglesoups(*columns), soup_count, 'trianglesoups'),
+        'entity_parse': (lambda: ENTITIES.parse_entities(entity_data), entity_count, 'entities'),
+        'dxt1_decode': (lambda: DECODER.decode_dxt1(*dxt1), dxt1[1] * dxt1[2], 'pixels'),
+        'dxt5_decode': (lambda: DECODER.decode_dxt5(*dxt5), dxt5[1] * dxt5[2], 'pixels'),
+        'iwi_load': (lambda: TEXTUREREADER.Texture().load_texture(paths['dxt1']), dxt1[1] * dxt1[2], 'pixels'),
+        'xmodel_parse': (lambda: _load_xmodel(paths['xmodel']), 1, 'xmodels'),
+        'xmodel_parse_physiqued': (lambda: _load_xmodel(paths['xmodel_physiqued'], True), 1, 'xmodels'),
+        'material_parse': (lambda: _load_material(paths['material']), 1, 'materials')
+    }
+
+def _time(function, repeat):
+    """
+    Time a function, after a warm up run. Functions faster than MIN_RUN_TIME are called
+    several times in each run and the average is taken, so short stages are not dominated by timer noise.
+
+    Parameters:
+    -----------
+    function    - function  - Function to time
+    repeat      - int       - Number of timed runs
+    -----------
+
+    Returns:
+    --------
+    List - duration of a single call in each run in seconds
+    --------
+    """
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        function()
+        loops = max(1, int(MIN_RUN_TIME / max(time.perf_counter() - start, 1e-6)))
+        # the garbage collector would add noise to the short stages
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for i in range(repeat):
+                start = time.perf_counter()
+                for j in range(loops):
+                    function()
+                times.append((time.perf_counter() - start) / loops)
+        finally:
+            if(enabled):
+                gc.enable()
+    return times
+
+def run_benchmarks(fixturedir, size='small', repeat=5, stages=None):
+    """
+    Write the fixtures of a size preset and time every stage.
+
+    Parameters:
+    -----------
+    fixturedir  - string    - Directory of the fixtures, existing fixtures are reused
+    size        - string    - Size preset, see SIZES
+    repeat      - int       - Number of timed runs of each stage
+    stages      - list/None - Names of the stages to run, all if not set
+    -----------
+
+    Returns:
+    --------
+    Dictionary - results with the environment and the min/median/mean seconds of each stage
+    --------
+    """
+    paths = FIXTURES.write_fixtures(os.path.join(fixturedir, size), SIZES[size])
+    results = {
+        'version': RESULTS_VERSION,
+        'size': size,
+        'repeat': repeat,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'stages': {}
+    }
+    for name, (function, items, unit) in _stages(paths).items():
+        if(stages and name not in stages):
+            continue
+        times = _time(function, repeat)
+        results['stages'][name] = {
+            'min': min(times),
+            'median': float(np.median(times)),
+            'mean': float(np.mean(times)),
+            'items': items,
+            'unit': unit
+        }
+    return results
+
+def compare(results, baseline, threshold=0.25, statistic='min'):
+    """
+    Compare results against a baseline.
+
+    Parameters:
+    -----------
+    results     - dictionary    - Current results, see run_benchmarks
+    baseline    - dictionary    - Stored results
+    threshold   - float         - Allowed slowdown, 0.25 means a stage may be 25% slower than the baseline
+    statistic   - string        - 'min', 'median' or 'mean'
+    -----------
+
+    Returns:
+    --------
+    List - (stage, baseline seconds, current seconds, ratio, status) of each stage,
+           status is 'regression', 'improvement', 'ok' or 'new'
+    --------
+    """
+    if(baseline.get('version') != results['version'] or baseline.get('size') != results['size']):
+        raise ValueError("The baseline was recorded with a different results version or size preset.")
+
+    rows = []
+    for name, stage in results['stages'].items():
+        current = stage[statistic]
+        if(name not in baseline['stages']):
+            rows.append((name, None, current, None, 'new'))
+            continue
+        previous = baseline['stages'][name][statistic]
+        ratio = current / previous if previous > 0 else float('inf')
+        if(ratio > 1 + threshold):
+            status = 'regression'
+        elif(ratio < 1 / (1 + threshold)):
+            status = 'improvement'
+        else:
+            status = 'ok'
+        rows.append((name, previous, current, ratio, status))
+    return rows
+
+def print_results(results, rows=None, file=sys.stdout):
+    """
+    Print the results and the comparison in a table.
+
+    Parameters:
+    -----------
+    results - dictionary    - Results, see run_benchmarks
+    rows    - list/None     - Comparison, see compare
+    file    - file object   - Output
+    -----------
+    """
+    comparison = {row[0]: row for row in rows or []}
+    print("size=" + results['size'] + " repeat=" + str(results['repeat']) + " python=" + results['python'] + " numpy=" + results['numpy'], file=file)
+    for name, stage in results['stages'].items():
+        line = '%-24s %10.3f ms %12.0f %s/s' % (name, stage['min'] * 1000, stage['items'] / stage['min'] if stage['min'] > 0 else 0, stage['unit'])
+        if(name in comparison):
+            name, previous, current, ratio, status = comparison[name]
+            if(ratio is not None):
+                line += '   %6.2fx baseline  %s' % (ratio, status)
+            else:
+                line += '   ' + status
+        print(line, file=file)
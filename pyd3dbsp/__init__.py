@@ -1,6 +1,11 @@
-import bpy
+try:
+    import bpy
+except ImportError:
+    # the readers and decoders are also imported by worker processes outside of Blender
+    bpy = None
 
-from . import pyd3dbsp
+if(bpy is not None):
+    from . import pyd3dbsp
 
 bl_info = {
     "name": "CoD2D3DBSP Importer",
@@ -16,7 +21,7 @@ bl_info = {
 
 classes = (
     pyd3dbsp.PyD3DBSP,
-)
+) if bpy is not None else ()
 
 def menu_func_import_d3dbsp(self, context):
     self.layout.operator(pyd3dbsp.PyD3DBSP.bl_idname, text = "CoD2 D3DBSP map (.d3dbsp)")
@@ -0,0 +1,63 @@
+import sys
+import argparse
+
+from . import convert as CONVERT
+from . import cache as CACHE
+
+def main(argv=None):
+    """
+    Convert .d3dbsp maps and the assets they use without Blender.
+
+    Parameters:
+    -----------
+    argv - list - Command line arguments (sys.argv[1:] if not set)
+    -----------
+
+    Returns:
+    --------
+    Int - exit code, 1 if any of the maps failed
+    --------
+    """
+    parser = argparse.ArgumentParser(prog='python -m pyd3dbsp', description='Convert Call of Duty 2 .d3dbsp maps into .obj or .glb files.')
+    parser.add_argument('maps', nargs='+', help='.d3dbsp files or directories containing them')
+    parser.add_argument('-a', '--assets', required=True, help='assets folder (containing xmodel, xmodelsurfs, materials and images)')
+    parser.add_argument('-o', '--output', required=True, help='output directory')
+    parser.add_argument('-j', '--workers', type=int, default=0, help='number of worker processes (0 = one less than the number of CPUs)')
+    parser.add_argument('-f', '--format', choices=('obj', 'glb'), default='obj', help='output format, .glb files contain the map geometry and the placed props')
+    parser.add_argument('--interleaved', action='store_true', help='store the vertex attributes of .glb files interleaved')
+    parser.add_argument('--batch-mode', choices=('material', 'single', 'soup'), default='material', help='how the map geometry is split into objects')
+    parser.add_argument('--no-props', action='store_true', help='do not convert props')
+    parser.add_argument('--no-textures', action='store_true', help='do not convert textures')
+    parser.add_argument('--no-cache', action='store_true', help='do not use the texture and xmodel caches')
+    parser.add_argument('--cache-dir', default=CACHE.DEFAULT_CACHE_DIR, help='directory of the texture and xmodel caches')
+    parser.add_argument('--cache-size', type=int, default=1024, help='size cap of each cache in MB')
+    args = parser.parse_args(argv)
+
+    maps = CONVERT.find_maps(args.maps)
+    if(not len(maps)):
+        print("No .d3dbsp files found.")
+        return 1
+
+    options = {
+        'import_props': not args.no_props,
+        'convert_textures': not args.no_textures,
+        'batch_mode': args.batch_mode,
+        'cache_settings': None if args.no_cache else (args.cache_dir, args.cache_size * 1024 * 1024),
+        'output_format': args.format,
+        'interleaved': args.interleaved
+    }
+
+    failed = 0
+    for result in CONVERT.convert_maps(maps, args.assets, args.output, args.workers, **options):
+        timings = ' '.join(name + '=' + format(seconds, '.3f') + 's' for name, seconds in result['timings'].items())
+        if(result['ok']):
+            print(result['map'] + ": " + str(result['surfaces']) + " surfaces, " + str(result['triangles']) + " triangles, " + str(result['props']) + " props (" + timings + ")")
+        else:
+            failed += 1
+            print(result['map'] + ": failed, " + result.get('error', '') + " (" + timings + ")")
+
+    print("Converted " + str(len(maps) - failed) + "/" + str(len(maps)) + " maps.")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,293 @@
+import os
+import mmap
+import struct
+
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+@lru_cache(maxsize=None)
+def _struct(fmt):
+    """
+    Return the compiled struct of a format, so the format string is only parsed once
+    """
+    return struct.Struct(fmt)
+
+class BinaryCursor:
+    """
+    BinaryCursor class for reading binary data from a buffer (bytes or a memory-mapped file).
+    Reads return views of the buffer where possible, so the data is not copied.
+    """
+
+    def __init__(self, data, offset=0):
+        """
+        Class constructor to initialize the class properties.
+
+        Properties:
+        -----------
+        data        - bytes/mmap    - Buffer to read from
+        offset      - int           - Current position in the buffer
+        bytes_read  - int           - Number of bytes consumed by the reads
+        -----------
+        """
+        # null-terminated strings are found with find, which memoryviews don't have, and copying them would not be zero-copy
+        if(not hasattr(data, 'find')):
+            raise TypeError("BinaryCursor needs a bytes or mmap buffer, not " + type(data).__name__ + ".")
+        self.data = data
+        self.offset = offset
+        self.bytes_read = 0
+        self._view = memoryview(data)
+        self._mmap = None
+
+    @classmethod
+    def open(cls, filepath):
+        """
+        Memory-map a file and return a cursor over it. The cursor has to be closed (or used as
+        a context manager) to release the file.
+
+        Parameters:
+        -----------
+        filepath - string - Path to the file
+        -----------
+
+        Returns:
+        --------
+        BinaryCursor - cursor at the start of the file
+        --------
+        """
+        with open(filepath, 'rb') as file:
+            # empty files can't be memory-mapped
+            if(os.fstat(file.fileno()).st_size == 0):
+                return cls(b'')
+            mapped_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        cursor = cls(mapped_file)
+        cursor._mmap = mapped_file
+        return cursor
+
+    def close(self):
+        """
+        Release the buffer. A memory-mapped file stays open until the arrays that still refer to it
+        are garbage collected.
+        """
+        if(self._view is None):
+            return
+        try:
+            self._view.release()
+            if(self._mmap is not None):
+                self._mmap.close()
+        except BufferError:
+            pass
+        self._view = None
+        self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._view)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """
+        Set the current position.
+
+        Parameters:
+        -----------
+        offset - int - Offset
+        whence - int - os.SEEK_SET, os.SEEK_CUR or os.SEEK_END
+        -----------
+
+        Returns:
+        --------
+        Int - new position
+        --------
+        """
+        if(whence == os.SEEK_CUR):
+            offset += self.offset
+        elif(whence == os.SEEK_END):
+            offset += len(self._view)
+        self.offset = offset
+        return self.offset
+
+    def tell(self):
+        return self.offset
+
+    def skip(self, size):
+        """
+        Move the current position forward.
+
+        Parameters:
+        -----------
+        size - int - Number of bytes to skip
+        -----------
+        """
+        self.offset += size
+
+    def _advance(self, size):
+        """
+        Move the current position forward and return the previous one.
+        Raises a ValueError if the data is shorter than size.
+        """
+        offset = self.offset
+        if(size < 0 or offset + size > len(self._view)):
+            raise ValueError("Unexpected end of data at offset " + str(offset) + ".")
+        self.offset = offset + size
+        self.bytes_read += size
+        return offset
+
+    def read(self, size):
+        """
+        Read bytes without copying them.
+
+        Parameters:
+        -----------
+        size - int - Number of bytes to read
+        -----------
+
+        Returns:
+        --------
+        memoryview - read only view of the bytes
+        --------
+        """
+        offset = self._advance(size)
+        return self._view[offset:offset + size]
+
+    def read_bytes(self, size):
+        """
+        Read bytes into a bytes object.
+
+        Parameters:
+        -----------
+        size - int - Number of bytes to read
+        -----------
+
+        Returns:
+        --------
+        Bytes - the bytes read
+        --------
+        """
+        offset = self._advance(size)
+        return self.data[offset:offset + size]
+
+    def unpack(self, fmt):
+        """
+        Read the values of a struct format.
+
+        Parameters:
+        -----------
+        fmt - string - struct format string
+        -----------
+
+        Returns:
+        --------
+        Tuple - unpacked values
+        --------
+        """
+        compiled = _struct(fmt)
+        return compiled.unpack_from(self._view, self._advance(compiled.size))
+
+    def read_struct(self, record, fmt):
+        """
+        Read a record into a namedtuple.
+
+        Parameters:
+        -----------
+        record  - namedtuple type   - Type of the record
+        fmt     - string            - struct format string of the record
+        -----------
+
+        Returns:
+        --------
+        Namedtuple - the record
+        --------
+        """
+        return record._make(self.unpack(fmt))
+
+    def read_records(self, record, fmt, count):
+        """
+        Read consecutive records into namedtuples.
+
+        Parameters:
+        -----------
+        record  - namedtuple type   - Type of the records
+        fmt     - string            - struct format string of a record
+        count   - int               - Number of records
+        -----------
+
+        Returns:
+        --------
+        List - list of namedtuples
+        --------
+        """
+        compiled = _struct(fmt)
+        data = self.read(compiled.size * count)
+        return [record._make(values) for values in compiled.iter_unpack(data)]
+
+    def read_array(self, dtype, count):
+        """
+        Read consecutive values/records into a numpy array without copying them.
+
+        Parameters:
+        -----------
+        dtype - numpy dtype - Type of the values/records
+        count - int         - Number of values/records
+        -----------
+
+        Returns:
+        --------
+        numpy array - read only array viewing the buffer
+        --------
+        """
+        dtype = np.dtype(dtype)
+        offset = self._advance(dtype.itemsize * count)
+        return np.frombuffer(self._view, dtype=dtype, count=count, offset=offset)
+
+    def read_nullstr(self, encoding='utf-8'):
+        """
+        Read a null terminated string
+
+        Parameters:
+        -----------
+        encoding - string - Encoding of the string
+        -----------
+
+        Returns:
+        --------
+        String - the string without the terminating null byte
+        --------
+        """
+        end = self.data.find(b'\x00', self.offset)
+        # an unterminated string ends at the end of the data
+        if(end < 0):
+            end = len(self._view)
+        string = self.data[self.offset:end].decode(encoding)
+        self.bytes_read += min(end + 1, len(self._view)) - self.offset
+        self.offset = min(end + 1, len(self._view))
+        return string
+
+    def nullstr_at(self, offset, encoding='utf-8'):
+        """
+        Read a null terminated string at an offset, without moving the current position
+
+        Parameters:
+        -----------
+        offset      - int       - Offset of the string
+        encoding    - string    - Encoding of the string
+        -----------
+
+        Returns:
+        --------
+        String - the string without the terminating null byte
+        --------
+        """
+        current = self.offset
+        self.offset = offset
+        try:
+            return self.read_nullstr(encoding)
+        finally:
+            self.offset = current
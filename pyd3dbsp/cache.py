@@ -0,0 +1,277 @@
+import os
+import json
+import mmap
+import struct
+import hashlib
+import tempfile
+
+import numpy as np
+
+"""
+CacheHeader format. Every cache entry starts with a magic, the format version and the length
+of the JSON header that describes the metadata and the arrays stored in the entry.
+"""
+fmt_CacheHeader = '<4sII'
+CACHE_MAGIC = b'PYDC'
+CACHE_VERSION = 1
+CACHE_ALIGNMENT = 16 # arrays are aligned, so they can be viewed directly from the memory map
+CACHE_EVICT_RATIO = 0.9 # a full cache is evicted down to this part of the size cap, so it isn't scanned on every store
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'pyd3dbsp_cache')
+
+def file_identity(filepath):
+    """
+    Return the identity of a file, it changes whenever the file is modified
+
+    Parameters:
+    -----------
+    filepath - string - Path to the file
+    -----------
+
+    Returns:
+    --------
+    List - absolute path, size and modification time of the file
+    --------
+    """
+    stat = os.stat(filepath)
+    return [os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns]
+
+def _align(offset):
+    return (offset + CACHE_ALIGNMENT - 1) // CACHE_ALIGNMENT * CACHE_ALIGNMENT
+
+class DiskCache:
+    """
+    DiskCache class for storing decoded assets on disk in a memory-mappable binary format.
+    The total size of the entries is capped, the least recently used entries are evicted first.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_size=1024 * 1024 * 1024, extension='.bin'):
+        """
+        Class constructor to initialize the class properties.
+
+        Properties:
+        -----------
+        directory   - string    - Directory of the cache entries
+        max_size    - int       - Size cap of all the entries in bytes
+        extension   - string    - File extension of the cache entries
+        hits        - int       - Number of successful lookups
+        misses      - int       - Number of failed lookups
+        stores      - int       - Number of stored entries
+        evictions   - int       - Number of evicted entries
+        -----------
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.extension = extension
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._size = None # running total of the entry sizes, the directory is scanned on the first store
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, filepath, *extra):
+        """
+        Create a cache key from the identity of a source file. The key changes whenever
+        the file is modified, so stale entries are never returned.
+
+        Parameters:
+        -----------
+        filepath    - string    - Path to the source file
+        extra       - mixed     - Additional values that affect the cached result
+        -----------
+
+        Returns:
+        --------
+        String - cache key
+        --------
+        """
+        identity = file_identity(filepath) + list(extra)
+        return hashlib.sha1(repr(identity).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.extension)
+
+    def _entries(self):
+        """
+        Return the entries of the cache
+
+        Returns:
+        --------
+        List - list of (last use, size, path) tuples
+        --------
+        """
+        entries = []
+        for filename in os.listdir(self.directory):
+            if(filename.endswith(self.extension)):
+                path = os.path.join(self.directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+        return entries
+
+    def get(self, key):
+        """
+        Look up an entry.
+
+        Parameters:
+        -----------
+        key - string - Cache key
+        -----------
+
+        Returns:
+        --------
+        Tuple/None - metadata dictionary and dictionary of read only arrays mapped from the entry, None on miss
+        --------
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                mapped_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        try:
+            magic, version, header_length = struct.unpack_from(fmt_CacheHeader, mapped_file)
+            if(magic != CACHE_MAGIC or version != CACHE_VERSION):
+                raise ValueError("Invalid cache entry.")
+            header_start = struct.calcsize(fmt_CacheHeader)
+            header = json.loads(bytes(mapped_file[header_start:header_start + header_length]).decode('utf-8'))
+
+            arrays = {}
+            for name, (dtype, shape, offset) in header['arrays'].items():
+                dtype = np.dtype(dtype)
+                count = int(np.prod(shape, dtype=np.int64))
+                arrays[name] = np.frombuffer(mapped_file, dtype=dtype, count=count, offset=offset).reshape(shape)
+        except (ValueError, KeyError, TypeError, struct.error):
+            # close the map of a broken entry, so it can be replaced or evicted
+            arrays = None
+            try:
+                mapped_file.close()
+            except BufferError:
+                pass
+            self.misses += 1
+            return None
+
+        # mark the entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return header['meta'], arrays
+
+    def put(self, key, meta, arrays):
+        """
+        Store an entry and evict the least recently used entries if the cache grows over the size cap.
+        The size of the cache is kept as a running total, the directory is only scanned when the total
+        goes over the size cap.
+
+        Parameters:
+        -----------
+        key     - string        - Cache key
+        meta    - dictionary    - JSON serializable metadata
+        arrays  - dictionary    - Arrays (or bytes-like objects) to store
+        -----------
+        """
+        arrays = {name: np.ascontiguousarray(np.frombuffer(array, dtype=np.uint8) if not isinstance(array, np.ndarray) else array) for name, array in arrays.items()}
+
+        # the offsets depend on the length of the header, so the header is laid out until it doesn't grow
+        header_start = struct.calcsize(fmt_CacheHeader)
+        header_length = 0
+        while(True):
+            offset = _align(header_start + header_length)
+            descriptors = {}
+            for name, array in arrays.items():
+                descriptors[name] = (array.dtype.str, list(array.shape), offset)
+                offset = _align(offset + array.nbytes)
+            header = json.dumps({'meta': meta, 'arrays': descriptors}).encode('utf-8')
+            if(len(header) <= header_length):
+                break
+            header_length = len(header)
+        header = header.ljust(header_length)
+
+        path = self._path(key)
+        temp_path = path + '.tmp' + str(os.getpid())
+        if(self._size is None):
+            self._size = self.size()
+        try:
+            # an entry of the same key is replaced
+            replaced = os.path.getsize(path) if os.path.exists(path) else 0
+            with open(temp_path, 'wb') as file:
+                file.write(struct.pack(fmt_CacheHeader, CACHE_MAGIC, CACHE_VERSION, header_length))
+                file.write(header)
+                for name, array in arrays.items():
+                    file.seek(descriptors[name][2])
+                    file.write(memoryview(array.reshape(-1).view(np.uint8)))
+                stored = _align(file.tell())
+                file.truncate(stored)
+            os.replace(temp_path, path)
+        except OSError:
+            if(os.path.exists(temp_path)):
+                os.remove(temp_path)
+            return
+        self.stores += 1
+        self._size += stored - replaced
+        if(self._size > self.max_size):
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries if the cache is over the size cap, until it fits into
+        CACHE_EVICT_RATIO of the size cap. The running total is corrected from the directory,
+        other processes might have stored entries too.
+        """
+        entries = sorted(self._entries())
+        total = sum(entry[1] for entry in entries)
+        target = self.max_size * CACHE_EVICT_RATIO if total > self.max_size else self.max_size
+        for mtime, size, path in entries:
+            if(total <= target):
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # entries that are still mapped can't be removed on every platform
+                continue
+            total -= size
+            self.evictions += 1
+        self._size = total
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        for mtime, size, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._size = None
+
+    def size(self):
+        """
+        Return the total size of the entries in bytes.
+        """
+        return sum(entry[1] for entry in self._entries())
+
+    def stats(self):
+        """
+        Return the cache counters.
+
+        Returns:
+        --------
+        Dictionary - hits, misses, stores, evictions, size and entry count
+        --------
+        """
+        entries = self._entries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'evictions': self.evictions,
+            'size': sum(entry[1] for entry in entries),
+            'entries': len(entries)
+        }
@@ -0,0 +1,381 @@
+import os
+import json
+import time
+import zlib
+import struct
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from . import helper as HELPER
+from . import read_d3dbsp as D3DBSPREADER
+from . import read_xmodel as XMODELREADER
+from . import read_material as MATERIALREADER
+from . import read_texture as TEXTUREREADER
+from . import surface as SURFACE
+from . import cache as CACHE
+from . import gltf as GLTF
+
+"""
+MTL_MAPS dictionary that defines which .mtl statement each map type of a material is written as.
+"""
+MTL_MAPS = {
+    'colorMap' : 'map_Kd',
+    'specularMap' : 'map_Ks',
+    'normalMap' : 'norm'
+}
+
+def _write_rows(file, fmt, rows):
+    """
+    Write the rows of an array with a single format operation.
+
+    Parameters:
+    -----------
+    file    - file object   - File to write to
+    fmt     - string        - Format of a single row (with a trailing newline)
+    rows    - numpy array   - (N, K) values
+    -----------
+    """
+    if(len(rows)):
+        file.write((fmt * len(rows)) % tuple(rows.reshape(-1).tolist()))
+
+def write_obj(filepath, surfaces, mtllib=None):
+    """
+    Write surfaces into a Wavefront .obj file. Every surface becomes an object, faces are grouped by material.
+
+    Parameters:
+    -----------
+    filepath    - string    - Path to the .obj file
+    surfaces    - list      - list of (name, SurfaceData)
+    mtllib      - string    - Name of the .mtl file the materials are written to
+    -----------
+
+    Returns:
+    --------
+    Int - number of written triangles
+    --------
+    """
+    triangle_count = 0
+    vertex_base = 1
+    # write into a temporary file first, other processes might convert the same prop
+    temp_path = filepath + '.tmp' + str(os.getpid())
+    with open(temp_path, 'w') as file:
+        if(mtllib):
+            file.write('mtllib ' + mtllib + '\n')
+        for name, surface in surfaces:
+            file.write('o ' + name + '\n')
+            _write_rows(file, 'v %.6f %.6f %.6f\n', surface.positions)
+            # the v coordinate is flipped, same as in Blender
+            uvs = np.stack((surface.uvs[:, 0], 1 - surface.uvs[:, 1]), axis=-1)
+            _write_rows(file, 'vt %.6f %.6f\n', uvs)
+            _write_rows(file, 'vn %.6f %.6f %.6f\n', surface.normals)
+
+            materials = surface.material if surface.material_indices is not None else [surface.material]
+            material_indices = surface.material_indices if surface.material_indices is not None else np.zeros(len(surface.triangles), dtype=np.int32)
+            for i, material in enumerate(materials):
+                triangles = surface.triangles[material_indices == i].astype(np.int64) + vertex_base
+                if(not len(triangles)):
+                    continue
+                if(material):
+                    file.write('usemtl ' + material + '\n')
+                # the same index is used for the position, uv and normal
+                _write_rows(file, 'f %d/%d/%d %d/%d/%d %d/%d/%d\n', np.repeat(triangles, 3, axis=1))
+                triangle_count += len(triangles)
+            vertex_base += len(surface.positions)
+    os.replace(temp_path, filepath)
+    return triangle_count
+
+def write_png(filepath, width, height, texture_data):
+    """
+    Write RGBA pixels into a .png file.
+
+    Parameters:
+    -----------
+    filepath        - string        - Path to the .png file
+    width           - int           - Width of the image
+    height          - int           - Height of the image
+    texture_data    - bytes         - RGBA pixels, first row is the top one
+    -----------
+    """
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    # every row starts with the filter type (0 = none)
+    rows = np.frombuffer(texture_data, dtype=np.uint8, count=width * height * 4).reshape(height, width * 4)
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = rows
+
+    # write into a temporary file first, other processes might convert the same texture
+    temp_path = filepath + '.tmp' + str(os.getpid())
+    with open(temp_path, 'wb') as file:
+        file.write(b'\x89PNG\r\n\x1a\n')
+        file.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)))
+        file.write(chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)))
+        file.write(chunk(b'IEND', b''))
+    os.replace(temp_path, filepath)
+
+def _texture_file(name, texturepath, outputdir, texture_cache=None, allow_dds=True):
+    """
+    Convert a texture into a .png file once. Textures that have a .dds file are not converted if allow_dds is set.
+
+    Parameters:
+    -----------
+    name            - string    - Name of the image
+    texturepath     - string    - Path to the textures/images
+    outputdir       - string    - Output directory
+    texture_cache   - DiskCache - Cache of decoded textures
+    allow_dds       - boolean   - Whether to use the .dds files or not
+    -----------
+
+    Returns:
+    --------
+    String/None - path to the image file, None if it couldn't be converted
+    --------
+    """
+    dds_path = texturepath + name + '.dds'
+    if(allow_dds and os.path.isfile(dds_path)):
+        return dds_path
+
+    png_path = os.path.join(outputdir, 'textures', name + '.png')
+    if(os.path.isfile(png_path)):
+        return png_path
+
+    texture = TEXTUREREADER.Texture()
+    try:
+        if(not texture.load_texture(texturepath + name + '.iwi', cache=texture_cache)):
+            return None
+    except:
+        return None
+    os.makedirs(os.path.dirname(png_path), exist_ok=True)
+    write_png(png_path, texture.width, texture.height, texture.texture_data)
+    return png_path
+
+def _material_images(name, materialpath, texturepath, outputdir, texture_cache=None, convert_textures=True, allow_dds=True):
+    """
+    Convert the textures of a material.
+
+    Parameters:
+    -----------
+    name                - string    - Name of the material
+    materialpath        - string    - Path to materials
+    texturepath         - string    - Path to textures/images
+    outputdir           - string    - Output directory, textures are converted into its textures folder
+    texture_cache       - DiskCache - Cache of decoded textures
+    convert_textures    - boolean   - Whether to convert the textures or not
+    allow_dds           - boolean   - Whether to use the .dds files or not
+    -----------
+
+    Returns:
+    --------
+    Dictionary/None - path to the image file of each map type in MTL_MAPS, None if the material couldn't be loaded
+    --------
+    """
+    material_file = MATERIALREADER.MTL()
+    try:
+        material_file.load_material(materialpath + name)
+    except:
+        return None
+
+    images = {}
+    for maptype, mapname in material_file.mapinfo.items():
+        if(maptype not in MTL_MAPS or not convert_textures):
+            continue
+        image = _texture_file(mapname, texturepath, outputdir, texture_cache, allow_dds)
+        if(image):
+            images[maptype] = image
+    return images
+
+def write_mtl(filepath, materials, materialpath, texturepath, outputdir, texture_cache=None, convert_textures=True):
+    """
+    Write materials into a Wavefront .mtl file and convert their textures.
+
+    Parameters:
+    -----------
+    filepath            - string    - Path to the .mtl file
+    materials           - list      - List of material names
+    materialpath        - string    - Path to materials
+    texturepath         - string    - Path to textures/images
+    outputdir           - string    - Output directory, textures are converted into its textures folder
+    texture_cache       - DiskCache - Cache of decoded textures
+    convert_textures    - boolean   - Whether to convert the textures or not
+    -----------
+    """
+    directory = os.path.dirname(os.path.abspath(filepath))
+    temp_path = filepath + '.tmp' + str(os.getpid())
+    with open(temp_path, 'w') as file:
+        for name in materials:
+            file.write('newmtl ' + name + '\n')
+            images = _material_images(name, materialpath, texturepath, outputdir, texture_cache, convert_textures)
+            for maptype, image in (images or {}).items():
+                file.write(MTL_MAPS[maptype] + ' ' + os.path.relpath(image, directory).replace(os.sep, '/') + '\n')
+    os.replace(temp_path, filepath)
+
+def _json_value(value):
+    return list(value) if isinstance(value, tuple) else value
+
+def convert_d3dbsp(d3dbsppath, assetpath, outputdir, import_props=True, convert_textures=True, batch_mode='material', cache_settings=None, output_format='obj', interleaved=False):
+    """
+    Convert a map and the assets it uses without Blender. Writes the map geometry (<map>.obj/.mtl),
+    the entities (<map>.entities.json), the props (xmodels/<model>.obj/.mtl) and the textures (textures/<image>.png).
+    With the 'glb' output format the map geometry and the placed props are written into <map>.glb instead.
+
+    Parameters:
+    -----------
+    d3dbsppath          - string        - Path to the map file
+    assetpath           - string        - Path to the assets folder structure
+    outputdir           - string        - Output directory
+    import_props        - boolean       - Whether to convert props or not
+    convert_textures    - boolean       - Whether to convert textures or not
+    batch_mode          - string        - 'soup', 'material' or 'single', see Surfaces.batches
+    cache_settings      - tuple/None    - Directory and size cap of the texture and xmodel caches
+    output_format       - string        - 'obj' or 'glb'
+    interleaved         - boolean       - Whether to store the vertex attributes of .glb files interleaved or planar
+    -----------
+
+    Returns:
+    --------
+    Dictionary - map name, success, surface/triangle/prop counts, timings of each step in seconds and the error if it failed
+    --------
+    """
+    xmodelpath = os.path.join(assetpath, 'xmodel', '')
+    xmodelsurfpath = os.path.join(assetpath, 'xmodelsurfs', '')
+    texturepath = os.path.join(assetpath, 'images', '')
+    materialpath = os.path.join(assetpath, 'materials', '')
+
+    texture_cache = None
+    xmodel_cache = None
+    if(cache_settings):
+        directory, max_size = cache_settings
+        texture_cache = CACHE.DiskCache(os.path.join(directory, 'textures'), max_size)
+        xmodel_cache = CACHE.DiskCache(os.path.join(directory, 'xmodels'), max_size)
+
+    mapname = HELPER.return_filename_from_filepath(d3dbsppath, False)
+    result = {'map': mapname, 'ok': False, 'surfaces': 0, 'triangles': 0, 'props': 0, 'timings': {}}
+    timings = result['timings']
+    start = time.perf_counter()
+    step = start
+
+    def lap(name):
+        nonlocal step
+        now = time.perf_counter()
+        timings[name] = now - step
+        step = now
+
+    d3dbsp = D3DBSPREADER.D3DBSP()
+    try:
+        os.makedirs(outputdir, exist_ok=True)
+        if(not d3dbsp.load_d3dbsp(d3dbsppath, columnar=True)):
+            result['error'] = 'could not load the map'
+            return result
+        lap('read')
+
+        with open(os.path.join(outputdir, mapname + '.entities.json'), 'w') as file:
+            json.dump([{k: _json_value(v) for k, v in entity.items()} for entity in d3dbsp.entities], file, indent=1)
+
+        if(output_format == 'glb'):
+            def image_uri(material):
+                # glTF only supports .png and .jpg images
+                images = _material_images(material, materialpath, texturepath, outputdir, texture_cache, convert_textures, allow_dds=False)
+                if(images and 'colorMap' in images):
+                    return os.path.relpath(images['colorMap'], outputdir).replace(os.sep, '/')
+                return None
+
+            stats = GLTF.export_d3dbsp(os.path.join(outputdir, mapname + '.glb'), d3dbsp,
+                xmodelpath if import_props else None, xmodelsurfpath, xmodel_cache, batch_mode, interleaved, image_uri)
+            result['surfaces'] = len(d3dbsp.surfaces)
+            result['triangles'] = stats['triangles']
+            result['props'] = stats['props']
+            lap('export')
+            result['ok'] = True
+            return result
+
+        # map geometry
+        batches = d3dbsp.surfaces.batches(batch_mode)
+        surfaces = [(mapname + '_' + str(i), batch) for i, batch in enumerate(batches)]
+        result['surfaces'] = len(d3dbsp.surfaces)
+        result['triangles'] = write_obj(os.path.join(outputdir, mapname + '.obj'), surfaces, mapname + '.mtl')
+        lap('geometry')
+
+        write_mtl(os.path.join(outputdir, mapname + '.mtl'), d3dbsp.materials, materialpath, texturepath, outputdir, texture_cache, convert_textures)
+        lap('materials')
+
+        # every prop is converted once, the placements are in the entities
+        if(import_props):
+            for modelname in d3dbsp.entities.models:
+                obj_path = os.path.join(outputdir, 'xmodels', modelname + '.obj')
+                if(os.path.isfile(obj_path)):
+                    result['props'] += 1
+                    continue
+                xmodel = XMODELREADER.XModel()
+                if(not xmodel.load_xmodel(xmodelpath + modelname, xmodelsurfpath, xmodel_cache) or not len(xmodel.surfaces)):
+                    continue
+                os.makedirs(os.path.dirname(obj_path), exist_ok=True)
+                mtl_path = os.path.splitext(obj_path)[0] + '.mtl'
+                write_obj(obj_path, [(xmodel.modelname, SURFACE.concatenate(xmodel.surfaces))], os.path.basename(mtl_path))
+                write_mtl(mtl_path, xmodel.materials, materialpath, texturepath, outputdir, texture_cache, convert_textures)
+                result['props'] += 1
+        lap('props')
+        result['ok'] = True
+    except Exception as e:
+        result['error'] = repr(e)
+    finally:
+        d3dbsp.close()
+        timings['total'] = time.perf_counter() - start
+    return result
+
+def find_maps(paths):
+    """
+    Collect the .d3dbsp files of files and directories.
+
+    Parameters:
+    -----------
+    paths - list - Paths to .d3dbsp files or directories containing them
+    -----------
+
+    Returns:
+    --------
+    List - sorted list of .d3dbsp file paths
+    --------
+    """
+    maps = []
+    for path in paths:
+        if(os.path.isdir(path)):
+            maps += [os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith('.d3dbsp')]
+        else:
+            maps.append(path)
+    return sorted(maps)
+
+def convert_maps(d3dbsppaths, assetpath, outputdir, max_workers=0, **options):
+    """
+    Convert maps in parallel, every map is converted by a worker process.
+
+    Parameters:
+    -----------
+    d3dbsppaths - list      - Paths to the map files
+    assetpath   - string    - Path to the assets folder structure
+    outputdir   - string    - Output directory
+    max_workers - int       - Number of worker processes, 0 means one less than the number of CPUs
+    options     - mixed     - Options of convert_d3dbsp
+    -----------
+
+    Returns:
+    --------
+    Generator - result of each map (see convert_d3dbsp) in the order they finish
+    --------
+    """
+    if(not max_workers):
+        max_workers = max(1, (os.cpu_count() or 1) - 1)
+    max_workers = min(max_workers, len(d3dbsppaths))
+
+    if(max_workers <= 1):
+        for d3dbsppath in d3dbsppaths:
+            yield convert_d3dbsp(d3dbsppath, assetpath, outputdir, **options)
+        return
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        futures = [executor.submit(convert_d3dbsp, d3dbsppath, assetpath, outputdir, **options) for d3dbsppath in d3dbsppaths]
+        for future in as_completed(futures):
+            yield future.result()
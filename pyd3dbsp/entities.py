@@ -0,0 +1,163 @@
+import re
+
+"""
+Tokens of the entity lump: braces open and close an entity, every quoted string is a key or a value.
+"""
+ENTITY_TOKEN = re.compile(r'([{}])|"([^"]*)"')
+INTEGER = re.compile(r'[-+]?\d+$')
+NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?$')
+
+KEY_CLASSNAME = 'classname' # classname key in entity string
+KEY_MODEL = 'model' # model key in entity string
+MODEL_PREFIX = 'xmodel/' # prefix of the model names
+
+"""
+NUMERIC_KEYS tuple that defines the keys whose values are converted to numbers, the values of the other keys are kept as strings.
+"""
+NUMERIC_KEYS = ('origin', 'angles', 'angle', 'modelscale', 'spawnflags', 'radius', 'light', '_color')
+
+def typed_value(key, value):
+    """
+    Convert an entity value to its type. Values of NUMERIC_KEYS become a tuple of floats if they have
+    more than one number (origin, angles, colors) or an int/float, model names lose their xmodel/ prefix.
+    Other values are kept as they are, so names like "007" are not turned into numbers.
+
+    Parameters:
+    -----------
+    key     - string - Entity key
+    value   - string - Entity value
+    -----------
+
+    Returns:
+    --------
+    Mixed - tuple/int/float/string
+    --------
+    """
+    if(key in NUMERIC_KEYS):
+        parts = value.split()
+        if(len(parts) > 1):
+            if(all(NUMBER.match(part) for part in parts)):
+                return tuple(float(part) for part in parts)
+        elif(len(parts) == 1):
+            if(INTEGER.match(parts[0])):
+                return int(parts[0])
+            if(NUMBER.match(parts[0])):
+                return float(parts[0])
+    elif(key == KEY_MODEL and value.startswith(MODEL_PREFIX)):
+        return value[len(MODEL_PREFIX):]
+    return value
+
+def parse_entities(entity_data):
+    """
+    Parse the entity lump data in a single pass.
+
+    Parameters:
+    -----------
+    entity_data - bytes/string - Raw entity lump data
+    -----------
+
+    Returns:
+    --------
+    Entities - the parsed entities
+    --------
+    """
+    if(not isinstance(entity_data, str)):
+        entity_data = bytes(entity_data).decode('utf-8', errors='replace')
+
+    entities = []
+    entity = None
+    key = None
+    for brace, string in ENTITY_TOKEN.findall(entity_data):
+        if(brace == '{'):
+            entity = {}
+            key = None
+        elif(brace == '}'):
+            if(entity is not None):
+                entities.append(entity)
+            entity = None
+        elif(entity is not None):
+            # quoted strings alternate between keys and values
+            if(key is None):
+                key = string
+            else:
+                entity[key] = typed_value(key, string)
+                key = None
+    return Entities(entities)
+
+class Entities:
+    """
+    Entities class for storing the entities of a map, indexed by their classname and model.
+    """
+
+    def __init__(self, entities=None):
+        """
+        Class constructor to initialize the class properties.
+
+        Properties:
+        -----------
+        entities    - list          - list of dictionaries containing entity info
+        classnames  - dictionary    - classname -> list of entities
+        models      - dictionary    - model name -> list of entities (placements of the model)
+        -----------
+        """
+        self.entities = []
+        self.classnames = {}
+        self.models = {}
+        for entity in (entities or []):
+            self.append(entity)
+
+    def append(self, entity):
+        """
+        Add an entity and index it.
+
+        Parameters:
+        -----------
+        entity - dictionary - Entity info
+        -----------
+        """
+        self.entities.append(entity)
+        if(KEY_CLASSNAME in entity):
+            self.classnames.setdefault(entity[KEY_CLASSNAME], []).append(entity)
+        if(KEY_MODEL in entity):
+            self.models.setdefault(entity[KEY_MODEL], []).append(entity)
+
+    def __len__(self):
+        return len(self.entities)
+
+    def __iter__(self):
+        return iter(self.entities)
+
+    def __getitem__(self, i):
+        return self.entities[i]
+
+    def with_classname(self, classname):
+        """
+        Return the entities of a classname.
+
+        Parameters:
+        -----------
+        classname - string - Classname (e.g. misc_model)
+        -----------
+
+        Returns:
+        --------
+        List - list of entities
+        --------
+        """
+        return self.classnames.get(classname, [])
+
+    def with_model(self, model):
+        """
+        Return the placements of a model.
+
+        Parameters:
+        -----------
+        model - string - Model name (without the xmodel/ prefix)
+        -----------
+
+        Returns:
+        --------
+        List - list of entities
+        --------
+        """
+        return self.models.get(model, [])
@@ -0,0 +1,478 @@
+import os
+import json
+import math
+import struct
+import shutil
+import tempfile
+
+import numpy as np
+
+from . import read_xmodel as XMODELREADER
+from . import surface as SURFACE
+
+"""
+GLBHeader format. Every .glb file starts with the magic, the version and the total length,
+followed by the JSON chunk and the binary chunk (length, type, data).
+"""
+fmt_GLBHeader = '<III'
+fmt_GLBChunk = '<II'
+GLB_MAGIC = 0x46546C67 # glTF
+GLB_VERSION = 2
+CHUNK_JSON = 0x4E4F534A # JSON
+CHUNK_BIN = 0x004E4942 # BIN
+
+"""
+COMPONENT_TYPES dictionary that defines the glTF component type of the numpy types.
+"""
+COMPONENT_TYPES = {
+    np.dtype(np.uint8) : 5121,
+    np.dtype(np.uint16) : 5123,
+    np.dtype(np.uint32) : 5125,
+    np.dtype(np.float32) : 5126
+}
+
+"""
+ACCESSOR_TYPES dictionary that defines the glTF accessor type of the number of components.
+"""
+ACCESSOR_TYPES = {
+    1 : 'SCALAR',
+    2 : 'VEC2',
+    3 : 'VEC3',
+    4 : 'VEC4'
+}
+
+TARGET_ARRAY_BUFFER = 34962 # vertex data
+TARGET_ELEMENT_ARRAY_BUFFER = 34963 # index data
+Z_UP_TO_Y_UP = [-math.sqrt(0.5), 0.0, 0.0, math.sqrt(0.5)] # rotation of the root node, glTF is Y up
+
+"""
+dtype_InterleavedVertex type definition. Used to store vertices in a single interleaved buffer view.
+"""
+dtype_InterleavedVertex = np.dtype([
+    ('position', '<f4', 3),
+    ('normal', '<f4', 3),
+    ('uv', '<f4', 2),
+    ('color', 'u1', 4)
+])
+
+def euler_to_quaternion(x, y, z):
+    """
+    Convert XYZ euler angles into a quaternion.
+
+    Parameters:
+    -----------
+    x - float - rotation around X in radians
+    y - float - rotation around Y in radians
+    z - float - rotation around Z in radians
+    -----------
+
+    Returns:
+    --------
+    List - quaternion (x, y, z, w)
+    --------
+    """
+    cx, sx = math.cos(x / 2), math.sin(x / 2)
+    cy, sy = math.cos(y / 2), math.sin(y / 2)
+    cz, sz = math.cos(z / 2), math.sin(z / 2)
+    return [
+        sx * cy * cz - cx * sy * sz,
+        cx * sy * cz + sx * cy * sz,
+        cx * cy * sz - sx * sy * cz,
+        cx * cy * cz + sx * sy * sz
+    ]
+
+def prop_transform(prop):
+    """
+    Return the node transform of a prop, same as the transform of the imported objects.
+
+    Parameters:
+    -----------
+    prop - dictionary - Entity info
+    -----------
+
+    Returns:
+    --------
+    Tuple - translation, rotation and scale (None if the entity doesn't set them)
+    --------
+    """
+    XMODELENUMS = XMODELREADER.XMODELENUMS
+    translation = rotation = scale = None
+    if(XMODELENUMS.KEY_ORIGIN.value in prop):
+        translation = [float(value) for value in prop[XMODELENUMS.KEY_ORIGIN.value][:3]]
+    if(XMODELENUMS.KEY_ANGLES.value in prop):
+        angles = [math.radians(float(value)) for value in prop[XMODELENUMS.KEY_ANGLES.value][:3]]
+        rotation = euler_to_quaternion(angles[0], angles[2], angles[1])
+    if(XMODELENUMS.KEY_MODELSCALE.value in prop):
+        scale = [float(prop[XMODELENUMS.KEY_MODELSCALE.value])] * 3
+    return translation, rotation, scale
+
+class GLBWriter:
+    """
+    GLBWriter class for writing glTF 2.0 binary (.glb) files. The binary data of every mesh is
+    streamed into a temporary file when it is added, so only one mesh is kept in memory at a time.
+    """
+
+    def __init__(self, filepath, interleaved=False):
+        """
+        Class constructor to initialize the class properties.
+
+        Properties:
+        -----------
+        filepath    - string        - Path to the .glb file
+        interleaved - boolean       - Whether to store the vertex attributes interleaved in one buffer view or planar
+        gltf        - dictionary    - glTF JSON document
+        -----------
+        """
+        self.filepath = filepath
+        self.interleaved = interleaved
+        self.gltf = {
+            'asset': {'version': '2.0', 'generator': 'PyD3DBSP'},
+            'scene': 0,
+            'scenes': [{'nodes': []}],
+            'nodes': [],
+            'meshes': [],
+            'materials': [],
+            'textures': [],
+            'images': [],
+            'accessors': [],
+            'bufferViews': [],
+            'buffers': []
+        }
+        self._materials = {}
+        self._images = {}
+        self._length = 0
+        self._bin = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(filepath)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # nothing is written if the export failed
+        if(exc_type is None):
+            self.close()
+        else:
+            self._bin.close()
+
+    def _buffer_view(self, array, target=None, stride=None):
+        """
+        Append an array to the binary buffer.
+
+        Parameters:
+        -----------
+        array   - numpy array   - Data to append
+        target  - int           - Target of the buffer view (vertex or index data)
+        stride  - int           - Size of the interleaved vertices
+        -----------
+
+        Returns:
+        --------
+        Int - index of the buffer view
+        --------
+        """
+        data = np.ascontiguousarray(array).tobytes()
+        view = {'buffer': 0, 'byteOffset': self._length, 'byteLength': len(data)}
+        if(target):
+            view['target'] = target
+        if(stride):
+            view['byteStride'] = stride
+        # every buffer view starts at a 4 byte boundary
+        self._bin.write(data + b'\x00' * (-len(data) % 4))
+        self._length += len(data) + (-len(data) % 4)
+        self.gltf['bufferViews'].append(view)
+        return len(self.gltf['bufferViews']) - 1
+
+    def _accessor(self, view, dtype, count, components, offset=0, normalized=False, bounds=None):
+        """
+        Add an accessor of a buffer view.
+
+        Parameters:
+        -----------
+        view        - int           - Index of the buffer view
+        dtype       - numpy dtype   - Type of the components
+        count       - int           - Number of elements
+        components  - int           - Number of components of an element
+        offset      - int           - Offset of the first element in the buffer view
+        normalized  - boolean       - Whether the integer components are normalized to 0-1 or not
+        bounds      - tuple         - Minimum and maximum of the elements
+        -----------
+
+        Returns:
+        --------
+        Int - index of the accessor
+        --------
+        """
+        accessor = {
+            'bufferView': view,
+            'componentType': COMPONENT_TYPES[np.dtype(dtype)],
+            'count': int(count),
+            'type': ACCESSOR_TYPES[components]
+        }
+        if(offset):
+            accessor['byteOffset'] = offset
+        if(normalized):
+            accessor['normalized'] = True
+        if(bounds is not None):
+            accessor['min'] = [float(value) for value in bounds[0]]
+            accessor['max'] = [float(value) for value in bounds[1]]
+        self.gltf['accessors'].append(accessor)
+        return len(self.gltf['accessors']) - 1
+
+    def add_material(self, name, image_uri=None):
+        """
+        Add a material once.
+
+        Parameters:
+        -----------
+        name        - string - Name of the material
+        image_uri   - string - URI of the color map, relative to the .glb file
+        -----------
+
+        Returns:
+        --------
+        Int - index of the material
+        --------
+        """
+        if(name in self._materials):
+            return self._materials[name]
+
+        material = {'name': name, 'pbrMetallicRoughness': {'metallicFactor': 0.0}}
+        if(image_uri):
+            if(image_uri not in self._images):
+                self.gltf['images'].append({'uri': image_uri})
+                self.gltf['textures'].append({'source': len(self.gltf['images']) - 1})
+                self._images[image_uri] = len(self.gltf['textures']) - 1
+            material['pbrMetallicRoughness']['baseColorTexture'] = {'index': self._images[image_uri]}
+
+        self.gltf['materials'].append(material)
+        self._materials[name] = len(self.gltf['materials']) - 1
+        return self._materials[name]
+
+    def _vertex_attributes(self, surface):
+        """
+        Write the vertex arrays of a surface.
+
+        Parameters:
+        -----------
+        surface - SURFACE.SurfaceData - Arrays of the surface
+        -----------
+
+        Returns:
+        --------
+        Dictionary - glTF primitive attributes
+        --------
+        """
+        count = len(surface.positions)
+        positions = np.asarray(surface.positions, dtype=np.float32)
+        # normals have to be unit length
+        normals = np.asarray(surface.normals, dtype=np.float32)
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+        colors = np.clip(np.rint(np.asarray(surface.colors, dtype=np.float32) * 255), 0, 255).astype(np.uint8)
+        bounds = (positions.min(axis=0), positions.max(axis=0))
+
+        if(self.interleaved):
+            vertices = np.empty(count, dtype=dtype_InterleavedVertex)
+            vertices['position'] = positions
+            vertices['normal'] = normals
+            vertices['uv'] = surface.uvs
+            vertices['color'] = colors
+            view = self._buffer_view(vertices, TARGET_ARRAY_BUFFER, dtype_InterleavedVertex.itemsize)
+            fields = dtype_InterleavedVertex.fields
+            return {
+                'POSITION': self._accessor(view, np.float32, count, 3, fields['position'][1], bounds=bounds),
+                'NORMAL': self._accessor(view, np.float32, count, 3, fields['normal'][1]),
+                'TEXCOORD_0': self._accessor(view, np.float32, count, 2, fields['uv'][1]),
+                'COLOR_0': self._accessor(view, np.uint8, count, 4, fields['color'][1], normalized=True)
+            }
+
+        return {
+            'POSITION': self._accessor(self._buffer_view(positions, TARGET_ARRAY_BUFFER), np.float32, count, 3, bounds=bounds),
+            'NORMAL': self._accessor(self._buffer_view(normals, TARGET_ARRAY_BUFFER), np.float32, count, 3),
+            'TEXCOORD_0': self._accessor(self._buffer_view(np.asarray(surface.uvs, dtype=np.float32), TARGET_ARRAY_BUFFER), np.float32, count, 2),
+            'COLOR_0': self._accessor(self._buffer_view(colors, TARGET_ARRAY_BUFFER), np.uint8, count, 4, normalized=True)
+        }
+
+    def add_mesh(self, name, surface, image_uri=None):
+        """
+        Add a mesh with a primitive for every material of the surface. The primitives share the vertex data.
+
+        Parameters:
+        -----------
+        name        - string                - Name of the mesh
+        surface     - SURFACE.SurfaceData   - Arrays of the surface
+        image_uri   - function              - Returns the color map URI of a material name (or None)
+        -----------
+
+        Returns:
+        --------
+        Int/None - index of the mesh, None if the surface doesn't have any triangles
+        --------
+        """
+        if(not len(surface.triangles) or not len(surface.positions)):
+            return None
+
+        attributes = self._vertex_attributes(surface)
+        index_type = np.uint16 if len(surface.positions) <= 0xFFFF else np.uint32
+
+        materials = surface.material if surface.material_indices is not None else [surface.material]
+        material_indices = surface.material_indices if surface.material_indices is not None else np.zeros(len(surface.triangles), dtype=np.int32)
+        # triangles of each material after each other
+        order = np.argsort(material_indices, kind='stable')
+        splits = np.cumsum(np.bincount(material_indices, minlength=len(materials)))[:-1]
+
+        primitives = []
+        for material, triangle_ids in zip(materials, np.split(order, splits)):
+            if(not len(triangle_ids)):
+                continue
+            indices = surface.triangles[triangle_ids].reshape(-1).astype(index_type)
+            primitive = {
+                'attributes': attributes,
+                'indices': self._accessor(self._buffer_view(indices, TARGET_ELEMENT_ARRAY_BUFFER), index_type, len(indices), 1),
+                'mode': 4 # triangles
+            }
+            if(material):
+                primitive['material'] = self.add_material(material, image_uri(material) if image_uri else None)
+            primitives.append(primitive)
+
+        self.gltf['meshes'].append({'name': name, 'primitives': primitives})
+        return len(self.gltf['meshes']) - 1
+
+    def add_node(self, name, mesh=None, parent=None, translation=None, rotation=None, scale=None):
+        """
+        Add a node.
+
+        Parameters:
+        -----------
+        name        - string    - Name of the node
+        mesh        - int       - Index of the mesh of the node
+        parent      - int       - Index of the parent node, the node is added to the scene if not set
+        translation - list      - Translation (x, y, z)
+        rotation    - list      - Rotation quaternion (x, y, z, w)
+        scale       - list      - Scale (x, y, z)
+        -----------
+
+        Returns:
+        --------
+        Int - index of the node
+        --------
+        """
+        node = {'name': name}
+        if(mesh is not None):
+            node['mesh'] = mesh
+        if(translation is not None):
+            node['translation'] = translation
+        if(rotation is not None):
+            node['rotation'] = rotation
+        if(scale is not None):
+            node['scale'] = scale
+        self.gltf['nodes'].append(node)
+        index = len(self.gltf['nodes']) - 1
+
+        if(parent is None):
+            self.gltf['scenes'][0]['nodes'].append(index)
+        else:
+            self.gltf['nodes'][parent].setdefault('children', []).append(index)
+        return index
+
+    def close(self):
+        """
+        Write the .glb file: the JSON chunk followed by the binary data streamed from the temporary file.
+        """
+        if(self._bin.closed):
+            return
+
+        if(self._length):
+            self.gltf['buffers'] = [{'byteLength': self._length}]
+        # empty arrays are not allowed in glTF
+        gltf = {key: value for key, value in self.gltf.items() if value != []}
+        document = json.dumps(gltf, separators=(',', ':')).encode('utf-8')
+        document += b' ' * (-len(document) % 4)
+
+        total = struct.calcsize(fmt_GLBHeader) + struct.calcsize(fmt_GLBChunk) + len(document)
+        if(self._length):
+            total += struct.calcsize(fmt_GLBChunk) + self._length
+
+        temp_path = self.filepath + '.tmp' + str(os.getpid())
+        try:
+            with open(temp_path, 'wb') as file:
+                file.write(struct.pack(fmt_GLBHeader, GLB_MAGIC, GLB_VERSION, total))
+                file.write(struct.pack(fmt_GLBChunk, len(document), CHUNK_JSON))
+                file.write(document)
+                if(self._length):
+                    file.write(struct.pack(fmt_GLBChunk, self._length, CHUNK_BIN))
+                    self._bin.seek(0)
+                    shutil.copyfileobj(self._bin, file)
+            os.replace(temp_path, self.filepath)
+        finally:
+            self._bin.close()
+            if(os.path.exists(temp_path)):
+                os.remove(temp_path)
+
+def export_xmodel(filepath, xmodel, interleaved=False, image_uri=None):
+    """
+    Export a prop into a .glb file.
+
+    Parameters:
+    -----------
+    filepath    - string    - Path to the .glb file
+    xmodel      - XModel    - Loaded prop
+    interleaved - boolean   - Whether to store the vertex attributes interleaved or planar
+    image_uri   - function  - Returns the color map URI of a material name (or None)
+    -----------
+    """
+    with GLBWriter(filepath, interleaved) as writer:
+        root = writer.add_node(xmodel.modelname, rotation=Z_UP_TO_Y_UP)
+        if(len(xmodel.surfaces)):
+            mesh = writer.add_mesh(xmodel.modelname, SURFACE.concatenate(xmodel.surfaces), image_uri)
+            writer.add_node(xmodel.modelname, mesh, root)
+
+def export_d3dbsp(filepath, d3dbsp, xmodelpath=None, xmodelsurfpath=None, xmodel_cache=None, batch_mode='material', interleaved=False, image_uri=None):
+    """
+    Export a loaded map into a .glb file. The map geometry is merged and written one batch at a time,
+    every prop is loaded and written once and its placements are nodes sharing its mesh.
+
+    Parameters:
+    -----------
+    filepath        - string    - Path to the .glb file
+    d3dbsp          - D3DBSP    - Map loaded in columnar mode
+    xmodelpath      - string    - Path to props, props are not exported if not set
+    xmodelsurfpath  - string    - Path to prop surfaces
+    xmodel_cache    - DiskCache - Cache of compiled xmodels
+    batch_mode      - string    - 'soup', 'material' or 'single', see Surfaces.batches
+    interleaved     - boolean   - Whether to store the vertex attributes interleaved or planar
+    image_uri       - function  - Returns the color map URI of a material name (or None)
+    -----------
+
+    Returns:
+    --------
+    Dictionary - number of exported meshes, triangles and prop placements
+    --------
+    """
+    stats = {'meshes': 0, 'triangles': 0, 'props': 0}
+    with GLBWriter(filepath, interleaved) as writer:
+        root = writer.add_node(d3dbsp.mapname, rotation=Z_UP_TO_Y_UP)
+        geometry = writer.add_node(d3dbsp.mapname + '_geometry', parent=root)
+
+        for i, indices in enumerate(d3dbsp.surfaces.batch_indices(batch_mode)):
+            surface = d3dbsp.surfaces.merge(indices)
+            mesh = writer.add_mesh(d3dbsp.mapname + '_' + str(i), surface, image_uri)
+            if(mesh is not None):
+                writer.add_node(d3dbsp.mapname + '_' + str(i), mesh, geometry)
+                stats['meshes'] += 1
+                stats['triangles'] += len(surface.triangles)
+
+        if(xmodelpath is not None):
+            props = writer.add_node(d3dbsp.mapname + '_xmodels', parent=root)
+            for modelname, placements in d3dbsp.entities.models.items():
+                xmodel = XMODELREADER.XModel()
+                if(not xmodel.load_xmodel(xmodelpath + modelname, xmodelsurfpath, xmodel_cache) or not len(xmodel.surfaces)):
+                    continue
+                mesh = writer.add_mesh(xmodel.modelname, SURFACE.concatenate(xmodel.surfaces), image_uri)
+                if(mesh is None):
+                    continue
+                stats['meshes'] += 1
+                for placement in placements:
+                    translation, rotation, scale = prop_transform(placement)
+                    writer.add_node(xmodel.modelname, mesh, props, translation, rotation, scale)
+                    stats['props'] += 1
+    return stats
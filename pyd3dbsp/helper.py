@@ -1,30 +1,55 @@
 import struct
 import os
 import math
+import re
 
-import bpy
+import numpy as np
 
-def read_nullstr(file):
+IMPORT_TAG = 'pyd3dbsp_import' # custom property of the datablocks created by the running import
+
+def fmt_to_dtype(fmt, fields):
     """
-    Read a null terminated string
+    Create a numpy structured dtype from a struct format string and the field names
+    of the matching namedtuple, so a whole block of records can be decoded at once
 
     Parameters:
     -----------
-    file - file object - File to read from
+    fmt     - string    - struct format string (e.g. '<3f3f4B2f2f6f')
+    fields  - tuple     - field names, one for each value the format unpacks to
     -----------
 
     Returns:
     -----------
-    Null terminated string
+    numpy.dtype - Structured dtype with the same layout as the struct format
     -----------
     """
-    string = b''
-    character = None
-    while(character != b'\x00'):
-        character = file.read(1)
-        string += character
-    string = string.decode('utf-8').rstrip('\x00')
-    return string
+    byteorder = fmt[0] if fmt[0] in '<>=!@' else '<'
+    byteorder = '>' if byteorder == '!' else byteorder
+    types = []
+    offset = 0
+    for count, code in re.findall(r'(\d*)([a-zA-Z])', fmt.lstrip('<>=!@')):
+        count = int(count) if count else 1
+        # padding bytes only move the offset
+        if(code == 'x'):
+            offset += count
+        # strings are a single field with the given length
+        elif(code == 's'):
+            types.append(('S' + str(count), offset))
+            offset += count
+        else:
+            for i in range(count):
+                types.append((byteorder + code, offset))
+                offset += struct.calcsize('<' + code)
+
+    if(len(types) != len(fields)):
+        raise ValueError("Format " + fmt + " does not match the number of fields.")
+
+    return np.dtype({
+        'names': list(fields),
+        'formats': [np.dtype(t[0]) for t in types],
+        'offsets': [t[1] for t in types],
+        'itemsize': struct.calcsize(fmt)
+    })
 
 def return_filename_from_filepath(filepath, include_extension=True):
     """
@@ -61,9 +86,26 @@ def file_not_found(filepath, msg):
 
 def clean_materials():
     """
-    A function to delete all existing materials
+    A function to delete the materials that are not used by anything
+    """
+    # only available inside Blender, the readers use this module outside of it as well
+    import bpy
+    for bpy_material in [bpy_material for bpy_material in bpy.data.materials if not bpy_material.users]:
+      bpy.data.materials.remove(bpy_material)
+
+def tag_datablock(datablock):
+    """
+    Mark a datablock as created by the running import, so it can be removed if the import is cancelled
+
+    Parameters:
+    -----------
+    datablock - bpy.types.ID - Created datablock
+    -----------
+
+    Returns:
+    -----------
+    The datablock
+    -----------
     """
-    if(len(bpy.data.materials)):
-      for bpy_material in bpy.data.materials:
-        bpy_material.user_clear()
-        bpy.data.materials.remove(bpy_material)
\ No newline at end of file
+    datablock[IMPORT_TAG] = True
+    return datablock
@@ -3,204 +3,285 @@ import math
 import bpy
 import bpy.ops
 import bpy.props
-import bmesh
+import numpy as np
 
 from . import read_d3dbsp as D3DBSPREADER
 from . import material as MATERIAL
 from . import read_xmodel as XMODELREADER
 from . import helper as HELPER
+from . import surface as SURFACE
+from . import entities as ENTITIES
+from . import region as REGION
+from . import instrument as INSTRUMENT
+
+IMPORT_CHUNK_SIZE = 16 # number of surfaces, materials or models processed between two steps of a step generator
+
+"""
+IMPORT_PROGRESS dictionary that defines the part of the overall progress each step of the import takes.
+"""
+IMPORT_PROGRESS = {
+    'load' : (0.0, 0.05),
+    'materials' : (0.05, 0.45),
+    'duplicates' : (0.45, 0.5),
+    'geometry' : (0.5, 0.8),
+    'entities' : (0.8, 1.0)
+}
+
+"""
+ROLLBACK_COLLECTIONS tuple that defines the datablocks that are tagged by the import, in the order they are removed when it is cancelled.
+"""
+ROLLBACK_COLLECTIONS = ('objects', 'meshes', 'materials', 'images')
+
+def _build_mesh(mesh, surface):
+    """
+    Fill a mesh from the arrays of a surface with bulk operations
+
+    Parameters:
+    -----------
+    mesh    - bpy.types.Mesh        - Empty mesh to fill
+    surface - SURFACE.SurfaceData   - Arrays of the surface
+    -----------
+    """
+
+    # triangles keep the vertex indexing of the surface
+    corners = surface.triangles.reshape(-1)
+    corner_count = len(corners)
+    triangle_count = len(surface.triangles)
+
+    # vertices
+    mesh.vertices.add(len(surface.positions))
+    mesh.vertices.foreach_set('co', np.ascontiguousarray(surface.positions, dtype=np.float32).reshape(-1))
+
+    # loops
+    mesh.loops.add(corner_count)
+    mesh.loops.foreach_set('vertex_index', np.ascontiguousarray(corners, dtype=np.int32))
+
+    # polygons (triangles)
+    mesh.polygons.add(triangle_count)
+    mesh.polygons.foreach_set('loop_start', np.arange(0, corner_count, 3, dtype=np.int32))
+    mesh.polygons.foreach_set('loop_total', np.full(triangle_count, 3, dtype=np.int32))
+    mesh.polygons.foreach_set('use_smooth', np.ones(triangle_count, dtype=bool))
+    if(surface.material_indices is not None):
+        mesh.polygons.foreach_set('material_index', np.ascontiguousarray(surface.material_indices, dtype=np.int32))
+
+    # UV layer, the images are flipped for blender, so the V coordinate is flipped too
+    uvs = np.array(surface.uvs[corners], dtype=np.float32)
+    uvs[:, 1] = 1 - uvs[:, 1]
+    uv_layer = mesh.uv_layers.new()
+    uv_layer.data.foreach_set('uv', uvs.reshape(-1))
+
+    # vertex color layer
+    vertexcolor_layer = mesh.vertex_colors.new()
+    vertexcolor_layer.data.foreach_set('color', np.ascontiguousarray(surface.colors[corners], dtype=np.float32).reshape(-1))
+
+    # finalize the mesh
+    mesh.validate()
+    mesh.update()
+    INSTRUMENT.count('vertices', len(surface.positions))
+    INSTRUMENT.count('triangles', triangle_count)
+
+def _create_mesh_data(surface, surface_name, weld_tolerance=None):
+    """
+    Create a mesh datablock from the arrays of a surface. The materials are assigned to the mesh,
+    so every object using the mesh gets them.
+
+    Parameters:
+    -----------
+    surface         - SURFACE.SurfaceData   - Arrays of the surface
+    surface_name    - string                - Name of the mesh
+    weld_tolerance  - float/None            - Merge matching vertices within this tolerance, vertices are not merged if not set
+    -----------
+
+    Returns:
+    --------
+    bpy.types.Mesh - the created mesh
+    --------
+    """
+    mesh = HELPER.tag_datablock(bpy.data.meshes.new(surface_name))
+
+    # every material of the surface gets a slot
+    materials = surface.material if surface.material_indices is not None else [surface.material]
+    for material in materials:
+        if(material or len(materials) > 1):
+            mesh.materials.append(bpy.data.materials.get(material) if material else None)
 
+    # drop the unused vertices of the surface or merge the matching ones
+    if(weld_tolerance):
+        surface = SURFACE.weld(surface, weld_tolerance)
+    else:
+        surface = SURFACE.compact(surface)
 
-def _create_mesh(surfaces, surface_name, prop=None, parent=None):
+    # build the mesh from the arrays
+    _build_mesh(mesh, surface)
+    return mesh
+
+def _create_object(surface, surface_name, parent=None, weld_tolerance=None):
     """
-    An all purpose mesh creating function suitable to process the read in data by D3DBSPREADER and XMODELREADER
+    Create an object with a new mesh from the arrays of a surface and link it to the scene.
 
     Parameters:
     -----------
-    surfaces        - array/mixed   - Data containing all the necessary info of a mesh
-    surface_name    - string        - Name of the surface
-    prop            - array/mixed   - Parameter decides if we are importing a prop or not
+    surface         - SURFACE.SurfaceData   - Arrays of the surface
+    surface_name    - string                - Name of the object and the mesh
+    parent          - object/mixed          - Parameter for parenting
+    weld_tolerance  - float/None            - Merge matching vertices within this tolerance, vertices are not merged if not set
+    -----------
+    """
+    # create a mesh and link it to the scene/collection
+    mesh = _create_mesh_data(surface, surface_name, weld_tolerance)
+    obj = HELPER.tag_datablock(bpy.data.objects.new(surface_name, mesh))
+    
+    bpy.context.scene.collection.objects.link(obj)
+    bpy.context.view_layer.objects.active = obj
+    obj.select_set(True)
+
+    # decal surfaces split from duplicate triangles are tagged with their layer
+    if(surface.layer):
+        obj.name = surface_name + "_decal"
+        obj['decal_layer'] = surface.layer
+
+    # if we have parent parameter we set the created objects parent as parent
+    if(parent):
+        obj.parent = parent
+
+def _create_map_geometry_steps(surfaces, surface_name, parent=None, weld_tolerance=None, batch_mode='material', chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Create the objects of the map geometry one batch at a time.
+
+    Parameters:
+    -----------
+    surfaces        - Surfaces      - Surfaces of the map
+    surface_name    - string        - Name of the objects
     parent          - object/mixed  - Parameter for parenting
+    weld_tolerance  - float/None    - Merge matching vertices within this tolerance, vertices are not merged if not set
+    batch_mode      - string        - 'soup', 'material' or 'single', see Surfaces.batches
+    chunk_size      - int           - Number of batches created between two steps
     -----------
+
+    Yields:
+    -------
+    Float - fraction of the created batches
+    -------
+    """
+    batches = surfaces.batch_indices(batch_mode)
+    for i, indices in enumerate(batches):
+        # the batches are merged when they are created, so only one of them is kept in memory
+        surface = surfaces.surface_data(int(indices[0])) if batch_mode == 'soup' else surfaces.merge(indices)
+        _create_object(surface, surface_name, parent, weld_tolerance)
+        if((i + 1) % chunk_size == 0):
+            yield (i + 1) / len(batches)
+
+def _set_prop_transform(obj, prop):
     """
+    Apply the placement of a prop entity to an object
 
-    # if we are importing a prop we create a null to parent all the meshes to
-    if(prop):
-        meshnull = bpy.data.objects.new(surface_name, None)
-        bpy.context.scene.collection.objects.link(meshnull)
-
-    # loop through surfaces
-    for i in range(0, len(surfaces)):
-        surface = surfaces[i]
-
-        # main keys that are required to be present in the surface parameter
-        important_keys = set(['vertices', 'triangles'])
-        if(important_keys.issubset(surface.keys())):
-
-            # create a mesh and link it to the scene/collection
-            mesh = bpy.data.meshes.new(surface_name)
-            obj = bpy.data.objects.new(surface_name, mesh)
-            
-            bpy.context.scene.collection.objects.link(obj)
-            bpy.context.view_layer.objects.active = obj
-            obj.select_set(True)
-
-            mesh = bpy.context.object.data
-            bm = bmesh.new()
-
-            # create lists for certain data
-            uv_surface_list = []
-            vertexcolor_surface_list = []
-
-            # vertices
-            vertices = surface['vertices']
-
-            # triangles
-            triangles = surface['triangles']
-            
-            # if we have a material set we set it as active material
-            if('material' in surface):
-                material = surface['material']
-                obj.active_material = bpy.data.materials.get(material)
-            
-            # loop through the triangles
-            for j in range(0, len(triangles)):
-                triangle = triangles[j]
-
-                # get vertices to form a triangle
-                vertex1 = vertices[triangle[0]]
-                vertex2 = vertices[triangle[1]]
-                vertex3 = vertices[triangle[2]]
-
-                # create vertices
-                v1 = bm.verts.new(vertex1['position'])
-                v2 = bm.verts.new(vertex2['position'])
-                v3 = bm.verts.new(vertex3['position'])
-
-                # create a list for the triangle UVs
-                uv_triangle_list = []
-
-                # get the UVs
-                uv_triangle_list.append(vertex1['uv'])
-                uv_triangle_list.append(vertex2['uv'])
-                uv_triangle_list.append(vertex3['uv'])
-
-                # add the UVs to the list
-                uv_surface_list.append(uv_triangle_list)
-
-                # create a list for the triangle vertex color
-                vertexcolor_triangle_list = []
-
-                # get the vertex color
-                vertexcolor_triangle_list.append(vertex1['color'])
-                vertexcolor_triangle_list.append(vertex2['color'])
-                vertexcolor_triangle_list.append(vertex3['color'])
-
-                # add the vertex color to the list
-                vertexcolor_surface_list.append(vertexcolor_triangle_list)
-
-                # update
-                bm.verts.ensure_lookup_table()
-                bm.verts.index_update()
-
-                # create a new face (triangle)
-                bm.faces.new((v1, v2, v3))
-
-                # update
-                bm.faces.ensure_lookup_table()
-                bm.faces.index_update()
-
-            # create UV layer
-            uv_layer = bm.loops.layers.uv.new()
-
-            # create vertex color layer
-            vertexcolor_layer = bm.loops.layers.color.new()
-
-            # loop through the faces and set the UV, vertex color data
-            for face, uv_face_data, vertexcolor_face_data in zip(bm.faces, uv_surface_list, vertexcolor_surface_list):
-                for loop, uv_data, vertexcolor_data in zip(face.loops, uv_face_data, vertexcolor_face_data):
-                    loop[uv_layer].uv = uv_data
-                    loop[vertexcolor_layer] = vertexcolor_data
-
-            # finalize the mesh
-            bm.to_mesh(mesh)
-            bm.free()
-
-            # if we have a prop we have a few things to setup
-            if(prop):
-                obj.parent = meshnull
-                
-                XMODELENUMS = XMODELREADER.XMODELENUMS
-                
-                # prop location
-                if(XMODELENUMS.KEY_ORIGIN.value in prop):
-                    obj.location = tuple(map(float, prop[XMODELENUMS.KEY_ORIGIN.value]))
-                # prop rotation
-                if(XMODELENUMS.KEY_ANGLES.value in prop):
-                    rot_x = math.radians(float(prop[XMODELENUMS.KEY_ANGLES.value][0]))
-                    rot_y = math.radians(float(prop[XMODELENUMS.KEY_ANGLES.value][1]))
-                    rot_z = math.radians(float(prop[XMODELENUMS.KEY_ANGLES.value][2]))
-                    obj.rotation_euler = (rot_x, rot_z, rot_y)
-                # prop scale
-                if(XMODELENUMS.KEY_MODELSCALE.value in prop):
-                    obj.scale = (float(prop[XMODELENUMS.KEY_MODELSCALE.value]), float(prop[XMODELENUMS.KEY_MODELSCALE.value]), float(prop[XMODELENUMS.KEY_MODELSCALE.value]))
-            # if we have a parent and we are importing a prop we set the meshnull's parent as parent
-            if(parent and prop):
-                meshnull.parent = parent
-            # else if we have parent parameter but not importing a prop we set the created objects parent as parent
-            elif(parent and not prop):
-                obj.parent = parent
-        else:
-            # if we import a prop but it wesnt successful we remove the created null
-            if(prop):
-                bpy.data.objects.remove(meshnull, True)
-            # give error message
-            print("Surface " + surface_name + " #" + str(i) + " does not contain the necessary data.")
-
-def _import_entities(entities, xmodelpath, xmodelsurfpath, materialpath, texturepath, parent=None, import_materials=True):
+    Parameters:
+    -----------
+    obj     - bpy.types.Object  - Object of the prop
+    prop    - dictionary        - Entity of the prop
+    -----------
     """
-    Function for importing props
+    XMODELENUMS = XMODELREADER.XMODELENUMS
+
+    # prop location
+    if(XMODELENUMS.KEY_ORIGIN.value in prop):
+        obj.location = tuple(map(float, prop[XMODELENUMS.KEY_ORIGIN.value]))
+    # prop rotation
+    if(XMODELENUMS.KEY_ANGLES.value in prop):
+        rot_x = math.radians(float(prop[XMODELENUMS.KEY_ANGLES.value][0]))
+        rot_y = math.radians(float(prop[XMODELENUMS.KEY_ANGLES.value][1]))
+        rot_z = math.radians(float(prop[XMODELENUMS.KEY_ANGLES.value][2]))
+        obj.rotation_euler = (rot_x, rot_z, rot_y)
+    # prop scale
+    if(XMODELENUMS.KEY_MODELSCALE.value in prop):
+        obj.scale = (float(prop[XMODELENUMS.KEY_MODELSCALE.value]), float(prop[XMODELENUMS.KEY_MODELSCALE.value]), float(prop[XMODELENUMS.KEY_MODELSCALE.value]))
+
+def _import_entities_steps(entities, xmodelpath, xmodelsurfpath, materialpath, texturepath, parent=None, import_materials=True, texture_cache=None, texture_workers=1, xmodel_cache=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Function for importing props. Every model is loaded and built only once, the placements
+    of the same model are objects sharing its mesh.
 
     Parameters:
     -----------
-    entities            - array/mixed   - Array containing data about props
+    entities            - Entities      - Entities containing data about props
     xmodelpath          - string        - Path to props
     xmodelsurfpath      - string        - Path to prop surfaces
     materialpath        - string        - Path to materials
     texturepath         - string        - Path to textures/images
     parent              - object/mixed  - Parent to parent to
     import_materials    - boolean       - Whether to import materials or not
+    texture_cache       - DiskCache     - Cache of decoded textures
+    texture_workers     - int           - Number of processes decoding the textures
+    xmodel_cache        - DiskCache     - Cache of compiled xmodels
+    chunk_size          - int           - Number of models loaded/built between two steps
     -----------
+
+    Yields:
+    -------
+    Float - fraction of the imported props
+    -------
     """
     
-    XMODELENUMS = XMODELREADER.XMODELENUMS
+    # the placements of every model are indexed by the model name
+    if(not isinstance(entities, ENTITIES.Entities)):
+        entities = ENTITIES.Entities(entities)
+    placements = entities.models
+
     # only start stuff if we have any props
-    if(len(entities)):
+    if(len(placements)):
         print('Importing entities...')
         # create null
         nullname = parent.name + "_xmodels" if parent else "xmodels"
-        entitiesnull = bpy.data.objects.new(nullname, None)
+        entitiesnull = HELPER.tag_datablock(bpy.data.objects.new(nullname, None))
         bpy.context.scene.collection.objects.link(entitiesnull)
 
         # parenting
         if(parent):
             entitiesnull.parent = parent
 
-        # loop through the props
-        for i in range(0, len(entities)):
-            entity = entities[i]
-            if(XMODELENUMS.KEY_MODEL.value in entity):
-                # read/load prop data
+        # read/load every model once
+        xmodels = {}
+        with INSTRUMENT.span('xmodels', models=len(placements)):
+            for i, modelname in enumerate(placements):
                 xmodel = XMODELREADER.XModel()
                 # if loading was successful
-                if(xmodel.load_xmodel((xmodelpath + entity[XMODELENUMS.KEY_MODEL.value]), xmodelsurfpath)):
-                    # if we need to import materials
-                    if(import_materials):
-                        _import_materials(xmodel.materials, materialpath, texturepath)
-                    # create prop mesh
-                    _create_mesh(xmodel.surfaces, xmodel.modelname, prop=entity, parent=entitiesnull)
-
-def _import_materials(materials, materialpath, texturepath):
+                if(xmodel.load_xmodel((xmodelpath + modelname), xmodelsurfpath, xmodel_cache)):
+                    xmodels[modelname] = xmodel
+                if((i + 1) % chunk_size == 0):
+                    yield 0.4 * (i + 1) / len(placements)
+            INSTRUMENT.count('xmodels_loaded', len(xmodels))
+
+        # if we need to import materials, import the materials of every model at once
+        if(import_materials):
+            materials = []
+            for xmodel in xmodels.values():
+                materials += [material for material in xmodel.materials if material not in materials]
+            with INSTRUMENT.span('materials', materials=len(materials)):
+                for fraction in _import_materials_steps(materials, materialpath, texturepath, texture_cache, texture_workers, chunk_size):
+                    yield 0.4 + 0.3 * fraction
+
+        with INSTRUMENT.span('props'):
+            for k, (modelname, xmodel) in enumerate(xmodels.items()):
+                surfaces = [SURFACE.surface_data(xmodel.surfaces, i) for i in range(len(xmodel.surfaces))]
+                surfaces = [surface for surface in surfaces if surface is not None]
+                if(not len(surfaces)):
+                    print("Surfaces of " + xmodel.modelname + " do not contain the necessary data.")
+                    continue
+
+                # create the prop mesh once
+                mesh = _create_mesh_data(SURFACE.concatenate(surfaces), xmodel.modelname)
+
+                # every placement is an object sharing the mesh
+                for entity in placements[modelname]:
+                    obj = HELPER.tag_datablock(bpy.data.objects.new(xmodel.modelname, mesh))
+                    bpy.context.scene.collection.objects.link(obj)
+                    obj.parent = entitiesnull
+                    _set_prop_transform(obj, entity)
+                INSTRUMENT.count('props', len(placements[modelname]))
+                if((k + 1) % chunk_size == 0):
+                    yield 0.7 + 0.3 * (k + 1) / len(xmodels)
+
+def _import_materials_steps(materials, materialpath, texturepath, texture_cache=None, texture_workers=1, chunk_size=IMPORT_CHUNK_SIZE):
     """
     Import materials
 
@@ -209,16 +290,167 @@ def _import_materials(materials, materialpath, texturepath):
     materials       - list      - List of material names
     materialspath   - string    - Path to materials
     texturepath     - string    - Path to textures/images
+    texture_cache   - DiskCache - Cache of decoded textures
+    texture_workers - int       - Number of processes decoding the textures, 1 decodes them one by one while
+                                  creating the materials, 0 uses one less than the number of CPUs
+    chunk_size      - int       - Number of materials created between two steps
     -----------
+
+    Yields:
+    -------
+    Float - fraction of the imported materials
+    -------
     """
     # only start if we have materials
     if(len(materials)):
-        for material in materials:
-            # only import material if it wasn't imported before
-            if(not (bpy.data.materials.get(material))):
-                MATERIAL.create_material(material, materialpath, texturepath)
+        # only import materials that weren't imported before
+        materials = [material for material in materials if not bpy.data.materials.get(material)]
+
+        # decode the textures of all the materials in parallel first, the material files are read only once
+        material_files = None
+        if(texture_workers != 1):
+            with INSTRUMENT.span('textures'):
+                material_files = MATERIAL.read_materials(materials, materialpath)
+                for fraction in MATERIAL.decode_material_textures(material_files, texturepath, texture_cache, texture_workers):
+                    yield 0.5 * fraction
+            yield 0.5
+
+        start = 0.5 if material_files is not None else 0.0
+        with INSTRUMENT.span('create_materials'):
+            for i, material in enumerate(materials):
+                # a material might be listed more than once
+                if(not (bpy.data.materials.get(material))):
+                    MATERIAL.create_material(material, materialpath, texturepath, texture_cache, material_files.get(material) if material_files else None)
+                    INSTRUMENT.count('materials')
+                if((i + 1) % chunk_size == 0):
+                    yield start + (1.0 - start) * (i + 1) / len(materials)
+
+def _run_steps(steps):
+    """
+    Run the steps of a step generator at once.
 
-def import_d3dbsp(d3dbsppath, assetpath, import_materials=True, import_props=True):
+    Parameters:
+    -----------
+    steps - generator - Step generator
+    -----------
+
+    Returns:
+    --------
+    Mixed - return value of the generator
+    --------
+    """
+    while(True):
+        try:
+            next(steps)
+        except StopIteration as e:
+            return e.value
+
+def import_d3dbsp_steps(d3dbsppath, assetpath, import_materials=True, import_props=True, texture_cache=None, texture_workers=0, weld_tolerance=None, duplicate_faces=None, batch_mode='material', xmodel_cache=None, region=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Import the map and the props in resumable steps. The import is done when the generator is exhausted,
+    closing the generator stops it. The created datablocks are tagged, they have to be removed with
+    remove_tagged_datablocks or kept with untag_datablocks.
+
+    Parameters:
+    -----------
+    d3dbsppath  - string    - Path to the map file
+    assetpath   - string    - Path to the assets folder structure
+    chunk_size  - int       - Number of surfaces, materials or models processed between two steps
+    ...                     - see import_d3dbsp for the rest of the parameters
+    -----------
+
+    Yields:
+    -------
+    Tuple - fraction of the import that is done and the name of the current step
+    -------
+
+    Returns:
+    --------
+    Boolean - Whether importing was successful or not (StopIteration.value)
+    --------
+    """
+
+    # define paths to certain required folders
+    xmodelpath = assetpath + "xmodel\\"
+    xmodelsurfpath = assetpath + "xmodelsurfs\\"
+    texturepath = assetpath + "images\\"
+    materialpath = assetpath + "materials\\"
+
+    caches = {'texture_cache': texture_cache, 'xmodel_cache': xmodel_cache}
+    before = {name: (cache.hits, cache.misses) for name, cache in caches.items() if cache}
+    try:
+        with INSTRUMENT.span('import', map=HELPER.return_filename_from_filepath(d3dbsppath, False)):
+            # create D3DBSP object
+            d3dbsp = D3DBSPREADER.D3DBSP()
+
+            # only start if loading was sucessful
+            with INSTRUMENT.span('load'):
+                try:
+                    loaded = d3dbsp.load_d3dbsp(d3dbsppath, columnar=True)
+                except Exception:
+                    loaded = False
+            if(not loaded):
+                d3dbsp.close()
+                return False
+            yield IMPORT_PROGRESS['load'][1], 'Loading map'
+
+            # create a null that we will use as a parent
+            d3dbspnull = HELPER.tag_datablock(bpy.data.objects.new(d3dbsp.mapname, None))
+            bpy.context.scene.collection.objects.link(d3dbspnull)
+
+            # create a null for the mapgeometry that we will parent the mapgeometry to
+            mapgeometrynull = HELPER.tag_datablock(bpy.data.objects.new(d3dbsp.mapname + "_geometry", None))
+            bpy.context.scene.collection.objects.link(mapgeometrynull)
+
+            # set the parent
+            mapgeometrynull.parent = d3dbspnull
+
+            try:
+                # only keep the surfaces and props inside the region, along with the materials they use
+                if(region is not None):
+                    with INSTRUMENT.span('region'):
+                        d3dbsp.surfaces = REGION.select_surfaces(d3dbsp.surfaces, region)
+                        d3dbsp.entities = REGION.select_entities(d3dbsp.entities, region)
+                        d3dbsp.materials = [d3dbsp.materials[i] for i in np.unique(d3dbsp.surfaces.material_ids)]
+                    print("Region contains " + str(len(d3dbsp.surfaces)) + " surfaces and " + str(len(d3dbsp.entities)) + " entities.")
+                # if material import was true
+                if(import_materials):
+                    with INSTRUMENT.span('materials', materials=len(d3dbsp.materials)):
+                        print('Importing materials...')
+                        # import materials
+                        for fraction in _import_materials_steps(d3dbsp.materials, materialpath, texturepath, texture_cache, texture_workers, chunk_size):
+                            yield _progress('materials', fraction), 'Importing materials'
+                # find the overlapping duplicate triangles
+                if(duplicate_faces):
+                    with INSTRUMENT.span('duplicates'):
+                        d3dbsp.surfaces = SURFACE.remove_duplicate_triangles(d3dbsp.surfaces, duplicate_faces)
+                    yield _progress('duplicates', 1.0), 'Finding duplicate faces'
+                print('Creating map geometry...')
+                # create map geometry
+                with INSTRUMENT.span('geometry', surfaces=len(d3dbsp.surfaces)):
+                    for fraction in _create_map_geometry_steps(d3dbsp.surfaces, d3dbsp.mapname, mapgeometrynull, weld_tolerance, batch_mode, chunk_size):
+                        yield _progress('geometry', fraction), 'Creating map geometry'
+                INSTRUMENT.count('surfaces', len(d3dbsp.surfaces))
+                # if prop import was true
+                if(import_props):
+                    # import props
+                    with INSTRUMENT.span('entities', entities=len(d3dbsp.entities)):
+                        for fraction in _import_entities_steps(d3dbsp.entities, xmodelpath, xmodelsurfpath, materialpath, texturepath, d3dbspnull, import_materials, texture_cache, texture_workers, xmodel_cache, chunk_size):
+                            yield _progress('entities', fraction), 'Importing props'
+                # clean the unused materials once the import can't be cancelled anymore
+                if(import_materials):
+                    HELPER.clean_materials()
+                return True
+            except Exception:
+                return False
+            finally:
+                d3dbsp.close()
+    finally:
+        for name, (hits, misses) in before.items():
+            INSTRUMENT.count(name + '_hits', caches[name].hits - hits)
+            INSTRUMENT.count(name + '_misses', caches[name].misses - misses)
+
+def import_d3dbsp(d3dbsppath, assetpath, import_materials=True, import_props=True, texture_cache=None, texture_workers=0, weld_tolerance=None, duplicate_faces=None, batch_mode='material', xmodel_cache=None, region=None, profiler=None):
     """
     Main import function. Imports whole map and props depending on parameters.
 
@@ -228,6 +460,19 @@ def import_d3dbsp(d3dbsppath, assetpath, import_materials=True, import_props=Tru
     assetpath           - string     - Path to the assets folder structure
     import_materials    - boolean    - Whether to import materials or not
     import_props        - boolean    - Whether to import props or not
+    texture_cache       - DiskCache  - Cache of decoded textures, textures are decoded every time if not set
+    texture_workers     - int        - Number of processes decoding the map textures, 0 uses one less than the number of CPUs
+    weld_tolerance      - float/None - Merge matching vertices of the map geometry within this tolerance
+    duplicate_faces     - string     - What to do with duplicate triangles of the map geometry:
+                                       None skips the check, 'report' only reports them,
+                                       'drop' removes them, 'decal' moves them into decal layer surfaces
+    batch_mode          - string     - 'soup' creates an object for every trianglesoup,
+                                       'material' creates an object for every material,
+                                       'single' creates one object with a material slot for every material
+    xmodel_cache        - DiskCache  - Cache of compiled xmodels, props are parsed every time if not set
+    region              - Region     - Only import the surfaces and props inside this region, the whole map is imported if not set
+    profiler            - Profiler   - Records the time of each import step and counters (bytes read, vertices, triangles,
+                                       decoded textures, cache hits...), nothing is recorded if not set
     -----------
 
     Returns:
@@ -235,47 +480,49 @@ def import_d3dbsp(d3dbsppath, assetpath, import_materials=True, import_props=Tru
     Boolean - Whether importing was successful or not
     -----------
     """
+    with INSTRUMENT.profile(profiler):
+        try:
+            return _run_steps(import_d3dbsp_steps(d3dbsppath, assetpath, import_materials, import_props, texture_cache, texture_workers,
+                weld_tolerance, duplicate_faces, batch_mode, xmodel_cache, region))
+        finally:
+            untag_datablocks()
 
-    # define paths to certain required folders
-    xmodelpath = assetpath + "xmodel\\"
-    xmodelsurfpath = assetpath + "xmodelsurfs\\"
-    texturepath = assetpath + "images\\"
-    materialpath = assetpath + "materials\\"
-    
-    # create D3DBSP object
-    d3dbsp = D3DBSPREADER.D3DBSP()
-
-    # only start if loading was sucessful
-    if(d3dbsp.load_d3dbsp(d3dbsppath)):
-        
-        # create a null that we will use as a parent
-        d3dbspnull = bpy.data.objects.new(d3dbsp.mapname, None)
-        bpy.context.scene.collection.objects.link(d3dbspnull)
+def _progress(step, fraction):
+    """
+    Return the overall progress of the import from the progress of a step.
 
-        # create a null for the mapgeometry that we will parent the mapgeometry to
-        mapgeometrynull = bpy.data.objects.new(d3dbsp.mapname + "_geometry", None)
-        bpy.context.scene.collection.objects.link(mapgeometrynull)
+    Parameters:
+    -----------
+    step        - string    - Name of the step in IMPORT_PROGRESS
+    fraction    - float     - Fraction of the step that is done
+    -----------
+    """
+    start, end = IMPORT_PROGRESS[step]
+    return start + (end - start) * fraction
 
-        # set the parent
-        mapgeometrynull.parent = d3dbspnull
+def remove_tagged_datablocks():
+    """
+    Remove the datablocks created by a cancelled import (tagged with HELPER.tag_datablock).
 
-        try:
-            # if material import was true
-            if(import_materials):
-                # clean materials first
-                HELPER.clean_materials()
-                print('Importing materials...')
-                # import materials
-                _import_materials(d3dbsp.materials, materialpath, texturepath)
-            print('Creating map geometry...')
-            # create map geometry
-            _create_mesh(d3dbsp.surfaces, d3dbsp.mapname, parent=mapgeometrynull)
-            # if prop import was true
-            if(import_props):
-                # import props
-                _import_entities(d3dbsp.entities, xmodelpath, xmodelsurfpath, materialpath, texturepath, d3dbspnull, import_materials)
-            return True
-        except:
-            return False
-    else:
-        return False
\ No newline at end of file
+    Returns:
+    --------
+    Int - number of removed datablocks
+    --------
+    """
+    removed = 0
+    # objects first, so the meshes don't have users anymore
+    for name in ROLLBACK_COLLECTIONS:
+        collection = getattr(bpy.data, name)
+        for datablock in [datablock for datablock in collection if HELPER.IMPORT_TAG in datablock]:
+            collection.remove(datablock, do_unlink=True)
+            removed += 1
+    return removed
+
+def untag_datablocks():
+    """
+    Keep the datablocks created by a finished import, so a later cancelled import doesn't remove them.
+    """
+    for name in ROLLBACK_COLLECTIONS:
+        for datablock in getattr(bpy.data, name):
+            if(HELPER.IMPORT_TAG in datablock):
+                del datablock[HELPER.IMPORT_TAG]
@@ -0,0 +1,270 @@
+import os
+import json
+import time
+import threading
+
+from contextlib import contextmanager
+
+_active = None # profiler of the running import, nothing is recorded if not set
+
+class _NullSpan:
+    """
+    _NullSpan class that is returned by span when no profiler is active, it does nothing.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    """
+    _Span class for timing a block of code. Records itself in the profiler when the block ends.
+    """
+    __slots__ = ('profiler', 'name', 'args', 'start', 'depth')
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        stack = self.profiler._stack
+        self.depth = len(stack)
+        stack.append(self)
+        self.start = self.profiler._clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = self.profiler._clock()
+        self.profiler._stack.pop()
+        self.profiler.spans.append({
+            'name': self.name,
+            'start': self.start - self.profiler.origin,
+            'duration': end - self.start,
+            'depth': self.depth,
+            'args': self.args
+        })
+        return False
+
+class Profiler:
+    """
+    Profiler class for recording nested timing spans and counters of an import. Time only passes while
+    the profiler is active (see profile), so the spans of an import that runs in slices don't include
+    the time between the slices.
+    """
+
+    def __init__(self):
+        """
+        Class constructor to initialize the class properties.
+
+        Properties:
+        -----------
+        spans       - list          - finished spans (name, start and duration in seconds of active time relative to origin, depth, args)
+                                      in the order they ended
+        counters    - dictionary    - counter name -> value
+        origin      - float         - time.perf_counter value the span times are relative to
+        -----------
+        """
+        self.spans = []
+        self.counters = {}
+        self.origin = time.perf_counter()
+        self._stack = []
+        self._idle = 0.0 # time the profiler was not active
+        self._suspended = self.origin # time.perf_counter value when the profiler was last deactivated
+
+    def _clock(self):
+        """
+        Return the time.perf_counter value without the time the profiler was not active.
+        """
+        return time.perf_counter() - self._idle
+
+    def span(self, name, **args):
+        """
+        Return a context manager timing a block of code.
+
+        Parameters:
+        -----------
+        name - string   - Name of the span
+        args - mixed    - Extra information stored with the span
+        -----------
+        """
+        return _Span(self, name, args)
+
+    def count(self, name, value=1):
+        """
+        Add to a counter.
+
+        Parameters:
+        -----------
+        name    - string        - Name of the counter
+        value   - int/float     - Value to add
+        -----------
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def totals(self):
+        """
+        Return the total time of each span name. Nested spans of the same name are only counted once.
+
+        Returns:
+        --------
+        Dictionary - span name -> seconds
+        --------
+        """
+        totals = {}
+        open_ends = {}
+        for span in sorted(self.spans, key=lambda span: span['start']):
+            end = span['start'] + span['duration']
+            # a span inside another span of the same name is already included
+            if(open_ends.get(span['name'], -1.0) >= end):
+                continue
+            open_ends[span['name']] = end
+            totals[span['name']] = totals.get(span['name'], 0.0) + span['duration']
+        return totals
+
+    def report(self):
+        """
+        Return the recorded data.
+
+        Returns:
+        --------
+        Dictionary - spans sorted by start time, counters and the total time of each span name
+        --------
+        """
+        return {
+            'spans': sorted(self.spans, key=lambda span: (span['start'], span['depth'])),
+            'counters': dict(self.counters),
+            'totals': self.totals()
+        }
+
+    def summary(self):
+        """
+        Return the spans as an indented tree followed by the counters.
+
+        Returns:
+        --------
+        String - human readable report
+        --------
+        """
+        lines = []
+        for span in self.report()['spans']:
+            lines.append('%s%-*s %9.3f s' % ('  ' * span['depth'], 32 - 2 * span['depth'], span['name'], span['duration']))
+        for name, value in sorted(self.counters.items()):
+            lines.append('%-32s %11s' % (name, value))
+        return '\n'.join(lines)
+
+    def write_json(self, filepath):
+        """
+        Write the report into a JSON file.
+
+        Parameters:
+        -----------
+        filepath - string - Path to the file
+        -----------
+        """
+        with open(filepath, 'w') as file:
+            json.dump(self.report(), file, indent=1)
+
+    def chrome_trace(self):
+        """
+        Return the spans and counters in the Chrome trace event format (chrome://tracing, Perfetto).
+
+        Returns:
+        --------
+        Dictionary - trace events
+        --------
+        """
+        pid = os.getpid()
+        tid = threading.get_ident()
+        events = []
+        for span in self.report()['spans']:
+            events.append({
+                'name': span['name'],
+                'cat': 'pyd3dbsp',
+                'ph': 'X',
+                'ts': span['start'] * 1e6,
+                'dur': span['duration'] * 1e6,
+                'pid': pid,
+                'tid': tid,
+                'args': span['args']
+            })
+        if(self.counters):
+            end = max([span['start'] + span['duration'] for span in self.spans] or [0.0])
+            events.append({'name': 'counters', 'ph': 'C', 'ts': end * 1e6, 'pid': pid, 'tid': tid, 'args': dict(self.counters)})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, filepath):
+        """
+        Write the Chrome trace of the report into a JSON file.
+
+        Parameters:
+        -----------
+        filepath - string - Path to the file
+        -----------
+        """
+        with open(filepath, 'w') as file:
+            json.dump(self.chrome_trace(), file)
+
+@contextmanager
+def profile(profiler):
+    """
+    Record the spans and counters of a block of code into a profiler. Does nothing if the profiler is None.
+    Spans left open at the end of the block (e.g. in a suspended generator) continue when the profiler is activated again.
+
+    Parameters:
+    -----------
+    profiler - Profiler/None - Profiler to record into
+    -----------
+    """
+    global _active
+    if(profiler is None or profiler is _active):
+        yield profiler
+        return
+    previous = _active
+    _active = profiler
+    # the time since the profiler was deactivated is left out of its spans
+    profiler._idle += time.perf_counter() - profiler._suspended
+    try:
+        yield profiler
+    finally:
+        profiler._suspended = time.perf_counter()
+        _active = previous
+
+def span(name, **args):
+    """
+    Time a block of code in the active profiler.
+
+    Parameters:
+    -----------
+    name - string   - Name of the span
+    args - mixed    - Extra information stored with the span
+    -----------
+
+    Returns:
+    --------
+    Context manager - does nothing if no profiler is active
+    --------
+    """
+    profiler = _active
+    if(profiler is None):
+        return _NULL_SPAN
+    return _Span(profiler, name, args)
+
+def count(name, value=1):
+    """
+    Add to a counter of the active profiler.
+
+    Parameters:
+    -----------
+    name    - string    - Name of the counter
+    value   - int/float - Value to add
+    -----------
+    """
+    profiler = _active
+    if(profiler is not None):
+        profiler.counters[name] = profiler.counters.get(name, 0) + value
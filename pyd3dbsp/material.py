@@ -1,39 +1,129 @@
 # material creation code goes here
 
+import os
+
 import bpy
 
 from . import read_material as MATERIALREADER
 from . import read_texture as TEXTUREREADER
+from . import texture_pool as TEXTUREPOOL
+from . import helper as HELPER
+
+def read_materials(names, material_fpath):
+    """
+    Read material files, so they can be shared by decode_material_textures and create_material.
+
+    Parameters:
+    -----------
+    names           - list      - List of material names
+    material_fpath  - string    - Path to the material files to read from
+    -----------
+
+    Returns:
+    --------
+    Dictionary - material name -> MTL of every material that could be read
+    --------
+    """
+    material_files = {}
+    for name in names:
+        material_file = MATERIALREADER.MTL()
+        try:
+            material_file.load_material(material_fpath + name)
+        except:
+            continue
+        material_files[name] = material_file
+    return material_files
 
-def create_material(name, material_fpath, texture_fpath):
+def decode_material_textures(material_files, texture_fpath, texture_cache=None, max_workers=0):
+    """
+    Decode the .iwi textures of materials in parallel and create their images before the materials are created.
+    Every texture is uploaded as soon as it is decoded, so only the textures being decoded are kept in memory.
+
+    Parameters:
+    -----------
+    material_files  - dictionary    - Material name -> MTL, see read_materials
+    texture_fpath   - string        - Path to the the textures to read
+    texture_cache   - DiskCache     - Cache of decoded textures
+    max_workers     - int           - Number of worker processes, 0 means one less than the number of CPUs
+    -----------
+
+    Yields:
+    -------
+    Float - fraction of the finished textures, also while the workers are busy
+    -------
+    """
+
+    # collect the unique image names of the materials
+    filepaths = {}
+    for material_file in material_files.values():
+        for mapname in material_file.mapinfo.values():
+            # images that exist already or can be loaded from .dds are not decoded
+            if(mapname in filepaths or bpy.data.images.get(mapname) or os.path.isfile(texture_fpath + mapname + '.dds')):
+                continue
+            filepaths[mapname] = texture_fpath + mapname + '.iwi'
+
+    for finished, texture in TEXTUREPOOL.decode_textures(filepaths, max_workers, texture_cache=texture_cache):
+        if(texture):
+            try:
+                _create_image(texture.name, texture)
+            finally:
+                texture.close()
+        yield finished / len(filepaths)
+
+def _create_image(name, texture):
+    """
+    Create an image from a decoded texture.
+
+    Parameters:
+    -----------
+    name    - string                    - Name of the image
+    texture - Texture/DecodedTexture    - Decoded texture
+    -----------
+
+    Returns:
+    --------
+    bpy.types.Image - the created image
+    --------
+    """
+    image = HELPER.tag_datablock(bpy.data.images.new(name, texture.width, texture.height))
+    pixels = texture.pixels_float32()
+    # upload the pixels in one call, bpy_prop_array.foreach_set is only available from blender 2.83
+    if(hasattr(image.pixels, 'foreach_set')):
+        image.pixels.foreach_set(pixels)
+    else:
+        image.pixels[:] = pixels
+    return image
+
+def create_material(name, material_fpath, texture_fpath, texture_cache=None, material_file=None):
     """
     All purpose material creation function. Reads in the necessary textures and creates a suitable shadernode setup.
 
 
     Parameters:
     -----------
-    name            - string - Name of the material
-    material_fpath  - string - Path to the material file to read from
-    texture_fpath   - string - Path to the the textures to read
+    name                - string        - Name of the material
+    material_fpath      - string        - Path to the material file to read from
+    texture_fpath       - string        - Path to the the textures to read
+    texture_cache       - DiskCache     - Cache of decoded textures
+    material_file       - MTL           - Material file read in advance by read_materials, it is read here if not set
     -----------
     """
 
     # variable for error handling
     material_loading = True
 
-    # create material object
-    material_file = MATERIALREADER.MTL()
-
-    # try to load the material
-    try:
-        material_file.load_material(material_fpath + name)
-    except:
-        print("Couldn't load material: " + name)
-        material_loading = False
+    # create material object and try to load the material, unless it was read before
+    if(material_file is None):
+        material_file = MATERIALREADER.MTL()
+        try:
+            material_file.load_material(material_fpath + name)
+        except:
+            print("Couldn't load material: " + name)
+            material_loading = False
 
     # only continue if loading was successful
     if(material_loading):
-        material = bpy.data.materials.new(material_file.materialname)
+        material = HELPER.tag_datablock(bpy.data.materials.new(material_file.materialname))
         material.use_nodes = True
 
         nodes = material.node_tree.nodes
@@ -76,13 +166,15 @@ def create_material(name, material_fpath, texture_fpath):
                 texture_image = bpy.data.images[mapname]
             except:
                 try:
+                    image_count = len(bpy.data.images)
                     texture_image = bpy.data.images.load(texture_fpath + mapname + '.dds', True)
+                    # an image of the same file might exist already
+                    if(len(bpy.data.images) > image_count):
+                        HELPER.tag_datablock(texture_image)
                 except:
                     texture = TEXTUREREADER.Texture()
-                    if(texture.load_texture(texture_fpath + mapname + '.iwi')):
-                        texture_image = bpy.data.images.new(mapname, texture.width, texture.height)
-                        pixels = [x / 255 for x in texture.texture_data]
-                        texture_image.pixels = pixels
+                    if(texture.load_texture(texture_fpath + mapname + '.iwi', cache=texture_cache)):
+                        texture_image = _create_image(mapname, texture)
                     else:
                         print("Couldn't find/load " + mapname + " (dds/iwi). Image texture will not be created.")
 
@@ -1,8 +1,29 @@
+import os
+import time
+
 import bpy
 import bpy.ops
 import bpy.props
 
 from . import importer as IMPORTER
+from . import cache as CACHE
+from . import region as REGION
+from . import instrument as INSTRUMENT
+
+MODAL_TIME_SLICE = 0.2 # seconds the modal import runs before blender gets control back
+MODAL_TIMER_INTERVAL = 0.005 # seconds between two time slices of the modal import
+
+"""
+MODAL_PASS_THROUGH_EVENTS set that defines the events blender still gets during the modal import (view navigation),
+every other event is blocked, so the scene can't be edited or undone while the import refers to it.
+"""
+MODAL_PASS_THROUGH_EVENTS = {
+    'MOUSEMOVE', 'INBETWEEN_MOUSEMOVE', 'MIDDLEMOUSE', 'WHEELUPMOUSE', 'WHEELDOWNMOUSE',
+    'TRACKPADPAN', 'TRACKPADZOOM', 'MOUSEROTATE', 'NDOF_MOTION',
+    'NUMPAD_0', 'NUMPAD_1', 'NUMPAD_2', 'NUMPAD_3', 'NUMPAD_4', 'NUMPAD_5', 'NUMPAD_6', 'NUMPAD_7', 'NUMPAD_8', 'NUMPAD_9',
+    'NUMPAD_PERIOD', 'NUMPAD_PLUS', 'NUMPAD_MINUS', 'HOME',
+    'WINDOW_DEACTIVATE', 'TIMERREGION'
+}
 
 class PyD3DBSP(bpy.types.Operator):
     bl_idname = 'pyd3dbsp.d3dbsp_importer'
@@ -32,11 +53,259 @@ class PyD3DBSP(bpy.types.Operator):
         default = True
     )
 
-    def execute(self, context):
-        if(IMPORTER.import_d3dbsp(self.filepath, self.assetpath, self.import_materials, self.import_props)):
+    use_texture_cache = bpy.props.BoolProperty(
+        name = 'Cache Textures',
+        description = 'Whether to keep decoded textures in a disk cache for later imports or not.',
+        default = True
+    )
+    texture_cache_size = bpy.props.IntProperty(
+        name = 'Texture Cache Size (MB)',
+        description = 'Size cap of the texture cache, least recently used textures are removed first.',
+        default = 1024,
+        min = 1
+    )
+
+    use_xmodel_cache = bpy.props.BoolProperty(
+        name = 'Cache Props',
+        description = 'Whether to keep parsed props in a disk cache for later imports or not.',
+        default = True
+    )
+    xmodel_cache_size = bpy.props.IntProperty(
+        name = 'Prop Cache Size (MB)',
+        description = 'Size cap of the prop cache, least recently used props are removed first.',
+        default = 256,
+        min = 1
+    )
+
+    texture_workers = bpy.props.IntProperty(
+        name = 'Texture Decoding Processes',
+        description = 'Number of processes decoding textures in parallel (0 = automatic, 1 = no parallel decoding).',
+        default = 0,
+        min = 0
+    )
+
+    weld_vertices = bpy.props.BoolProperty(
+        name = 'Weld Vertices',
+        description = 'Whether to merge vertices with the same position, normal, UV and color or not.',
+        default = False
+    )
+    weld_tolerance = bpy.props.FloatProperty(
+        name = 'Weld Tolerance',
+        description = 'Vertices closer than this are merged.',
+        default = 0.001,
+        min = 0.000001
+    )
+
+    duplicate_faces = bpy.props.EnumProperty(
+        name = 'Duplicate Faces',
+        description = 'What to do with overlapping duplicate faces of the map geometry.',
+        items = (
+            ('NONE', 'Ignore', 'Do not look for duplicate faces.'),
+            ('REPORT', 'Report', 'Only report the number of duplicate faces.'),
+            ('DROP', 'Remove', 'Remove duplicate faces.'),
+            ('DECAL', 'Decal Layers', 'Move duplicate faces into separate decal objects based on their draw order.')
+        ),
+        default = 'NONE'
+    )
+
+    batch_mode = bpy.props.EnumProperty(
+        name = 'Map Geometry',
+        description = 'How the map geometry is split into objects.',
+        items = (
+            ('MATERIAL', 'Object per Material', 'Merge the surfaces that use the same material.'),
+            ('SINGLE', 'Single Object', 'Merge every surface into one object with a material slot for each material.'),
+            ('SOUP', 'Object per Surface', 'Create an object for every trianglesoup.')
+        ),
+        default = 'MATERIAL'
+    )
+
+    region_mode = bpy.props.EnumProperty(
+        name = 'Region',
+        description = 'Only import the part of the map inside a region.',
+        items = (
+            ('NONE', 'Whole Map', 'Import the whole map.'),
+            ('BOX', 'Box', 'Import the surfaces and props inside a box.'),
+            ('SPHERE', 'Sphere', 'Import the surfaces and props inside a sphere.')
+        ),
+        default = 'NONE'
+    )
+    region_min = bpy.props.FloatVectorProperty(
+        name = 'Region Minimum',
+        description = 'Minimum corner of the box (map units).',
+        default = (-1024.0, -1024.0, -1024.0)
+    )
+    region_max = bpy.props.FloatVectorProperty(
+        name = 'Region Maximum',
+        description = 'Maximum corner of the box (map units).',
+        default = (1024.0, 1024.0, 1024.0)
+    )
+    region_center = bpy.props.FloatVectorProperty(
+        name = 'Region Center',
+        description = 'Center of the sphere (map units).',
+        default = (0.0, 0.0, 0.0)
+    )
+    region_radius = bpy.props.FloatProperty(
+        name = 'Region Radius',
+        description = 'Radius of the sphere (map units).',
+        default = 1024.0,
+        min = 0.0
+    )
+
+    modal_import = bpy.props.BoolProperty(
+        name = 'Keep Blender Responsive',
+        description = 'Import in small steps with a progress bar, the import can be cancelled with Esc. Only used when the import is started from the file browser.',
+        default = True
+    )
+    # set by invoke, scripted calls (bpy.ops, background mode) always import in one go
+    invoked = bpy.props.BoolProperty(
+        default = False,
+        options = {'HIDDEN', 'SKIP_SAVE'}
+    )
+
+    profile_import = bpy.props.BoolProperty(
+        name = 'Profile Import',
+        description = 'Whether to print the time of each import step and counters (bytes read, triangles, cache hits...) or not.',
+        default = False
+    )
+    profile_format = bpy.props.EnumProperty(
+        name = 'Profile Format',
+        description = 'Format of the profile file.',
+        items = (
+            ('JSON', 'JSON', 'Spans, counters and the total time of each step.'),
+            ('CHROME', 'Chrome Trace', 'Trace events for chrome://tracing or Perfetto.')
+        ),
+        default = 'CHROME'
+    )
+    profile_path = bpy.props.StringProperty(
+        name = 'Profile File',
+        description = 'Write the profile into this file, it is only printed if not set.',
+        default = '',
+        subtype = 'FILE_PATH'
+    )
+
+    def _import_settings(self):
+        """
+        Return the keyword arguments of the import from the properties.
+        """
+        texture_cache = None
+        if(self.use_texture_cache):
+            texture_cache = CACHE.DiskCache(os.path.join(CACHE.DEFAULT_CACHE_DIR, 'textures'), self.texture_cache_size * 1024 * 1024)
+        xmodel_cache = None
+        if(self.use_xmodel_cache):
+            xmodel_cache = CACHE.DiskCache(os.path.join(CACHE.DEFAULT_CACHE_DIR, 'xmodels'), self.xmodel_cache_size * 1024 * 1024)
+
+        region = None
+        if(self.region_mode == 'BOX'):
+            region = REGION.Region.box(self.region_min, self.region_max)
+        elif(self.region_mode == 'SPHERE'):
+            region = REGION.Region.sphere(self.region_center, self.region_radius)
+
+        return {
+            'import_materials': self.import_materials,
+            'import_props': self.import_props,
+            'texture_cache': texture_cache,
+            'texture_workers': self.texture_workers,
+            'weld_tolerance': self.weld_tolerance if self.weld_vertices else None,
+            'duplicate_faces': None if self.duplicate_faces == 'NONE' else self.duplicate_faces.lower(),
+            'batch_mode': self.batch_mode.lower(),
+            'xmodel_cache': xmodel_cache,
+            'region': region
+        }
+
+    def _report(self, success, settings, profiler):
+        """
+        Print the cache statistics and the profile of a finished import.
+        """
+        if(success):
+            if(settings['texture_cache']):
+                print("Texture cache: " + str(settings['texture_cache'].stats()))
+            if(settings['xmodel_cache']):
+                print("Prop cache: " + str(settings['xmodel_cache'].stats()))
             print("Finished loading...")
-        return {'FINISHED'}
+        if(profiler):
+            print(profiler.summary())
+            if(self.profile_path):
+                if(self.profile_format == 'CHROME'):
+                    profiler.write_chrome_trace(bpy.path.abspath(self.profile_path))
+                else:
+                    profiler.write_json(bpy.path.abspath(self.profile_path))
+
+    def execute(self, context):
+        settings = self._import_settings()
+        profiler = INSTRUMENT.Profiler() if self.profile_import else None
+
+        if(not (self.modal_import and self.invoked and context.window and not bpy.app.background)):
+            success = IMPORTER.import_d3dbsp(self.filepath, self.assetpath, profiler = profiler, **settings)
+            self._report(success, settings, profiler)
+            return {'FINISHED'}
+
+        # the import runs in time slices on a timer, so blender stays responsive
+        self._settings = settings
+        self._profiler = profiler
+        self._progress = 0.0
+        self._steps = IMPORTER.import_d3dbsp_steps(self.filepath, self.assetpath, **settings)
+
+        wm = context.window_manager
+        wm.progress_begin(0, 100)
+        self._timer = wm.event_timer_add(MODAL_TIMER_INTERVAL, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if(event.type == 'ESC'):
+            with INSTRUMENT.profile(self._profiler):
+                # stop the import, the decoded textures are released when the steps are closed
+                self._steps.close()
+            removed = IMPORTER.remove_tagged_datablocks()
+            self._end_modal(context)
+            print("Import cancelled, " + str(removed) + " created datablocks were removed.")
+            self._report(False, self._settings, self._profiler)
+            return {'CANCELLED'}
+
+        if(event.type == 'TIMER' and getattr(event, 'timer', self._timer) is not self._timer):
+            # timer events of other operators
+            return {'PASS_THROUGH'}
+
+        if(event.type != 'TIMER'):
+            # only view navigation gets through, the rest (undo, delete, ...) would change the scene under the import
+            return {'PASS_THROUGH'} if event.type in MODAL_PASS_THROUGH_EVENTS else {'RUNNING_MODAL'}
+
+        # run the steps until the time slice is used up
+        deadline = time.perf_counter() + MODAL_TIME_SLICE
+        message = None
+        with INSTRUMENT.profile(self._profiler):
+            try:
+                while(time.perf_counter() < deadline):
+                    self._progress, message = next(self._steps)
+            except StopIteration as e:
+                IMPORTER.untag_datablocks()
+                self._end_modal(context)
+                self._report(e.value, self._settings, self._profiler)
+                return {'FINISHED'}
+            except Exception:
+                # a failed import is rolled back like a cancelled one
+                removed = IMPORTER.remove_tagged_datablocks()
+                self._end_modal(context)
+                print("Import failed, " + str(removed) + " created datablocks were removed.")
+                self._report(False, self._settings, self._profiler)
+                raise
+
+        context.window_manager.progress_update(int(self._progress * 100))
+        if(message):
+            context.workspace.status_text_set(message + " (" + str(int(self._progress * 100)) + "%) - Esc to cancel")
+        # timer events of other operators are not consumed
+        return {'PASS_THROUGH'}
+
+    def _end_modal(self, context):
+        """
+        Remove the timer and the progress indicators of the modal import.
+        """
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
 
     def invoke(self, context, event):
+        self.invoked = True
         bpy.context.window_manager.fileselect_add(self)
         return {'RUNNING_MODAL'}
\ No newline at end of file
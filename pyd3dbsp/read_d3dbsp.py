@@ -1,11 +1,18 @@
 import struct
 import os
 import re
+import mmap
 
 from collections import namedtuple
 from enum import Enum
 
+import numpy as np
+
 from . import helper as HELPER
+from . import surface as SURFACE
+from . import binary_cursor as CURSOR
+from . import entities as ENTITIES
+from . import instrument as INSTRUMENT
 
 """
 D3DBSPHeader type definition. Used to store file header information.
@@ -45,6 +52,7 @@ flags   - unsigned long long    - material flags
 """
 D3DBSPMaterial = namedtuple('D3DBSPMaterial', 'name, flags')
 fmt_D3DBSPMaterial = '<64sQ' # D3DBSPMaterial format
+dtype_D3DBSPMaterial = HELPER.fmt_to_dtype(fmt_D3DBSPMaterial, D3DBSPMaterial._fields) # D3DBSPMaterial columnar format
 
 """
 D3DBSPTriangle type definition. Used to store triangle information.
@@ -59,6 +67,7 @@ v3 - unsigned short - third index
 """
 D3DBSPTriangle = namedtuple('D3DBSPTriangle', 'v1, v2, v3')
 fmt_D3DBSPTriangle = '<3H' # D3DBSPTriangle format
+dtype_D3DBSPTriangle = HELPER.fmt_to_dtype(fmt_D3DBSPTriangle, D3DBSPTriangle._fields) # D3DBSPTriangle columnar format
 
 """
 D3DBSPTriangleSoup type definition. Used to store trianglesoup information.
@@ -80,6 +89,7 @@ D3DBSPTriangleSoup = namedtuple('D3DBSPTriangleSoup',
     'triangle_length, triangle_offset')
     )
 fmt_D3DBSPTriangleSoup = '<HHIHHI' # D3DBSPTriangleSoup format
+dtype_D3DBSPTriangleSoup = HELPER.fmt_to_dtype(fmt_D3DBSPTriangleSoup, D3DBSPTriangleSoup._fields) # D3DBSPTriangleSoup columnar format
 
 
 """
@@ -119,6 +129,7 @@ D3DBSPVertex = namedtuple('D3DBSPVertex',
     'unknwn_1, unknwn_2, unknwn_3, unknwn_4, unknwn_5, unknwn_6')
     )
 fmt_D3DBSPVertex = '<3f3f4B2f2f6f' # D3DBSPVertex format
+dtype_D3DBSPVertex = HELPER.fmt_to_dtype(fmt_D3DBSPVertex, D3DBSPVertex._fields) # D3DBSPVertex columnar format
 
 class LUMP(Enum):
     """
@@ -159,6 +170,16 @@ class LUMP(Enum):
     ENTITIES = 37
     PATHS = 38
 
+"""
+LUMP_DTYPES dictionary that defines the record format of the lumps that can be decoded into structured arrays.
+"""
+LUMP_DTYPES = {
+    LUMP.MATERIALS : dtype_D3DBSPMaterial,
+    LUMP.TRIANGLESOUPS : dtype_D3DBSPTriangleSoup,
+    LUMP.VERTICES : dtype_D3DBSPVertex,
+    LUMP.TRIANGLES : dtype_D3DBSPTriangle
+}
+
 class D3DBSPENUMS(Enum):
     """
     D3DBSPENUMS class for storing some important values.
@@ -166,6 +187,61 @@ class D3DBSPENUMS(Enum):
     MAGIC = 'IBSP'
     VERSION = 4
 
+class D3DBSPLumpDirectory:
+    """
+    D3DBSPLumpDirectory class for accessing the lumps of a memory-mapped .d3dbsp file without copying them.
+    """
+
+    def __init__(self, mapped_file, lumps):
+        """
+        Class constructor to initialize the class properties.
+
+        Properties:
+        -----------
+        lumps   - list          - list of lumps (length, offset)
+        -----------
+        """
+        self.lumps = lumps
+        self._mmap = mapped_file
+        self._view = memoryview(mapped_file)
+
+    def __len__(self):
+        return len(self.lumps)
+
+    def __getitem__(self, lump):
+        """
+        Return a zero-copy view of a lump.
+
+        Parameters:
+        -----------
+        lump - LUMP/int - Lump or lump index
+        -----------
+
+        Returns:
+        --------
+        memoryview - read only view of the lump data
+        --------
+        """
+        index = lump.value if isinstance(lump, LUMP) else lump
+        current_lump = self.lumps[index]
+        # the lumps are checked against the file size by open_d3dbsp
+        return self._view[current_lump.offset:current_lump.offset + current_lump.length]
+
+    def close(self):
+        """
+        Release the view and the memory map. If decoded arrays still refer to the mapped data
+        the memory map stays open until they are garbage collected.
+        """
+        if(self._view is None):
+            return
+        try:
+            self._view.release()
+            self._mmap.close()
+        except BufferError:
+            pass
+        self._view = None
+        self._mmap = None
+
 class D3DBSP:
     """
     D3DBSP class for reading and storing data of Call of Duty 2 .d3dbsp files.
@@ -178,23 +254,45 @@ class D3DBSP:
         Properties:
         -----------
         mapname         - string        - name of the map
-        surfaces        - list          - list of dictionaries containing surface info
-        entities        - list          - list of dictionaries containing entity info
+        surfaces        - list/Surfaces - list of dictionaries containing surface info (Surfaces in columnar mode)
+        entities        - Entities      - entities (dictionaries containing entity info) indexed by classname and model
         materials       - list          - list of materials names
+
+        Columnar properties (only filled when loading with columnar=True):
+        material_flags  - numpy array   - (M,) material flags
+        trianglesoups   - numpy array   - (S,) structured array of trianglesoups
+        positions       - numpy array   - (V, 3) float32 vertex positions
+        normals         - numpy array   - (V, 3) float32 vertex normals
+        colors          - numpy array   - (V, 4) uint8 vertex colors
+        uvs             - numpy array   - (V, 2) float32 vertex UVs
+        indices         - numpy array   - (T, 3) uint16 triangle indices (relative to the trianglesoup vertex_offset)
+
+        lumpdir         - D3DBSPLumpDirectory - lump directory of the file opened with open_d3dbsp
         -----------
         """
         self.mapname = ''
         self.surfaces = []
-        self.entities = []
+        self.entities = ENTITIES.Entities()
         self.materials = []
 
-    def _read_header(self, file):
+        self.material_flags = None
+        self.trianglesoups = None
+        self.positions = None
+        self.normals = None
+        self.colors = None
+        self.uvs = None
+        self.indices = None
+
+        self.lumpdir = None
+        self._lump_cache = {}
+
+    def _read_header(self, cursor):
         """
         Read header data from file.
 
         Parameters:
         -----------
-        file - file object - File to read from
+        cursor - BinaryCursor - Cursor over the file data
         -----------
 
         Returns:
@@ -202,20 +300,19 @@ class D3DBSP:
         Namedtuple - Header magic and version
         --------
         """
-        file.seek(0)
-        header_data = file.read(struct.calcsize(fmt_D3DBSPHeader))
-        header = D3DBSPHeader._make(struct.unpack(fmt_D3DBSPHeader, header_data))
+        cursor.seek(0)
+        header = cursor.read_struct(D3DBSPHeader, fmt_D3DBSPHeader)
         # decode header magic to string
         header = header._replace(magic = header.magic.decode('utf-8'))
         return header
     
-    def _read_lumps(self, file):
+    def _read_lumps(self, cursor):
         """
         Read lump list from file.
 
         Parameters:
         -----------
-        file - file object - File to read from
+        cursor - BinaryCursor - Cursor over the file data
         -----------
 
         Returns:
@@ -223,21 +320,17 @@ class D3DBSP:
         List - list of lumps
         --------
         """
-        file.seek(struct.calcsize(fmt_D3DBSPHeader), os.SEEK_SET)
-        lumps = []
-        for i in range(39): # there are 39 lumps in the CoD2 .d3dbsp file
-            lump_data = file.read(struct.calcsize(fmt_D3DBSPLump))
-            lump = D3DBSPLump._make(struct.unpack(fmt_D3DBSPLump, lump_data))
-            lumps.append(lump)
-        return lumps
+        cursor.seek(struct.calcsize(fmt_D3DBSPHeader), os.SEEK_SET)
+        # there are 39 lumps in the CoD2 .d3dbsp file
+        return cursor.read_records(D3DBSPLump, fmt_D3DBSPLump, 39)
 
-    def _read_materials(self, file, lumps):
+    def _read_materials(self, cursor, lumps):
         """
         Read materials from file.
 
         Parameters:
         -----------
-        file    - file object   - File to read from
+        cursor  - BinaryCursor  - Cursor over the file data
         lumps   - list          - List of lumps
         -----------
 
@@ -248,23 +341,18 @@ class D3DBSP:
         """
 
         material_lump = lumps[LUMP.MATERIALS.value]
-        materials = []
-        file.seek(material_lump.offset, os.SEEK_SET)
-        for i in range(0, material_lump.length, struct.calcsize(fmt_D3DBSPMaterial)):
-            material_data = file.read(struct.calcsize(fmt_D3DBSPMaterial))
-            material = D3DBSPMaterial._make(struct.unpack(fmt_D3DBSPMaterial, material_data))
-            # decode material names and remove pad bytes
-            material = material._replace(name = material.name.decode('utf-8').rstrip('\x00'))
-            materials.append(material)
-        return materials
-
-    def _read_trianglesoups(self, file, lumps):
+        cursor.seek(material_lump.offset, os.SEEK_SET)
+        materials = cursor.read_records(D3DBSPMaterial, fmt_D3DBSPMaterial, material_lump.length // struct.calcsize(fmt_D3DBSPMaterial))
+        # decode material names and remove pad bytes
+        return [material._replace(name = material.name.decode('utf-8').rstrip('\x00')) for material in materials]
+
+    def _read_trianglesoups(self, cursor, lumps):
         """
         Read trianglesoups from file.
 
         Parameters:
         -----------
-        file    - file object   - File to read from
+        cursor  - BinaryCursor  - Cursor over the file data
         lumps   - list          - List of lumps
         -----------
 
@@ -275,21 +363,17 @@ class D3DBSP:
         """
 
         trianglesoups_lump = lumps[LUMP.TRIANGLESOUPS.value]
-        trianglesoups = []
-        file.seek(trianglesoups_lump.offset, os.SEEK_SET)
-        for i in range(0, trianglesoups_lump.length, struct.calcsize(fmt_D3DBSPTriangleSoup)):
-            trianglesoup_data = file.read(struct.calcsize(fmt_D3DBSPTriangleSoup))
-            trianglesoup = D3DBSPTriangleSoup._make(struct.unpack(fmt_D3DBSPTriangleSoup, trianglesoup_data))
-            trianglesoups.append(trianglesoup)
+        cursor.seek(trianglesoups_lump.offset, os.SEEK_SET)
+        trianglesoups = cursor.read_records(D3DBSPTriangleSoup, fmt_D3DBSPTriangleSoup, trianglesoups_lump.length // struct.calcsize(fmt_D3DBSPTriangleSoup))
         return trianglesoups
 
-    def _read_vertices(self, file, lumps):
+    def _read_vertices(self, cursor, lumps):
         """
         Read vertices from file.
 
         Parameters:
         -----------
-        file    - file object   - File to read from
+        cursor  - BinaryCursor  - Cursor over the file data
         lumps   - list          - List of lumps
         -----------
 
@@ -300,21 +384,17 @@ class D3DBSP:
         """
 
         vertices_lump = lumps[LUMP.VERTICES.value]
-        vertices = []
-        file.seek(vertices_lump.offset, os.SEEK_SET)
-        for i in range(0, vertices_lump.length, struct.calcsize(fmt_D3DBSPVertex)):
-            vertex_data = file.read(struct.calcsize(fmt_D3DBSPVertex))
-            vertex = D3DBSPVertex._make(struct.unpack(fmt_D3DBSPVertex, vertex_data))
-            vertices.append(vertex)
+        cursor.seek(vertices_lump.offset, os.SEEK_SET)
+        vertices = cursor.read_records(D3DBSPVertex, fmt_D3DBSPVertex, vertices_lump.length // struct.calcsize(fmt_D3DBSPVertex))
         return vertices
 
-    def _read_triangles(self, file, lumps):
+    def _read_triangles(self, cursor, lumps):
         """
         Read triangles from file.
 
         Parameters:
         -----------
-        file    - file object   - File to read from
+        cursor  - BinaryCursor  - Cursor over the file data
         lumps   - list          - List of lumps
         -----------
         
@@ -325,21 +405,46 @@ class D3DBSP:
         """
 
         triangles_lump = lumps[LUMP.TRIANGLES.value]
-        triangles = []
-        file.seek(triangles_lump.offset, os.SEEK_SET)
-        for i in range(0, triangles_lump.length, struct.calcsize(fmt_D3DBSPTriangle)):
-            triangle_data = file.read(struct.calcsize(fmt_D3DBSPTriangle))
-            triangle = D3DBSPTriangle._make(struct.unpack(fmt_D3DBSPTriangle, triangle_data))
-            triangles.append(triangle)
+        cursor.seek(triangles_lump.offset, os.SEEK_SET)
+        triangles = cursor.read_records(D3DBSPTriangle, fmt_D3DBSPTriangle, triangles_lump.length // struct.calcsize(fmt_D3DBSPTriangle))
         return triangles
 
-    def _read_entities(self, file, lumps):
+    def _set_columns(self, materials, trianglesoups, vertices, triangles):
+        """
+        Store the geometry related lumps as columnar arrays.
+
+        Parameters:
+        -----------
+        materials       - numpy array - structured array of materials
+        trianglesoups   - numpy array - structured array of trianglesoups
+        vertices        - numpy array - structured array of vertices
+        triangles       - numpy array - structured array of triangles
+        -----------
+        """
+
+        # materials
+        self.materials = [name.decode('utf-8').rstrip('\x00') for name in materials['name'].tolist()]
+        self.material_flags = materials['flags'].copy()
+
+        # trianglesoups are kept as a structured array, so every field is accessible as a column
+        self.trianglesoups = trianglesoups
+
+        # vertices
+        self.positions = np.stack((vertices['pos_x'], vertices['pos_y'], vertices['pos_z']), axis=1)
+        self.normals = np.stack((vertices['norm_x'], vertices['norm_y'], vertices['norm_z']), axis=1)
+        self.colors = np.stack((vertices['clr_r'], vertices['clr_g'], vertices['clr_b'], vertices['clr_a']), axis=1)
+        self.uvs = np.stack((vertices['uv_u'], vertices['uv_v']), axis=1)
+
+        # triangles
+        self.indices = np.stack((triangles['v1'], triangles['v2'], triangles['v3']), axis=1)
+
+    def _read_entities(self, cursor, lumps):
         """
         Read entities from file.
 
         Parameters:
         -----------
-        file    - file object   - File to read from
+        cursor  - BinaryCursor  - Cursor over the file data
         lumps   - list          - List of lumps
         -----------
         
@@ -350,32 +455,25 @@ class D3DBSP:
         """
 
         entities_lump = lumps[LUMP.ENTITIES.value]
-        entities = []
-        file.seek(entities_lump.offset, os.SEEK_SET)
-        entity_data = file.read(entities_lump.length)
-        # decode the whole entity data into a single string and remove pad bytes
-        entity_str = entity_data.decode('utf-8').rstrip('\x00')
-        for i in range(0, len(entity_str)):
-            entity_substr = ''
-            # split up entity string into single entity substrings
-            if(entity_str[i] == '{' and entity_str[i+1] == '\n'):
-                i += 2
-                while(entity_str[i] != '}'):
-                    entity_substr += entity_str[i]
-                    i += 1
-                # make a dictionary out of key value pairs
-                entity = dict(re.findall('\"(.*?)\"\s\"(.*?)\"\n', entity_substr))
-                # if the value of the key contains x, y, z coordinate values
-                # then make a list out of it, so its easier to access those values
-                for k, v in entity.items():
-                    if(re.match('([-.0-9e]+\s[-.0-9e]+\s[-.0-9e]+)', v)):
-                        entity[k] = v.split(' ')
-                    # remove xmodel/ from the modelname
-                    modelname = re.match('^xmodel\/(.*)', v)
-                    if(modelname):
-                        entity[k] = modelname.group(1)
-                entities.append(entity)
-        return entities
+        cursor.seek(entities_lump.offset, os.SEEK_SET)
+        entity_data = cursor.read_bytes(entities_lump.length)
+        return self._parse_entities(entity_data)
+
+    def _parse_entities(self, entity_data):
+        """
+        Parse the entity lump data.
+
+        Parameters:
+        -----------
+        entity_data - bytes - Raw entity lump data
+        -----------
+
+        Returns:
+        --------
+        Entities - entities indexed by classname and model
+        --------
+        """
+        return ENTITIES.parse_entities(entity_data)
     
     def _create_surfaces(self, materials, trianglesoups, vertices, triangles):
         """
@@ -448,9 +546,54 @@ class D3DBSP:
         # return the surfaces
         return surfaces
 
-    def load_d3dbsp(self, filepath):
+    def _decode_lump(self, lump, data):
         """
-        Load a Call of Duty 2 .d3dbsp file and read all the necessary data from it.
+        Decode the data of a lump. Lumps without a known record format are returned as they are.
+
+        Parameters:
+        -----------
+        lump    - LUMP          - Lump to decode
+        data    - memoryview    - Lump data
+        -----------
+
+        Returns:
+        --------
+        Mixed - structured array/list of entities/memoryview
+        --------
+        """
+        if(lump == LUMP.ENTITIES):
+            return self._parse_entities(data)
+
+        dtype = LUMP_DTYPES.get(lump)
+        if(dtype is None):
+            return data
+        # the array is a view of the mapped file, records that don't fit completely into the lump are ignored
+        return np.frombuffer(data, dtype=dtype, count=len(data) // dtype.itemsize)
+
+    def get_lump(self, lump):
+        """
+        Return a decoded lump of a file opened with open_d3dbsp. Each lump is decoded on first access only.
+
+        Parameters:
+        -----------
+        lump - LUMP - Lump to return
+        -----------
+
+        Returns:
+        --------
+        Mixed - structured array for geometry lumps, list of entities for the entity lump, memoryview for the rest
+        --------
+        """
+        if(lump not in self._lump_cache):
+            data = self.lumpdir[lump]
+            INSTRUMENT.count('bytes_read', len(data))
+            self._lump_cache[lump] = self._decode_lump(lump, data)
+        return self._lump_cache[lump]
+
+    def open_d3dbsp(self, filepath):
+        """
+        Memory-map a Call of Duty 2 .d3dbsp file and read the lump table only. Lumps are decoded
+        when they are first accessed with get_lump.
 
         Parameters:
         -----------
@@ -459,31 +602,118 @@ class D3DBSP:
 
         Returns:
         --------
-        Boolean - True/False wether the file reading was successful or not
+        Boolean - True/False wether opening the file was successful or not
         --------
         """
         try:
             with open(filepath, 'rb') as file:
+                mapped_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except:
+            HELPER.file_not_found(filepath, "not found or some unhandled error occured.")
+            return False
+
+        # get map name
+        self.mapname = HELPER.return_filename_from_filepath(filepath, False)
+        cursor = CURSOR.BinaryCursor(mapped_file)
+        try:
+            header = self._read_header(cursor)
+            # validate CoD2 .d3dbsp format
+            if(header.magic == D3DBSPENUMS.MAGIC.value and header.version == D3DBSPENUMS.VERSION.value):
+                lumps = self._read_lumps(cursor)
+                # a truncated file would silently load with empty lumps
+                for lump in lumps:
+                    if(lump.offset + lump.length > len(cursor)):
+                        raise ValueError("Lump runs past the end of the file.")
+                # the lumps themselves are counted when they are decoded
+                INSTRUMENT.count('bytes_read', cursor.bytes_read)
+                cursor.close()
+                self.close()
+                self.lumpdir = D3DBSPLumpDirectory(mapped_file, lumps)
+                return True
+            else:
+                print(header.magic + str(header.version) + " file version is not supported! (d3dbsp)")
+        except:
+            HELPER.file_not_found(filepath, "is not a valid d3dbsp file.")
+        cursor.close()
+        mapped_file.close()
+        return False
+
+    def close(self):
+        """
+        Drop the decoded lumps and close the memory-mapped file opened with open_d3dbsp.
+        """
+        self._lump_cache = {}
+        if(self.lumpdir):
+            self.lumpdir.close()
+            self.lumpdir = None
+
+    def load_d3dbsp(self, filepath, columnar=False):
+        """
+        Load a Call of Duty 2 .d3dbsp file and read all the necessary data from it.
+
+        Parameters:
+        -----------
+        filepath - string  - Path to the file
+        columnar - boolean - Read the geometry lumps into numpy arrays and build the surfaces in bulk
+        -----------
+
+        Returns:
+        --------
+        Boolean - True/False wether the file reading was successful or not
+        --------
+        """
+        # columnar mode reads the lumps through the memory map and builds the surfaces from the arrays
+        if(columnar):
+            if(not self.open_d3dbsp(filepath)):
+                return False
+            try:
+                self._set_columns(
+                    self.get_lump(LUMP.MATERIALS),
+                    self.get_lump(LUMP.TRIANGLESOUPS),
+                    self.get_lump(LUMP.VERTICES),
+                    self.get_lump(LUMP.TRIANGLES)
+                )
+                self.entities = self.get_lump(LUMP.ENTITIES)
+                self.surfaces = SURFACE.from_trianglesoups(
+                    self.materials,
+                    self.trianglesoups,
+                    self.positions,
+                    self.normals,
+                    self.colors,
+                    self.uvs,
+                    self.indices
+                )
+            except:
+                HELPER.file_not_found(filepath, "is not a valid d3dbsp file.")
+                self.close()
+                return False
+            print(self.mapname + " is loaded.")
+            return True
+
+        try:
+            with CURSOR.BinaryCursor.open(filepath) as cursor:
                 # get map name
                 self.mapname = HELPER.return_filename_from_filepath(filepath, False)
-                header = self._read_header(file)
+                header = self._read_header(cursor)
                 # validate CoD2 .d3dbsp format
                 if(header.magic == D3DBSPENUMS.MAGIC.value and header.version == D3DBSPENUMS.VERSION.value):
                     # read lumps
-                    lumps = self._read_lumps(file)
+                    lumps = self._read_lumps(cursor)
+
                     # read materials and store the names in a list for a separate import
-                    materials = self._read_materials(file, lumps)
+                    materials = self._read_materials(cursor, lumps)
                     for i in range(0, len(materials)):
                         self.materials.append(materials[i].name)
 
                     # read trianglesoups
-                    trianglesoups = self._read_trianglesoups(file, lumps)
+                    trianglesoups = self._read_trianglesoups(cursor, lumps)
                     # read vertices
-                    vertices = self._read_vertices(file, lumps)
+                    vertices = self._read_vertices(cursor, lumps)
                     # read triangles
-                    triangles = self._read_triangles(file, lumps)
+                    triangles = self._read_triangles(cursor, lumps)
                     # read entities
-                    self.entities = self._read_entities(file, lumps)
+                    self.entities = self._read_entities(cursor, lumps)
+                    INSTRUMENT.count('bytes_read', cursor.bytes_read)
                     # create surfaces
                     self.surfaces = self._create_surfaces(materials, trianglesoups, vertices, triangles)
                     print(self.mapname + " is loaded.")
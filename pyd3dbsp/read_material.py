@@ -1,10 +1,10 @@
-import struct
 import os
 import re
 
 from collections import namedtuple
 
-from . import helper as HELPER
+from . import binary_cursor as CURSOR
+from . import instrument as INSTRUMENT
 
 """
 MTLHeader type definition. Used to store header information.
@@ -72,41 +72,36 @@ class MTL:
         self.materialname = None
         self.mapinfo = {}
 
-    def _read_data(self, file):
+    def _read_data(self, cursor):
         """
         Read all necessary data from the file.
 
         Parameters:
         -----------
-        file - file object - File to read from
+        cursor - BinaryCursor - Cursor over the file data
         -----------
 
         """
 
 
         # read header
-        file.seek(0)
-        header_data = file.read(struct.calcsize(fmt_MTLHeader))
-        header = MTLHeader._make(struct.unpack(fmt_MTLHeader, header_data))
+        cursor.seek(0)
+        header = cursor.read_struct(MTLHeader, fmt_MTLHeader)
 
         # read material name
-        file.seek(header.mtl_name_ofs, os.SEEK_SET)
-        _materialname = file.read((header.colormap_name_ofs - header.mtl_name_ofs))
+        cursor.seek(header.mtl_name_ofs, os.SEEK_SET)
+        _materialname = cursor.read_bytes((header.colormap_name_ofs - header.mtl_name_ofs))
         self.materialname = _materialname.decode('utf-8').rstrip('\x00')
 
         # read material type
-        file.seek(header.mtl_type_ofs, os.SEEK_SET)
-        _materialtype = file.read((header.mtl_name_ofs - header.mtl_type_ofs))
+        cursor.seek(header.mtl_type_ofs, os.SEEK_SET)
+        _materialtype = cursor.read_bytes((header.mtl_name_ofs - header.mtl_type_ofs))
         self.materialtype = _materialtype.decode('utf-8').rstrip('\x00')
         
         # read mapinfoblocks
-        file.seek(header.mapinfoblock_ofs, os.SEEK_SET)
-        for i in range(0, header.mapinfoblock_number):
-
-            # we jump to the current mapinfoblock offset
-            file.seek((header.mapinfoblock_ofs + (i * struct.calcsize(fmt_MTLMapInfoBlock))), os.SEEK_SET)
-            mapinfoblock_data = file.read(struct.calcsize(fmt_MTLMapInfoBlock))
-            mapinfoblock = MTLMapInfoBlock._make(struct.unpack(fmt_MTLMapInfoBlock, mapinfoblock_data))
+        cursor.seek(header.mapinfoblock_ofs, os.SEEK_SET)
+        mapinfoblocks = cursor.read_records(MTLMapInfoBlock, fmt_MTLMapInfoBlock, header.mapinfoblock_number)
+        for mapinfoblock in mapinfoblocks:
 
             # if the first offset of the mapinfoblock is bigger than the second we swap them
             if(mapinfoblock.first_ofs > mapinfoblock.second_ofs):
@@ -115,12 +110,10 @@ class MTL:
                 mapinfoblock = mapinfoblock._replace(second_ofs = tmp_ofs)
             
             # read the first string of the mapinfoblock
-            file.seek(mapinfoblock.first_ofs)
-            str_first = HELPER.read_nullstr(file)
+            str_first = cursor.nullstr_at(mapinfoblock.first_ofs)
             
             # read the second string of the mapinfoblock
-            file.seek(mapinfoblock.second_ofs)
-            str_second = HELPER.read_nullstr(file)
+            str_second = cursor.nullstr_at(mapinfoblock.second_ofs)
 
             # material files might contain the map type and name in different order 
             # so we make sure to store the type as key and the name as value
@@ -140,5 +133,8 @@ class MTL:
 
         """
 
-        with open(filepath, 'rb') as file:
-            self._read_data(file)
+        with CURSOR.BinaryCursor.open(filepath) as cursor:
+            try:
+                self._read_data(cursor)
+            finally:
+                INSTRUMENT.count('bytes_read', cursor.bytes_read)
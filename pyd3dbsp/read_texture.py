@@ -6,6 +6,8 @@ from collections import namedtuple
 from enum import Enum
 
 from . import texture_decoder as DECODER
+from . import binary_cursor as CURSOR
+from . import instrument as INSTRUMENT
 
 TEXTHeader = namedtuple('TEXTHeader', 
     ('magic, version,'
@@ -44,6 +46,27 @@ class TextureFormat(Enum):
     DXT3 = 0x0C
     DXT5 = 0x0D
 
+"""
+BLOCK_SIZES dictionary that defines the block size in bytes of the block compressed formats.
+"""
+BLOCK_SIZES = {
+    TextureFormat.DXT1.value : 8,
+    TextureFormat.DXT3.value : 16,
+    TextureFormat.DXT5.value : 16
+}
+
+"""
+PIXEL_SIZES dictionary that defines the pixel size in bytes of the uncompressed formats.
+"""
+PIXEL_SIZES = {
+    TextureFormat.ARGB32.value : 4,
+    TextureFormat.RGB24.value : 3,
+    TextureFormat.GA16.value : 2,
+    TextureFormat.A8.value : 1
+}
+
+MAX_MIP_LEVEL = 2 # mip levels that have an offset in the header
+
 class Texture():
     """
     Texture class for reading and storing data of Call of Duty 2 .iwi files.
@@ -57,34 +80,33 @@ class Texture():
         -----------
         header          - namedtuple    - Header information
         texture_data    - bytes         - Raw texture data
-        width           - int           - Width of the image
-        height          - int           - Height of the image
+        mip_level       - int           - Mip level the texture data was decoded from
+        width           - int           - Width of the decoded mip level
+        height          - int           - Height of the decoded mip level
         format          - TextureFormat - Format of the image
         usage           - TextureUsage  - Usage of the image
         -----------
         """
         self.header = None
         self.texture_data = None
-        #self.mipmap1_data = None
-        #self.mipmap2_data = None
+        self.mip_level = 0
 
         self.width = None
         self.height = None
         self.format = None
         self.usage = None
 
-    def _read_header(self, file):
+    def _read_header(self, cursor):
         """
         Read the header of the image/texture
 
         Parameters:
         -----------
-        file - file object - File to read from
+        cursor - BinaryCursor - Cursor over the file data
         -----------
         """
-        file.seek(0)
-        header_data = file.read(struct.calcsize(fmt_TEXTHeader))
-        self.header = TEXTHeader._make(struct.unpack(fmt_TEXTHeader, header_data))
+        cursor.seek(0)
+        self.header = cursor.read_struct(TEXTHeader, fmt_TEXTHeader)
         self.header = self.header._replace(magic = self.header.magic.decode('utf-8'))
         
         self.width = self.header.width
@@ -93,30 +115,185 @@ class Texture():
         self.usage = self.header.usage
         
 
-    def _read_raw_data(self, file):
+    def pixels_float32(self, flip=True):
+        """
+        Return the decoded pixels as normalized float32 values
+
+        Parameters:
+        -----------
+        flip - boolean - Whether to flip the rows, so the first row is the bottom one (as Blender expects)
+        -----------
+
+        Returns:
+        --------
+        numpy array - contiguous float32 RGBA pixels in the 0-1 range
+        --------
+        """
+        return DECODER.to_float32(self.texture_data, self.width, self.height, flip)
+
+    def _mip_size(self, level):
+        """
+        Return the dimensions and the data size of a mip level
+
+        Parameters:
+        -----------
+        level - int - Mip level
+        -----------
+
+        Returns:
+        --------
+        Tuple - width, height, size in bytes
+        --------
+        """
+        width = max(1, self.header.width >> level)
+        height = max(1, self.header.height >> level)
+        if(self.format in BLOCK_SIZES):
+            size = ((width + 3) // 4) * ((height + 3) // 4) * BLOCK_SIZES[self.format]
+        else:
+            size = width * height * PIXEL_SIZES.get(self.format, 0)
+        return width, height, size
+
+    def _mip_range(self, level):
+        """
+        Return the byte range of a mip level. Mip levels are stored from the smallest to the largest,
+        so each level ends where the next larger one starts.
+
+        Parameters:
+        -----------
+        level - int - Mip level (0 - 2)
+        -----------
+
+        Returns:
+        --------
+        Tuple/None - start and end offset of the mip level, None if the file doesn't contain it
+        --------
+        """
+        offsets = (self.header.filesize, self.header.texture_ofs, self.header.mipmap1_ofs, self.header.mipmap2_ofs)
+        start = offsets[level + 1]
+        end = offsets[level]
+        if(start < struct.calcsize(fmt_TEXTHeader) or end - start < self._mip_size(level)[2]):
+            return None
+        return start, end
+
+    def _select_mip_level(self, mip_level=0, max_dimension=None):
+        """
+        Select the mip level to decode
+
+        Parameters:
+        -----------
+        mip_level       - int       - Requested mip level
+        max_dimension   - int/None  - Largest allowed width/height, selects a smaller mip level if needed
+        -----------
+
+        Returns:
+        --------
+        Int - the requested level, or the closest larger level if the file doesn't contain it
+        --------
+        """
+        level = min(max(mip_level, 0), MAX_MIP_LEVEL)
+        if(max_dimension):
+            while(level < MAX_MIP_LEVEL and max(self.header.width, self.header.height) >> level > max_dimension):
+                level += 1
+
+        while(level > 0 and self._mip_range(level) is None):
+            level -= 1
+        return level
+
+    def _read_raw_data(self, cursor, mip_level=0):
         """
         Read the raw data of the image/texture
 
         Parameters:
         -----------
-        file - file object - File to read from
+        cursor      - BinaryCursor  - Cursor over the file data
+        mip_level   - int           - Mip level to decode
         -----------
         """
-        file.seek(self.header.texture_ofs, os.SEEK_SET)
-        raw_data = file.read(self.header.filesize - self.header.texture_ofs)
+        self.mip_level = mip_level
+        self.width, self.height, size = self._mip_size(mip_level)
+        if(mip_level):
+            start, end = self._mip_range(mip_level)
+        else:
+            start, end = self.header.texture_ofs, self.header.filesize
+
+        # the mip level is decoded straight from the memory-mapped file
+        cursor.seek(start, os.SEEK_SET)
+        raw_data = cursor.read(min(end, len(cursor)) - start)
         if(self.format == TextureFormat.DXT1.value):
             self.texture_data = DECODER.decode_dxt1(raw_data, self.width, self.height)
-        elif(self.format and ( TextureFormat.DXT3.value or TextureFormat.DXT5.value )):
+        elif(self.format == TextureFormat.DXT3.value):
+            self.texture_data = DECODER.decode_dxt3(raw_data, self.width, self.height)
+        elif(self.format == TextureFormat.DXT5.value):
             self.texture_data = DECODER.decode_dxt5(raw_data, self.width, self.height)
-        #TODO rest of the decoding if there is any
+        elif(self.format == TextureFormat.ARGB32.value):
+            self.texture_data = DECODER.decode_argb32(raw_data, self.width, self.height)
+        elif(self.format == TextureFormat.RGB24.value):
+            self.texture_data = DECODER.decode_rgb24(raw_data, self.width, self.height)
+        elif(self.format == TextureFormat.GA16.value):
+            self.texture_data = DECODER.decode_ga16(raw_data, self.width, self.height)
+        elif(self.format == TextureFormat.A8.value):
+            self.texture_data = DECODER.decode_a8(raw_data, self.width, self.height)
+        else:
+            raise ValueError("Unsupported texture format: " + str(self.format))
+
+    def _load_cached(self, cache, key):
+        """
+        Load the decoded texture from the cache
+
+        Parameters:
+        -----------
+        cache   - DiskCache - Cache of decoded textures
+        key     - string    - Cache key
+        -----------
 
-    def load_texture(self, filepath):
+        Returns:
+        --------
+        Boolean - True/False wether the texture was found in the cache or not
+        --------
+        """
+        entry = cache.get(key)
+        if(entry is None):
+            return False
+
+        meta, arrays = entry
+        self.header = TEXTHeader._make(meta['header'])
+        self.width = meta['width']
+        self.height = meta['height']
+        self.mip_level = meta['mip_level']
+        self.format = self.header.format
+        self.usage = self.header.usage
+        # read only view of the memory-mapped cache entry
+        self.texture_data = arrays['texture_data'].data
+        return True
+
+    def _store_cached(self, cache, key):
+        """
+        Store the decoded texture in the cache
+
+        Parameters:
+        -----------
+        cache   - DiskCache - Cache of decoded textures
+        key     - string    - Cache key
+        -----------
+        """
+        meta = {
+            'header': list(self.header),
+            'width': self.width,
+            'height': self.height,
+            'mip_level': self.mip_level
+        }
+        cache.put(key, meta, {'texture_data': self.texture_data})
+
+    def load_texture(self, filepath, mip_level=0, max_dimension=None, cache=None):
         """
         Load a Call of Duty 2 .iwi file and read all the necessary data from it
 
         Parameters:
         -----------
-        filepath - string - Path to the file
+        filepath        - string    - Path to the file
+        mip_level       - int       - Mip level to decode (0 is the full resolution)
+        max_dimension   - int/None  - Largest allowed width/height, a smaller mip level is decoded if needed
+        cache           - DiskCache - Cache of decoded textures, the file is only decoded on a cache miss
         -----------
 
         Returns:
@@ -124,13 +301,25 @@ class Texture():
         Boolean - True/False wether the file reading was successful or not
         --------
         """
-        with open(filepath, 'rb') as file:
-            self._read_header(file)
+        if(cache):
+            key = cache.key(filepath, 'iwi', mip_level, max_dimension)
+            if(self._load_cached(cache, key)):
+                return True
+
+        with CURSOR.BinaryCursor.open(filepath) as cursor:
+            self._read_header(cursor)
             if(self.header.magic == TextureEnums.MAGIC.value and self.header.version == TextureEnums.VERSION.value):
                 try:
-                    self._read_raw_data(file)
+                    self._read_raw_data(cursor, self._select_mip_level(mip_level, max_dimension))
                 except:
                     return False
+                finally:
+                    # only the header and the selected mip levels are read from the mapped file
+                    INSTRUMENT.count('bytes_read', cursor.bytes_read)
+                INSTRUMENT.count('textures_decoded')
+
+                if(cache):
+                    self._store_cached(cache, key)
 
                 return True
             else:
@@ -1,11 +1,13 @@
-import struct
-import os
-
-
 from collections import namedtuple
 from enum import Enum
 
+import numpy as np
+
 from . import helper as HELPER
+from . import surface as SURFACE
+from . import cache as CACHE
+from . import binary_cursor as CURSOR
+from . import instrument as INSTRUMENT
 
 """
 XMODELSURFHeader type definition. Used to store file header information.
@@ -32,6 +34,98 @@ vertex_number2  - unsigned short - another number of vertices (function currentl
 XMODELSURFMeshHeader = namedtuple('XMODELSURFMeshHeader', 'vertex_number, triangle_number, vertex_number2')
 fmt_XMODELSURFMeshHeader = '<x3H'
 
+"""
+XMODELSURFVertex type definition. Used to store vertex information of meshes that are not physiqued.
+
+Fields:
+-------
+norm_x  - float         - Normal X
+norm_y  - float         - Normal Y
+norm_z  - float         - Normal Z
+clr_r   - unsigned char - Color red
+clr_g   - unsigned char - Color green
+clr_b   - unsigned char - Color blue
+clr_a   - unsigned char - Color alpha
+uv_u    - float         - UV U
+uv_v    - float         - UV V
+pos_x   - float         - Position X
+pos_y   - float         - Position Y
+pos_z   - float         - Position Z
+-------
+"""
+XMODELSURFVertex = namedtuple('XMODELSURFVertex',
+    ('norm_x, norm_y, norm_z,'
+    'clr_r, clr_g, clr_b, clr_a,'
+    'uv_u, uv_v,'
+    'pos_x, pos_y, pos_z')
+    )
+fmt_XMODELSURFVertex = '<3f4B2f24x3f' # XMODELSURFVertex format
+dtype_XMODELSURFVertex = HELPER.fmt_to_dtype(fmt_XMODELSURFVertex, XMODELSURFVertex._fields) # XMODELSURFVertex columnar format
+
+"""
+XMODELSURFPhysiqueVertex type definition. Used to store vertex information of physiqued meshes.
+The vertex is followed by weight_count XMODELSURFWeights and a padding byte if it has any weights.
+
+Fields:
+-------
+norm_x          - float             - Normal X
+norm_y          - float             - Normal Y
+norm_z          - float             - Normal Z
+clr_r           - unsigned char     - Color red
+clr_g           - unsigned char     - Color green
+clr_b           - unsigned char     - Color blue
+clr_a           - unsigned char     - Color alpha
+uv_u            - float             - UV U
+uv_v            - float             - UV V
+weight_count    - unsigned char     - number of weights following the vertex
+bone            - unsigned short    - bone of the vertex
+pos_x           - float             - Position X
+pos_y           - float             - Position Y
+pos_z           - float             - Position Z
+-------
+"""
+XMODELSURFPhysiqueVertex = namedtuple('XMODELSURFPhysiqueVertex',
+    ('norm_x, norm_y, norm_z,'
+    'clr_r, clr_g, clr_b, clr_a,'
+    'uv_u, uv_v,'
+    'weight_count, bone,'
+    'pos_x, pos_y, pos_z')
+    )
+fmt_XMODELSURFPhysiqueVertex = '<3f4B2f24xBH3f' # XMODELSURFPhysiqueVertex format
+dtype_XMODELSURFPhysiqueVertex = HELPER.fmt_to_dtype(fmt_XMODELSURFPhysiqueVertex, XMODELSURFPhysiqueVertex._fields) # XMODELSURFPhysiqueVertex columnar format
+
+"""
+XMODELSURFWeight type definition. Used to store weight information of physiqued vertices.
+
+Fields:
+-------
+bone        - unsigned short    - bone
+pos_x       - float             - Position X relative to the bone
+pos_y       - float             - Position Y relative to the bone
+pos_z       - float             - Position Z relative to the bone
+influence   - unsigned short    - influence of the bone
+-------
+"""
+XMODELSURFWeight = namedtuple('XMODELSURFWeight', 'bone, pos_x, pos_y, pos_z, influence')
+fmt_XMODELSURFWeight = '<H3fH' # XMODELSURFWeight format
+dtype_XMODELSURFWeight = HELPER.fmt_to_dtype(fmt_XMODELSURFWeight, XMODELSURFWeight._fields) # XMODELSURFWeight columnar format
+
+"""
+SurfaceWeights type definition. Used to store the weights of a physiqued surface as arrays.
+
+Fields:
+-------
+bones               - numpy array - bone of each vertex
+weight_offsets      - numpy array - offsets of the weights of each vertex (vertex i has weights weight_offsets[i]:weight_offsets[i + 1])
+weight_bones        - numpy array - bone of each weight
+weight_positions    - numpy array - position of each weight relative to its bone
+weight_influences   - numpy array - influence of each weight
+-------
+"""
+SurfaceWeights = namedtuple('SurfaceWeights', 'bones, weight_offsets, weight_bones, weight_positions, weight_influences')
+
+XMODEL_CACHE_VERSION = 3 # version of the compiled xmodel cache entries, part of the cache key
+
 class XMODELENUMS(Enum):
     """
     XMODELENUMS class for storing some important values.
@@ -54,115 +148,161 @@ class XModel:
         Properties:
         -----------
         modelname   - string    - name of model
-        surfaces    - list      - list of dictionaries containing surface info
+        surfaces    - list      - list of SurfaceData containing surface info
         materials   - list      - list of material names
+        lods        - list      - list of dictionaries containing LOD info (distance, name, materials)
+        weights     - list      - SurfaceWeights of each surface, None for surfaces that are not physiqued
+                                  or if the weights were not read
         -----------
         """
         self.modelname = ''
         self.surfaces = []
         self.materials = []
+        self.lods = []
+        self.weights = []
 
-    def _read_surface_data(self, file):
+    def _read_physiqued_vertices(self, cursor, vertex_number, read_weights=False):
+        """
+        Read the vertices of a physiqued mesh. The size of the vertices depends on their weight count,
+        so the offset of every vertex is found first, then the vertices are gathered at once.
+
+        Parameters:
+        -----------
+        cursor          - BinaryCursor  - Cursor at the first vertex
+        vertex_number   - int           - Number of vertices
+        read_weights    - boolean       - Whether to read the weights of the vertices or not
+        -----------
+
+        Returns:
+        -----------
+        Tuple - structured array of the vertices, SurfaceWeights/None
+        -----------
+        """
+        data = cursor.data
+        offset = cursor.tell()
+        vertex_size = dtype_XMODELSURFPhysiqueVertex.itemsize
+        weight_size = dtype_XMODELSURFWeight.itemsize
+        weight_count_offset = dtype_XMODELSURFPhysiqueVertex.fields['weight_count'][1]
+
+        # offset scan, only the weight count of every vertex is read
+        starts = np.empty(vertex_number, dtype=np.int64)
+        for i in range(vertex_number):
+            starts[i] = offset
+            weight_count = data[offset + weight_count_offset]
+            offset += vertex_size + weight_count * weight_size + (1 if weight_count else 0)
+
+        if(offset > len(cursor)):
+            raise ValueError("Unexpected end of xmodelsurf data.")
+        cursor.seek(offset)
+
+        # gather the fixed size part of every vertex
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        vertices = buffer[starts[:, None] + np.arange(vertex_size)].view(dtype_XMODELSURFPhysiqueVertex).reshape(-1)
+
+        weights = None
+        if(read_weights):
+            weight_counts = vertices['weight_count'].astype(np.int64)
+            weight_offsets = np.zeros(vertex_number + 1, dtype=np.int64)
+            np.cumsum(weight_counts, out=weight_offsets[1:])
+            # every weight follows the vertex it belongs to
+            local = np.arange(weight_offsets[-1]) - np.repeat(weight_offsets[:-1], weight_counts)
+            weight_starts = np.repeat(starts + vertex_size, weight_counts) + local * weight_size
+            weight_data = buffer[weight_starts[:, None] + np.arange(weight_size)].view(dtype_XMODELSURFWeight).reshape(-1)
+            weights = SurfaceWeights(
+                vertices['bone'].copy(),
+                weight_offsets,
+                weight_data['bone'].copy(),
+                np.stack((weight_data['pos_x'], weight_data['pos_y'], weight_data['pos_z']), axis=-1),
+                weight_data['influence'].copy()
+            )
+
+        return vertices, weights
+
+    def _read_surface_data(self, cursor, read_weights=False):
         """
         Read surface data from file.
 
         Parameters:
         -----------
-        file - file object - File to read from
+        cursor          - BinaryCursor  - Cursor over the file data
+        read_weights    - boolean       - Whether to read the weights of physiqued meshes or not
         -----------
 
         Returns:
         -----------
-        False/List of surfaces wether the reading was successful or not
+        False/Tuple of the list of SurfaceData and the list of SurfaceWeights/None of each surface wether the reading was successful or not
         -----------
         """
-        file.seek(0)
+        cursor.seek(0)
         # read xmodelsurf header
-        header_data = file.read(struct.calcsize(fmt_XMODELSURFHeader))
-        header = XMODELSURFHeader._make(struct.unpack(fmt_XMODELSURFHeader, header_data))
+        header = cursor.read_struct(XMODELSURFHeader, fmt_XMODELSURFHeader)
 
         # validate version
         if(header.version == XMODELENUMS.VERSION.value):
             meshes = []
+            weights = []
             # loop through the meshes
             for i in range(header.mesh_number):
-                current_mesh = {}
-
                 # read mesh header
-                mesh_header_data = file.read(struct.calcsize(fmt_XMODELSURFMeshHeader))
-                mesh_header = XMODELSURFMeshHeader._make(struct.unpack(fmt_XMODELSURFMeshHeader, mesh_header_data))
+                mesh_header = cursor.read_struct(XMODELSURFMeshHeader, fmt_XMODELSURFMeshHeader)
 
                 # decide if the mesh is physiqued (props arent physiqued most of the time)
-                mesh_is_physiqued = False
                 if(mesh_header.vertex_number2 == XMODELENUMS.PHYSIQUED.value):
-                    mesh_is_physiqued = True
-                
-                if(mesh_is_physiqued):
-                    file.read(2) # padding
-                
-                # read in vertex data
-                current_mesh['vertices'] = []
-                for j in range(mesh_header.vertex_number):
-                    vertex = {}
-                    vertex['normal'] = struct.unpack('<fff', file.read(12))
-                    vertex['color'] = struct.unpack('<BBBB', file.read(4))
-                    vertex['uv'] = struct.unpack('<ff', file.read(8))
-                    file.read(24) # padding
-
-                    if(mesh_is_physiqued):
-                        weight_count = struct.unpack('<B', file.read(1))[0]
-                        file.read(2) # padding
-                    
-                    vertex['position'] = struct.unpack('<fff', file.read(12))
-
-                    if(mesh_is_physiqued):
-                        for k in range(weight_count):
-                            file.read(16) # padding
-                        if(weight_count):
-                            file.read(1) # padding
-                    
-                    current_mesh['vertices'].append(vertex)
+                    cursor.skip(2) # padding
+                    vertices, mesh_weights = self._read_physiqued_vertices(cursor, mesh_header.vertex_number, read_weights)
+                else:
+                    # the vertices have a fixed size, so they are viewed as a single block
+                    vertices = cursor.read_array(dtype_XMODELSURFVertex, mesh_header.vertex_number)
+                    mesh_weights = None
 
                 # read in triangles
-                current_mesh['triangles'] = []
-                for l in range(mesh_header.triangle_number):
-                    face = struct.unpack('<HHH', file.read(6))
-                    current_mesh['triangles'].append(face)
-                
+                triangles = cursor.read_array('<u2', mesh_header.triangle_number * 3)
+
                 # store mesh
-                meshes.append(current_mesh)
+                meshes.append(SURFACE.SurfaceData(
+                    None,
+                    np.stack((vertices['pos_x'], vertices['pos_y'], vertices['pos_z']), axis=-1),
+                    np.stack((vertices['norm_x'], vertices['norm_y'], vertices['norm_z']), axis=-1),
+                    # normalize the vertex colors, same as the map vertex colors
+                    np.stack((vertices['clr_r'], vertices['clr_g'], vertices['clr_b'], vertices['clr_a']), axis=-1).astype(np.float32) / np.float32(255),
+                    np.stack((vertices['uv_u'], vertices['uv_v']), axis=-1),
+                    triangles.reshape(-1, 3).astype(np.int32)
+                ))
+                weights.append(mesh_weights)
 
             # return meshes
-            return meshes
+            return meshes, weights
         else:
             print(str(header.version) + " file version is not supported! (xmodelsurf)")
             return False
     
-    def _load_xmodelsurface(self, filepath):
+    def _load_xmodelsurface(self, filepath, read_weights=False):
         """
         Load a Call of Duty 2 xmodelsurface for the xmodel
 
         Parameters:
         -----------
-        filepath - string - Path to the file
+        filepath        - string    - Path to the file
+        read_weights    - boolean   - Whether to read the weights of physiqued meshes or not
         -----------
         """
         try:
-            with open(filepath, 'rb') as file:
+            with CURSOR.BinaryCursor.open(filepath) as cursor:
                 # read xmodelsurf data
-                surfaces = self._read_surface_data(file)
+                surfaces = self._read_surface_data(cursor, read_weights)
+                INSTRUMENT.count('bytes_read', cursor.bytes_read)
                 # return the surface data
                 return surfaces
         except:
             HELPER.file_not_found(filepath, " (xmodelsurf) not found or some unhandled error occured.")
 
-    def _read_data(self, file):
+    def _read_data(self, cursor):
         """
         Read xmodel data from file
 
         Parameters:
         -----------
-        file - file object - file to read from
+        cursor - BinaryCursor - Cursor over the file data
         -----------
 
         Returns:
@@ -170,38 +310,38 @@ class XModel:
         False/List of LODs wether the reading was successful or not
         -----------
         """
-        file.seek(0)
+        cursor.seek(0)
         # read version
-        version = struct.unpack('<H', file.read(2))[0]
+        version = cursor.unpack('<H')[0]
         if(version == XMODELENUMS.VERSION.value):
             LODs = []
-            file.read(25) # padding
+            cursor.skip(25) # padding
             # loop through LODs
             for i in range(4): # number of LODs is always 4
                 
                 # read in lod data
                 current_lod = {}
-                current_lod['distance'] = struct.unpack('<f', file.read(4))[0]
-                current_lod['name'] = HELPER.read_nullstr(file)
+                current_lod['distance'] = cursor.unpack('<f')[0]
+                current_lod['name'] = cursor.read_nullstr()
 
                 # only store valid LODs aka the ones that have name
                 if(len(current_lod['name'])):
                     LODs.append(current_lod)
 
-            file.read(4) # padding
-            pad_count = struct.unpack('<I', file.read(4))[0]
+            cursor.skip(4) # padding
+            pad_count = cursor.unpack('<I')[0]
             for j in range(pad_count):
-                subcount = struct.unpack('<I', file.read(4))[0]
-                file.read(((subcount*48)+36)) # padding
+                subcount = cursor.unpack('<I')[0]
+                cursor.skip(((subcount*48)+36)) # padding
 
             # loop through valid LODs
             for k in range(len(LODs)):
                 # read number of materials used by each lod
-                material_count = struct.unpack('<H', file.read(2))[0]
+                material_count = cursor.unpack('<H')[0]
                 current_lod_materials = []
                 # read in each LOD material names
                 for l in range(material_count):
-                    current_lod_materials.append(HELPER.read_nullstr(file))
+                    current_lod_materials.append(cursor.read_nullstr())
                 
                 # store the materials to the LODs
                 LODs[k]['materials'] = current_lod_materials
@@ -212,14 +352,120 @@ class XModel:
             print(str(version) + " file version is not supported! (xmodel)")
             return False
 
-    def load_xmodel(self, filepath, xmodelsurfpath):
+    def _load_cached(self, cache, key):
+        """
+        Load the compiled xmodel from the cache
+
+        Parameters:
+        -----------
+        cache   - DiskCache - Cache of compiled xmodels
+        key     - string    - Cache key
+        -----------
+
+        Returns:
+        --------
+        Boolean - True/False wether the xmodel was found in the cache or not
+        --------
+        """
+        entry = cache.get(key)
+        if(entry is None):
+            return False
+
+        meta, arrays = entry
+        # the entry is only valid as long as the xmodelsurf didn't change either
+        try:
+            if(CACHE.file_identity(meta['xmodelsurf'][0]) != meta['xmodelsurf']):
+                return False
+        except OSError:
+            return False
+
+        self.modelname = meta['modelname']
+        self.lods = meta['lods']
+        self.materials = meta['materials']
+
+        # split the arrays of the surfaces, the surfaces are views of the memory-mapped entry
+        self.surfaces = []
+        self.weights = []
+        vertex_offset = 0
+        triangle_offset = 0
+        weighted_offset = 0
+        weight_offset = 0
+        for material, vertex_count, triangle_count, weight_count in meta['surfaces']:
+            vertices = slice(vertex_offset, vertex_offset + vertex_count)
+            self.surfaces.append(SURFACE.SurfaceData(
+                material,
+                arrays['positions'][vertices],
+                arrays['normals'][vertices],
+                arrays['colors'][vertices],
+                arrays['uvs'][vertices],
+                arrays['triangles'][triangle_offset:triangle_offset + triangle_count]
+            ))
+            vertex_offset += vertex_count
+            triangle_offset += triangle_count
+
+            # weight_count is None for the surfaces without weights
+            if(weight_count is None):
+                self.weights.append(None)
+                continue
+            weighted = slice(weighted_offset, weighted_offset + vertex_count)
+            weights = slice(weight_offset, weight_offset + weight_count)
+            weight_offsets = np.zeros(vertex_count + 1, dtype=np.int64)
+            np.cumsum(arrays['weight_counts'][weighted], out=weight_offsets[1:])
+            self.weights.append(SurfaceWeights(
+                arrays['bones'][weighted],
+                weight_offsets,
+                arrays['weight_bones'][weights],
+                arrays['weight_positions'][weights],
+                arrays['weight_influences'][weights]
+            ))
+            weighted_offset += vertex_count
+            weight_offset += weight_count
+        return True
+
+    def _store_cached(self, cache, key, xmodelsurf):
+        """
+        Store the compiled xmodel in the cache
+
+        Parameters:
+        -----------
+        cache       - DiskCache - Cache of compiled xmodels
+        key         - string    - Cache key
+        xmodelsurf  - string    - Path to the xmodelsurf file the surfaces were read from
+        -----------
+        """
+        meta = {
+            'modelname': self.modelname,
+            'lods': self.lods,
+            'materials': self.materials,
+            'surfaces': [
+                [surface.material, len(surface.positions), len(surface.triangles), int(weights.weight_offsets[-1]) if weights else None]
+                for surface, weights in zip(self.surfaces, self.weights)
+            ],
+            'xmodelsurf': CACHE.file_identity(xmodelsurf)
+        }
+        arrays = {}
+        for field in ('positions', 'normals', 'colors', 'uvs', 'triangles'):
+            arrays[field] = np.concatenate([getattr(surface, field) for surface in self.surfaces])
+
+        weights = [weights for weights in self.weights if weights]
+        if(len(weights)):
+            arrays['bones'] = np.concatenate([w.bones for w in weights])
+            arrays['weight_counts'] = np.concatenate([np.diff(w.weight_offsets) for w in weights])
+            arrays['weight_bones'] = np.concatenate([w.weight_bones for w in weights])
+            arrays['weight_positions'] = np.concatenate([w.weight_positions for w in weights])
+            arrays['weight_influences'] = np.concatenate([w.weight_influences for w in weights])
+        cache.put(key, meta, arrays)
+
+    def load_xmodel(self, filepath, xmodelsurfpath, cache=None, read_weights=False):
         """
         Load a Call of Duty 2 xmodel
 
         Parameters:
         -----------
-        filepath        - string - Path to the file
-        xmodelsurfpath  - string - Path to the xmodelsurf file
+        filepath        - string    - Path to the file
+        xmodelsurfpath  - string    - Path to the xmodelsurf file
+        cache           - DiskCache - Cache of compiled xmodels, the files are only parsed on a cache miss
+        read_weights    - boolean   - Whether to read the weights of physiqued surfaces into weights or not
         -----------
 
         Returns:
@@ -228,11 +474,18 @@ class XModel:
         --------
         """
         try:
-            with open(filepath, 'rb') as file:
+            if(cache):
+                key = cache.key(filepath, XMODEL_CACHE_VERSION, xmodelsurfpath, read_weights)
+                if(self._load_cached(cache, key)):
+                    print(self.modelname + " is loaded.")
+                    return True
+
+            with CURSOR.BinaryCursor.open(filepath) as cursor:
                 # get model name
                 self.modelname = HELPER.return_filename_from_filepath(filepath, False)
                 # read in LODs
-                LODs = self._read_data(file)
+                LODs = self._read_data(cursor)
+                INSTRUMENT.count('bytes_read', cursor.bytes_read)
                 # if we have LODs
                 if(LODs):
                     LOD0 = LODs[0] #using highest lod all the time
@@ -240,12 +493,12 @@ class XModel:
                     xmodelsurf = xmodelsurfpath + LOD0['name']
                     
                     # load the surfaces of the xmodelsurf
-                    surfaces = self._load_xmodelsurface(xmodelsurf)
+                    surfaces, weights = self._load_xmodelsurface(xmodelsurf, read_weights)
 
                     # we only care about materials if the ratio of surfaces and materials are 1:1
                     if(len(LOD0['materials']) == len(surfaces)):
                         for i in range(0, len(surfaces)):
-                            surfaces[i]['material'] = LOD0['materials'][i]
+                            surfaces[i] = surfaces[i]._replace(material = LOD0['materials'][i])
                         # storing material names in a list for separate import 
                         self.materials = LOD0['materials']
                     else:
@@ -253,6 +506,11 @@ class XModel:
 
                     # store surfaces
                     self.surfaces = surfaces
+                    self.weights = weights
+                    self.lods = LODs
+
+                    if(cache and self.surfaces):
+                        self._store_cached(cache, key, xmodelsurf)
                     print(self.modelname + " is loaded.")
                     return True
                 else:
@@ -0,0 +1,135 @@
+import numpy as np
+
+from . import entities as ENTITIES
+
+KEY_ORIGIN = 'origin' # origin key in entity string
+
+class Region:
+    """
+    Region class for selecting the parts of a map inside a box or a sphere.
+    """
+
+    def __init__(self, mins=None, maxs=None, center=None, radius=None):
+        """
+        Class constructor to initialize the class properties. Use Region.box or Region.sphere.
+
+        Properties:
+        -----------
+        mins    - numpy array   - minimum corner of the box (None for spheres)
+        maxs    - numpy array   - maximum corner of the box (None for spheres)
+        center  - numpy array   - center of the sphere (None for boxes)
+        radius  - float         - radius of the sphere (None for boxes)
+        -----------
+        """
+        self.mins = None if mins is None else np.minimum(mins, maxs).astype(np.float64)
+        self.maxs = None if maxs is None else np.maximum(mins, maxs).astype(np.float64)
+        self.center = None if center is None else np.asarray(center, dtype=np.float64)
+        self.radius = radius
+
+    @classmethod
+    def box(cls, mins, maxs):
+        """
+        Create a box region.
+
+        Parameters:
+        -----------
+        mins - tuple - one corner of the box
+        maxs - tuple - the opposite corner of the box
+        -----------
+        """
+        return cls(mins=np.asarray(mins, dtype=np.float64), maxs=np.asarray(maxs, dtype=np.float64))
+
+    @classmethod
+    def sphere(cls, center, radius):
+        """
+        Create a sphere region.
+
+        Parameters:
+        -----------
+        center - tuple - center of the sphere
+        radius - float - radius of the sphere
+        -----------
+        """
+        return cls(center=center, radius=float(radius))
+
+    def intersects_boxes(self, mins, maxs):
+        """
+        Test axis aligned boxes against the region.
+
+        Parameters:
+        -----------
+        mins - numpy array - (N, 3) minimum corners
+        maxs - numpy array - (N, 3) maximum corners
+        -----------
+
+        Returns:
+        --------
+        numpy array - (N,) mask of the boxes that intersect the region
+        --------
+        """
+        if(self.center is None):
+            return np.all((mins <= self.maxs) & (maxs >= self.mins), axis=1)
+
+        # distance from the center to the closest point of each box
+        closest = np.clip(self.center, mins, maxs)
+        return (np.all(mins <= maxs, axis=1)
+            & (np.sum((closest - self.center) ** 2, axis=1) <= self.radius * self.radius))
+
+    def contains_points(self, points):
+        """
+        Test points against the region.
+
+        Parameters:
+        -----------
+        points - numpy array - (N, 3) points
+        -----------
+
+        Returns:
+        --------
+        numpy array - (N,) mask of the points inside the region
+        --------
+        """
+        return self.intersects_boxes(points, points)
+
+def select_surfaces(surfaces, region):
+    """
+    Return the surfaces whose bounding box intersects the region.
+
+    Parameters:
+    -----------
+    surfaces    - Surfaces  - surfaces of the map
+    region      - Region    - region to import
+    -----------
+
+    Returns:
+    --------
+    Surfaces - the surfaces inside the region, sharing the vertex arrays
+    --------
+    """
+    mins, maxs = surfaces.bounds()
+    return surfaces.subset(np.flatnonzero(region.intersects_boxes(mins, maxs)))
+
+def select_entities(entities, region):
+    """
+    Return the entities whose origin is inside the region. Entities without an origin are placed at the world origin.
+
+    Parameters:
+    -----------
+    entities    - Entities/list - entities of the map
+    region      - Region        - region to import
+    -----------
+
+    Returns:
+    --------
+    Entities - the entities inside the region
+    --------
+    """
+    entities = list(entities)
+    origins = np.zeros((len(entities), 3), dtype=np.float64)
+    for i, entity in enumerate(entities):
+        try:
+            origins[i] = [float(value) for value in entity[KEY_ORIGIN][:3]]
+        except (KeyError, TypeError, ValueError):
+            pass
+    inside = region.contains_points(origins)
+    return ENTITIES.Entities([entity for entity, keep in zip(entities, inside) if keep])
@@ -0,0 +1,708 @@
+from collections import namedtuple
+
+import numpy as np
+
+"""
+SurfaceData type definition. Used to store the arrays of a single surface.
+
+Fields:
+-------
+material            - string/list   - material name, list of material names if material_indices is set
+positions           - numpy array   - (N, 3) float32 vertex positions
+normals             - numpy array   - (N, 3) float32 vertex normals
+colors              - numpy array   - (N, 4) float32 vertex colors (0-1)
+uvs                 - numpy array   - (N, 2) float32 vertex UVs
+triangles           - numpy array   - (T, 3) int32 triangle indices (relative to the surface vertices)
+material_indices    - numpy array   - (T,) index of the material of each triangle in the material list (optional)
+layer               - int           - decal layer (0 for regular surfaces)
+-------
+
+"""
+SurfaceData = namedtuple('SurfaceData',
+    ('material, positions, normals, colors, uvs, triangles,'
+    'material_indices, layer'),
+    defaults=(None, 0)
+    )
+
+class Surfaces:
+    """
+    Surfaces class for storing surfaces in shared vertex arrays. Every surface is a triangle range
+    in the packed triangle array (CSR offsets) and a vertex range in the shared vertex arrays.
+    """
+
+    def __init__(self, materials, material_ids, positions, normals, colors, uvs, triangles, triangle_offsets, vertex_start, vertex_end, draw_order=None, layers=None):
+        """
+        Class constructor to initialize the class properties.
+
+        Properties:
+        -----------
+        materials           - list          - list of material names
+        material_ids        - numpy array   - (S,) material id of each surface
+        positions           - numpy array   - (V, 3) float32 vertex positions
+        normals             - numpy array   - (V, 3) float32 vertex normals
+        colors              - numpy array   - (V, 4) float32 vertex colors (0-1)
+        uvs                 - numpy array   - (V, 2) float32 vertex UVs
+        triangles           - numpy array   - (T, 3) int32 triangle indices into the shared vertex arrays
+        triangle_offsets    - numpy array   - (S + 1,) surface i owns triangles[triangle_offsets[i]:triangle_offsets[i + 1]]
+        vertex_start        - numpy array   - (S,) first vertex of each surface
+        vertex_end          - numpy array   - (S,) end (exclusive) of the vertex range of each surface
+        draw_order          - numpy array   - (S,) draw order of each surface
+        layers              - numpy array   - (S,) decal layer of each surface (0 for regular surfaces)
+        -----------
+        """
+        self.materials = materials
+        self.material_ids = material_ids
+        self.positions = positions
+        self.normals = normals
+        self.colors = colors
+        self.uvs = uvs
+        self.triangles = triangles
+        self.triangle_offsets = triangle_offsets
+        self.vertex_start = vertex_start
+        self.vertex_end = vertex_end
+        self.draw_order = draw_order if draw_order is not None else np.zeros(len(material_ids), dtype=np.uint16)
+        self.layers = layers if layers is not None else np.zeros(len(material_ids), dtype=np.uint16)
+
+    def __len__(self):
+        return len(self.material_ids)
+
+    def __getitem__(self, i):
+        """
+        Return a surface in the dictionary layout of the non-columnar reader, so the surfaces
+        can be used wherever a list of surface dictionaries is expected.
+
+        Parameters:
+        -----------
+        i - int - Surface index
+        -----------
+
+        Returns:
+        --------
+        Dictionary - material, triangles (tuples of vertex ids) and vertices (vertex id -> vertex data)
+        --------
+        """
+        if(i < 0):
+            i += len(self)
+        if(i < 0 or i >= len(self)):
+            raise IndexError("surface index out of range")
+
+        surface = {}
+        surface['material'] = self.material(i)
+        triangles = self.triangles[self.triangle_offsets[i]:self.triangle_offsets[i + 1]]
+        surface['triangles'] = list(map(tuple, triangles.tolist()))
+
+        # only the vertices used by the triangles are stored, same as the non-columnar reader
+        vertex_ids = np.unique(triangles).tolist()
+        surface['vertices'] = {}
+        for k, position, normal, color, uv in zip(
+            vertex_ids,
+            self.positions[vertex_ids].tolist(),
+            self.normals[vertex_ids].tolist(),
+            self.colors[vertex_ids].tolist(),
+            self.uvs[vertex_ids].tolist()
+        ):
+            surface['vertices'][k] = {
+                'normal': tuple(normal),
+                'color': tuple(color),
+                'uv': tuple(uv),
+                'position': tuple(position)
+            }
+        return surface
+
+    def material(self, i):
+        """
+        Return the material name of a surface.
+
+        Parameters:
+        -----------
+        i - int - Surface index
+        -----------
+
+        Returns:
+        --------
+        String - material name
+        --------
+        """
+        return self.materials[self.material_ids[i]]
+
+    def surface_data(self, i):
+        """
+        Return the arrays of a single surface. The vertex arrays are views of the shared arrays.
+
+        Parameters:
+        -----------
+        i - int - Surface index
+        -----------
+
+        Returns:
+        --------
+        SurfaceData - arrays of the surface with triangle indices relative to the surface vertex range
+        --------
+        """
+        start = self.vertex_start[i]
+        end = self.vertex_end[i]
+        triangles = self.triangles[self.triangle_offsets[i]:self.triangle_offsets[i + 1]] - start
+        return SurfaceData(
+            self.material(i),
+            self.positions[start:end],
+            self.normals[start:end],
+            self.colors[start:end],
+            self.uvs[start:end],
+            triangles,
+            layer=int(self.layers[i])
+        )
+
+    def merge(self, indices):
+        """
+        Merge surfaces into a single surface. Every surface brings its own vertex range.
+
+        Parameters:
+        -----------
+        indices - list/numpy array - indices of the surfaces to merge
+        -----------
+
+        Returns:
+        --------
+        SurfaceData - arrays of the merged surface, with a material list and per triangle
+                      material indices if the surfaces use more than one material
+        --------
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+
+        # gather the vertex ranges of the surfaces after each other
+        vertex_start = self.vertex_start[indices]
+        vertex_count = self.vertex_end[indices] - vertex_start
+        vertex_base = np.cumsum(vertex_count) - vertex_count
+        vertex_shift = vertex_start - vertex_base
+        vertex_ids = np.arange(vertex_count.sum(), dtype=np.int64) + np.repeat(vertex_shift, vertex_count)
+
+        # gather the triangle ranges and move the indices to the merged vertex ranges
+        triangle_start = self.triangle_offsets[indices]
+        triangle_count = self.triangle_offsets[indices + 1] - triangle_start
+        triangle_base = np.cumsum(triangle_count) - triangle_count
+        triangle_ids = np.arange(triangle_count.sum(), dtype=np.int64) + np.repeat(triangle_start - triangle_base, triangle_count)
+        triangles = (self.triangles[triangle_ids] - np.repeat(vertex_shift, triangle_count)[:, None]).astype(np.int32)
+
+        material_ids, material_indices = np.unique(self.material_ids[indices], return_inverse=True)
+        if(len(material_ids) == 1):
+            material = self.materials[material_ids[0]]
+            material_indices = None
+        else:
+            material = [self.materials[material_id] for material_id in material_ids]
+            material_indices = np.repeat(material_indices.reshape(-1), triangle_count).astype(np.int32)
+
+        return SurfaceData(
+            material,
+            self.positions[vertex_ids],
+            self.normals[vertex_ids],
+            self.colors[vertex_ids],
+            self.uvs[vertex_ids],
+            triangles,
+            material_indices,
+            int(self.layers[indices[0]]) if len(indices) else 0
+        )
+
+    def batches(self, mode='material'):
+        """
+        Merge the surfaces into batches. Decal layers are never merged with other layers.
+
+        Parameters:
+        -----------
+        mode - string - 'material' merges the surfaces with the same material,
+                        'single' merges every surface (one batch per layer),
+                        'soup' keeps every surface on its own
+        -----------
+
+        Returns:
+        --------
+        List - list of SurfaceData
+        --------
+        """
+        if(mode == 'soup'):
+            return [self.surface_data(i) for i in range(len(self))]
+        return [self.merge(indices) for indices in self.batch_indices(mode)]
+
+    def batch_indices(self, mode='material'):
+        """
+        Return the surfaces of each batch, so the batches can be merged one at a time.
+
+        Parameters:
+        -----------
+        mode - string - 'material', 'single' or 'soup', see batches
+        -----------
+
+        Returns:
+        --------
+        List - list of numpy arrays containing the surface indices of each batch
+        --------
+        """
+        if(not len(self)):
+            return []
+        if(mode == 'soup'):
+            return [np.array([i], dtype=np.int64) for i in range(len(self))]
+
+        if(mode == 'material'):
+            keys = np.stack((self.layers.astype(np.int64), self.material_ids.astype(np.int64)), axis=1)
+        else:
+            keys = self.layers.astype(np.int64)[:, None]
+        keys, groups = np.unique(keys, axis=0, return_inverse=True)
+        groups = groups.reshape(-1)
+
+        # surfaces of each batch in their original order
+        order = np.argsort(groups, kind='stable')
+        splits = np.cumsum(np.bincount(groups, minlength=len(keys)))[:-1]
+        return np.split(order, splits)
+
+    def triangle_surface_ids(self):
+        """
+        Return the surface index of every triangle.
+
+        Returns:
+        --------
+        numpy array - (T,) surface index of each triangle
+        --------
+        """
+        return np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.triangle_offsets))
+
+    def _regroup(self, triangle_surface_ids, keep, new_surfaces, new_layers):
+        """
+        Create new surfaces from a new assignment of the triangles to surfaces. The vertex arrays are shared.
+
+        Parameters:
+        -----------
+        triangle_surface_ids    - numpy array   - (T,) new surface index of each triangle
+        keep                    - numpy array   - (T,) mask of the triangles to keep
+        new_surfaces            - numpy array   - source surface of every surface appended after the existing ones
+        new_layers              - numpy array   - layer of every appended surface
+        -----------
+
+        Returns:
+        --------
+        Surfaces - surfaces with the regrouped triangles
+        --------
+        """
+        sources = np.concatenate((np.arange(len(self), dtype=np.int64), new_surfaces))
+        triangle_surface_ids = triangle_surface_ids[keep]
+        # stable sort keeps the original triangle order inside each surface
+        order = np.argsort(triangle_surface_ids, kind='stable')
+
+        triangle_offsets = np.zeros(len(sources) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(triangle_surface_ids, minlength=len(sources)), out=triangle_offsets[1:])
+
+        return Surfaces(
+            self.materials,
+            self.material_ids[sources],
+            self.positions,
+            self.normals,
+            self.colors,
+            self.uvs,
+            self.triangles[keep][order],
+            triangle_offsets,
+            self.vertex_start[sources],
+            self.vertex_end[sources],
+            self.draw_order[sources],
+            np.concatenate((self.layers, new_layers)).astype(np.uint16)
+        )
+
+    def select_triangles(self, mask):
+        """
+        Return the surfaces with only the selected triangles.
+
+        Parameters:
+        -----------
+        mask - numpy array - (T,) mask of the triangles to keep
+        -----------
+
+        Returns:
+        --------
+        Surfaces - surfaces with the selected triangles
+        --------
+        """
+        empty = np.zeros(0, dtype=np.int64)
+        return self._regroup(self.triangle_surface_ids(), mask, empty, empty)
+
+    def split_triangles(self, mask, layers):
+        """
+        Move the selected triangles of each surface into a new surface with the same material and vertices.
+
+        Parameters:
+        -----------
+        mask    - numpy array - (T,) mask of the triangles to move
+        layers  - numpy array - (S,) layer of the new surface created from each surface
+        -----------
+
+        Returns:
+        --------
+        Surfaces - surfaces with the moved triangles appended as new surfaces
+        --------
+        """
+        triangle_surface_ids = self.triangle_surface_ids()
+        new_surfaces = np.unique(triangle_surface_ids[mask])
+        # the moved triangles get the index of the new surface created from their surface
+        remap = np.zeros(len(self), dtype=np.int64)
+        remap[new_surfaces] = len(self) + np.arange(len(new_surfaces))
+        triangle_surface_ids = np.where(mask, remap[triangle_surface_ids], triangle_surface_ids)
+        return self._regroup(triangle_surface_ids, np.ones(len(mask), dtype=bool), new_surfaces, layers[new_surfaces])
+
+    def bounds(self):
+        """
+        Return the axis aligned bounding box of every surface, computed from its vertex range.
+
+        Returns:
+        --------
+        Tuple - (S, 3) minimum and (S, 3) maximum corners, surfaces without vertices get an empty box (inf, -inf)
+        --------
+        """
+        vertex_count = len(self.positions)
+        start = np.minimum(self.vertex_start, vertex_count)
+        end = np.minimum(self.vertex_end, vertex_count)
+        mins = np.full((len(self), 3), np.inf, dtype=np.float32)
+        maxs = np.full((len(self), 3), -np.inf, dtype=np.float32)
+
+        # reduceat reduces from each start to the next one, so the ranges are reduced in their vertex order
+        valid = np.flatnonzero(end > start)
+        if(len(valid)):
+            order = valid[np.argsort(start[valid], kind='stable')]
+            boundaries = np.empty(len(order) * 2, dtype=np.int64)
+            boundaries[0::2] = start[order]
+            boundaries[1::2] = end[order]
+            # every second reduction covers the gap between two ranges and is dropped,
+            # a padding vertex keeps the end of the last range a valid index
+            positions = np.concatenate((self.positions, self.positions[-1:]))
+            mins[order] = np.minimum.reduceat(positions, boundaries, axis=0)[0::2]
+            maxs[order] = np.maximum.reduceat(positions, boundaries, axis=0)[0::2]
+        return mins, maxs
+
+    def subset(self, indices):
+        """
+        Return the selected surfaces. The vertex arrays are shared.
+
+        Parameters:
+        -----------
+        indices - list/numpy array - indices of the surfaces to keep
+        -----------
+
+        Returns:
+        --------
+        Surfaces - the selected surfaces
+        --------
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        triangle_start = self.triangle_offsets[indices]
+        triangle_count = self.triangle_offsets[indices + 1] - triangle_start
+
+        triangle_offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(triangle_count, out=triangle_offsets[1:])
+        triangle_ids = np.arange(triangle_offsets[-1], dtype=np.int64) + np.repeat(triangle_start - triangle_offsets[:-1], triangle_count)
+
+        return Surfaces(
+            self.materials,
+            self.material_ids[indices],
+            self.positions,
+            self.normals,
+            self.colors,
+            self.uvs,
+            self.triangles[triangle_ids],
+            triangle_offsets,
+            self.vertex_start[indices],
+            self.vertex_end[indices],
+            self.draw_order[indices],
+            self.layers[indices]
+        )
+
+def from_trianglesoups(materials, trianglesoups, positions, normals, colors, uvs, indices):
+    """
+    Create surfaces from the columnar trianglesoups, vertices and triangles in bulk.
+
+    Parameters:
+    -----------
+    materials       - list          - list of material names
+    trianglesoups   - numpy array   - (S,) structured array of trianglesoups
+    positions       - numpy array   - (V, 3) vertex positions
+    normals         - numpy array   - (V, 3) vertex normals
+    colors          - numpy array   - (V, 4) uint8 vertex colors
+    uvs             - numpy array   - (V, 2) vertex UVs
+    indices         - numpy array   - (T, 3) triangle indices relative to the trianglesoup vertex_offset
+    -----------
+
+    Returns:
+    --------
+    Surfaces - surfaces sharing the vertex arrays
+    --------
+    """
+    triangle_start = trianglesoups['triangle_offset'].astype(np.int64) // 3
+    triangle_count = trianglesoups['triangle_length'].astype(np.int64) // 3
+    vertex_offset = trianglesoups['vertex_offset'].astype(np.int64)
+    vertex_end = vertex_offset + trianglesoups['vertex_length'].astype(np.int64)
+
+    # trianglesoups of a broken file can point outside of the lumps
+    if(len(trianglesoups) and ((triangle_start + triangle_count).max() > len(indices) or vertex_end.max() > len(positions)
+        or trianglesoups['material_id'].max() >= len(materials))):
+        raise ValueError("Trianglesoups point outside of the material, vertex or triangle lumps.")
+
+    # CSR offsets of the packed triangles
+    triangle_offsets = np.zeros(len(trianglesoups) + 1, dtype=np.int64)
+    np.cumsum(triangle_count, out=triangle_offsets[1:])
+
+    # gather the triangles of every trianglesoup into one packed array and
+    # turn the trianglesoup relative indices into shared vertex indices
+    gather = np.arange(triangle_offsets[-1], dtype=np.int64) + np.repeat(triangle_start - triangle_offsets[:-1], triangle_count)
+    triangles = indices[gather].astype(np.int64) + np.repeat(vertex_offset, triangle_count)[:, None]
+    if(len(triangles) and triangles.max() >= len(positions)):
+        raise ValueError("Triangles point outside of the vertex lump.")
+    triangles = triangles.astype(np.int32)
+
+    return Surfaces(
+        materials,
+        trianglesoups['material_id'].astype(np.int32),
+        np.ascontiguousarray(positions, dtype=np.float32),
+        np.ascontiguousarray(normals, dtype=np.float32),
+        # normalize the vertex colors in one step
+        colors.astype(np.float32) / np.float32(255),
+        np.ascontiguousarray(uvs, dtype=np.float32),
+        triangles,
+        triangle_offsets,
+        vertex_offset,
+        vertex_end,
+        trianglesoups['draw_order'].copy()
+    )
+
+def from_legacy(surface):
+    """
+    Convert a surface dictionary (as created by the non-columnar readers) into arrays.
+
+    Parameters:
+    -----------
+    surface - dictionary - vertices (list or vertex id -> vertex data), triangles and optionally material
+    -----------
+
+    Returns:
+    --------
+    SurfaceData - arrays of the surface
+    --------
+    """
+    vertices = surface['vertices']
+    triangles = surface['triangles']
+    # vertex ids of dictionaries are remapped to a continuous range
+    if(isinstance(vertices, dict)):
+        vertex_ids = sorted(vertices)
+        remap = {k: i for i, k in enumerate(vertex_ids)}
+        vertices = [vertices[k] for k in vertex_ids]
+        triangles = [[remap[k] for k in triangle] for triangle in triangles]
+
+    return SurfaceData(
+        surface.get('material'),
+        np.array([vertex['position'] for vertex in vertices], dtype=np.float32).reshape(-1, 3),
+        np.array([vertex['normal'] for vertex in vertices], dtype=np.float32).reshape(-1, 3),
+        np.array([vertex['color'] for vertex in vertices], dtype=np.float32).reshape(-1, 4),
+        np.array([vertex['uv'] for vertex in vertices], dtype=np.float32).reshape(-1, 2),
+        np.array(triangles, dtype=np.int32).reshape(-1, 3)
+    )
+
+def surface_data(surfaces, i):
+    """
+    Return the arrays of a surface from either a Surfaces object or a list of surfaces.
+
+    Parameters:
+    -----------
+    surfaces    - Surfaces/list - surfaces, or a list of surface dictionaries/SurfaceData
+    i           - int           - Surface index
+    -----------
+
+    Returns:
+    --------
+    SurfaceData/None - arrays of the surface, None if a surface dictionary doesn't contain the necessary data
+    --------
+    """
+    if(isinstance(surfaces, Surfaces)):
+        return surfaces.surface_data(i)
+
+    surface = surfaces[i]
+    if(isinstance(surface, SurfaceData)):
+        return surface
+
+    # main keys that are required to be present in the surface
+    if(not set(['vertices', 'triangles']).issubset(surface.keys())):
+        return None
+    return from_legacy(surface)
+
+def compact(surface):
+    """
+    Remove the vertices that are not used by any triangle of the surface.
+
+    Parameters:
+    -----------
+    surface - SurfaceData - arrays of the surface
+    -----------
+
+    Returns:
+    --------
+    SurfaceData - arrays of the surface with only the used vertices
+    --------
+    """
+    used, triangles = np.unique(surface.triangles, return_inverse=True)
+    if(len(used) == len(surface.positions)):
+        return surface
+    return surface._replace(
+        positions=surface.positions[used],
+        normals=surface.normals[used],
+        colors=surface.colors[used],
+        uvs=surface.uvs[used],
+        triangles=triangles.reshape(-1, 3).astype(np.int32)
+    )
+
+def weld(surface, tolerance=0.001):
+    """
+    Merge the vertices of a surface that have the same position, normal, UV and color within a tolerance.
+    The values are snapped to a grid with the size of the tolerance, vertices in the same grid cell are merged.
+
+    Parameters:
+    -----------
+    surface     - SurfaceData   - arrays of the surface
+    tolerance   - float         - size of the grid the values are snapped to
+    -----------
+
+    Returns:
+    --------
+    SurfaceData - arrays of the surface with merged vertices
+    --------
+    """
+    surface = compact(surface)
+    if(not len(surface.positions)):
+        return surface
+
+    keys = np.concatenate((surface.positions, surface.normals, surface.uvs, surface.colors), axis=1)
+    keys = np.round(keys / tolerance).astype(np.int64)
+    # every row of the keys is hashed as a single value
+    keys = np.ascontiguousarray(keys).view(np.dtype((np.void, keys.dtype.itemsize * keys.shape[1]))).reshape(-1)
+    unique, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+
+    return surface._replace(
+        positions=surface.positions[first],
+        normals=surface.normals[first],
+        colors=surface.colors[first],
+        uvs=surface.uvs[first],
+        triangles=inverse.reshape(-1)[surface.triangles].astype(np.int32)
+    )
+
+def find_duplicate_triangles(surfaces, tolerance=0.001):
+    """
+    Find the triangles that cover the same area as another triangle. The vertex positions are snapped
+    to a grid with the size of the tolerance and the vertices of each triangle are sorted, so the
+    winding order and the first vertex don't matter. Triangles with matching keys are duplicates,
+    from each group the triangle with the lowest draw order is kept.
+
+    Parameters:
+    -----------
+    surfaces    - Surfaces  - surfaces to check
+    tolerance   - float     - size of the grid the positions are snapped to
+    -----------
+
+    Returns:
+    --------
+    Tuple - (D,) indices of the duplicate triangles and (D,) indices of the triangles they duplicate
+    --------
+    """
+    if(not len(surfaces.triangles)):
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+
+    # one hashable key per vertex, then one per triangle with the vertex keys in a canonical order
+    positions = np.round(surfaces.positions / tolerance).astype(np.int64)
+    vertex_keys = np.ascontiguousarray(positions).view(np.dtype((np.void, positions.dtype.itemsize * 3))).reshape(-1)
+    triangle_keys = np.ascontiguousarray(np.sort(vertex_keys[surfaces.triangles], axis=1))
+    triangle_keys = triangle_keys.view(np.dtype((np.void, triangle_keys.dtype.itemsize * 3))).reshape(-1)
+    unique, groups = np.unique(triangle_keys, return_inverse=True)
+    groups = groups.reshape(-1)
+
+    # order the triangles by group, then by draw order, so the first of each group is the one that's kept
+    triangle_count = len(groups)
+    draw_order = surfaces.draw_order[surfaces.triangle_surface_ids()]
+    order = np.lexsort((np.arange(triangle_count), draw_order, groups))
+    first = np.ones(triangle_count, dtype=bool)
+    first[1:] = groups[order[1:]] != groups[order[:-1]]
+
+    # the kept triangle of each group
+    kept = np.zeros(len(unique), dtype=np.int64)
+    kept[groups[order[first]]] = order[first]
+
+    duplicates = order[~first]
+    return duplicates, kept[groups[duplicates]]
+
+def remove_duplicate_triangles(surfaces, mode='report', tolerance=0.001):
+    """
+    Report the duplicate triangles of the surfaces and optionally drop them or move them to decal layers.
+
+    Parameters:
+    -----------
+    surfaces    - Surfaces  - surfaces to check
+    mode        - string    - 'report' only prints the number of duplicates,
+                              'drop' removes the duplicates,
+                              'decal' moves the duplicates into new surfaces with their draw order as layer
+    tolerance   - float     - size of the grid the positions are snapped to
+    -----------
+
+    Returns:
+    --------
+    Surfaces - processed surfaces
+    --------
+    """
+    duplicates, originals = find_duplicate_triangles(surfaces, tolerance)
+    print(str(len(duplicates)) + " duplicate triangles found.")
+    if(not len(duplicates)):
+        return surfaces
+
+    mask = np.zeros(len(surfaces.triangles), dtype=bool)
+    mask[duplicates] = True
+    if(mode == 'drop'):
+        return surfaces.select_triangles(~mask)
+    elif(mode == 'decal'):
+        # decals drawn on top of a surface have a higher draw order, layer 0 is reserved for regular surfaces
+        return surfaces.split_triangles(mask, np.maximum(surfaces.draw_order, 1))
+    return surfaces
+
+def concatenate(surfaces):
+    """
+    Concatenate surfaces into a single surface.
+
+    Parameters:
+    -----------
+    surfaces - list - list of SurfaceData
+    -----------
+
+    Returns:
+    --------
+    SurfaceData - arrays of the concatenated surface, with a material list and per triangle
+                  material indices if the surfaces use more than one material
+    --------
+    """
+    # every distinct material (or list of materials) gets a slot
+    materials = []
+    material_indices = []
+    for surface in surfaces:
+        surface_materials = surface.material if surface.material_indices is not None else [surface.material]
+        slots = []
+        for material in surface_materials:
+            if(material not in materials):
+                materials.append(material)
+            slots.append(materials.index(material))
+        slots = np.array(slots, dtype=np.int32)
+        if(surface.material_indices is not None):
+            material_indices.append(slots[surface.material_indices])
+        else:
+            material_indices.append(np.full(len(surface.triangles), slots[0], dtype=np.int32))
+
+    vertex_counts = [len(surface.positions) for surface in surfaces]
+    vertex_base = np.cumsum([0] + vertex_counts[:-1]).astype(np.int32)
+    triangles = [surface.triangles + base for surface, base in zip(surfaces, vertex_base)]
+
+    return SurfaceData(
+        materials[0] if len(materials) == 1 else materials,
+        np.concatenate([surface.positions for surface in surfaces]).reshape(-1, 3),
+        np.concatenate([surface.normals for surface in surfaces]).reshape(-1, 3),
+        np.concatenate([surface.colors for surface in surfaces]).reshape(-1, 4),
+        np.concatenate([surface.uvs for surface in surfaces]).reshape(-1, 2),
+        np.concatenate(triangles).reshape(-1, 3).astype(np.int32),
+        np.concatenate(material_indices) if len(materials) > 1 else None,
+        surfaces[0].layer if len(surfaces) else 0
+    )
@@ -1,7 +1,14 @@
 import struct
 from io import BytesIO
+from array import array
 
-# this code is straight up yoinked from Pillow
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# the pure python decoders are straight up yoinked from Pillow,
+# the numpy decoders decode all blocks at once and give the same output
    
 def _decode565(bits):
     a = ((bits >> 11) & 0x1f) << 3
@@ -21,7 +28,7 @@ def _c3(a, b):
     return (2 * b + a) // 3
 
 
-def decode_dxt1(byte_data, width, height):
+def decode_dxt1_python(byte_data, width, height):
     data = BytesIO(byte_data)
     ret = bytearray(4 * width * height)
 
@@ -83,7 +90,47 @@ def _dxtc_alpha(a0, a1, ac0, ac1, ai):
     return alpha
 
 
-def decode_dxt5(byte_data, width, height):
+def decode_dxt3_python(byte_data, width, height):
+    data = BytesIO(byte_data)
+    ret = bytearray(4 * width * height)
+
+    for y in range(0, height, 4):
+        for x in range(0, width, 4):
+            bits = struct.unpack("<8B", data.read(8))
+            c0, c1, code = struct.unpack("<2HI", data.read(8))
+
+            r0, g0, b0 = _decode565(c0)
+            r1, g1, b1 = _decode565(c1)
+
+            for j in range(4):
+                high = False # do we want the higher bits?
+                for i in range(4):
+                    alpha = bits[(4 * j + i) // 2]
+                    if high:
+                        high = False
+                        alpha >>= 4
+                    else:
+                        high = True
+                        alpha &= 0xf
+                    alpha *= 17 # we get a value between 0 and 15
+
+                    cc = (code >> 2 * (4 * j + i)) & 3
+                    if cc == 0:
+                        r, g, b = r0, g0, b0
+                    elif cc == 1:
+                        r, g, b = r1, g1, b1
+                    elif cc == 2:
+                        r, g, b = _c2a(r0, r1), _c2a(g0, g1), _c2a(b0, b1)
+                    elif cc == 3:
+                        r, g, b = _c3(r0, r1), _c3(g0, g1), _c3(b0, b1)
+
+                    idx = 4 * ((y + j) * width + x + i)
+                    ret[idx:idx+4] = struct.pack('4B', r, g, b, alpha)
+
+    return bytes(ret)
+
+
+def decode_dxt5_python(byte_data, width, height):
     data = BytesIO(byte_data)
     ret = bytearray(4 * width * height)
 
@@ -113,3 +160,223 @@ def decode_dxt5(byte_data, width, height):
                     ret[idx:idx+4] = struct.pack('4B', r, g, b, alpha)
 
     return bytes(ret)
+
+
+def _swizzle(byte_data, width, height, channels, order):
+    """
+    Convert uncompressed pixel data into RGBA by copying whole channels with strided slices
+
+    Parameters:
+    -----------
+    byte_data   - bytes/memoryview  - Raw pixel data
+    width       - int               - Width of the image
+    height      - int               - Height of the image
+    channels    - int               - Number of bytes per pixel in the raw data
+    order       - tuple             - Source channel of the R, G, B, A channels (None means 255)
+    -----------
+
+    Returns:
+    -----------
+    bytes - RGBA pixel data
+    -----------
+    """
+    size = width * height
+    data = memoryview(byte_data).cast('B')
+    if len(data) < size * channels:
+        raise ValueError("Not enough pixel data for a " + str(width) + "x" + str(height) + " image.")
+    data = data[:size * channels]
+
+    ret = bytearray(b'\xff' * (4 * size))
+    for i, channel in enumerate(order):
+        if channel is not None:
+            ret[i::4] = data[channel::channels]
+
+    return bytes(ret)
+
+
+def decode_argb32(byte_data, width, height):
+    # stored as BGRA
+    return _swizzle(byte_data, width, height, 4, (2, 1, 0, 3))
+
+
+def decode_rgb24(byte_data, width, height):
+    # stored as BGR
+    return _swizzle(byte_data, width, height, 3, (2, 1, 0, None))
+
+
+def decode_ga16(byte_data, width, height):
+    # stored as luminance, alpha
+    return _swizzle(byte_data, width, height, 2, (0, 0, 0, 1))
+
+
+def decode_a8(byte_data, width, height):
+    # alpha only, color is white
+    return _swizzle(byte_data, width, height, 1, (None, None, None, 0))
+
+
+def _blocks_to_image(blocks, width, height):
+    """
+    Arrange decoded 4x4 blocks into an image
+
+    Parameters:
+    -----------
+    blocks  - numpy array   - (N, 16, C) decoded blocks in row major block order
+    width   - int           - Width of the image
+    height  - int           - Height of the image
+    -----------
+
+    Returns:
+    -----------
+    numpy array - (height, width, C) image
+    -----------
+    """
+    blocks_y = (height + 3) // 4
+    blocks_x = (width + 3) // 4
+    channels = blocks.shape[-1]
+    image = blocks.reshape(blocks_y, blocks_x, 4, 4, channels).transpose(0, 2, 1, 3, 4)
+    image = image.reshape(blocks_y * 4, blocks_x * 4, channels)
+    # images smaller than a block only use the top left part of it
+    return image[:height, :width]
+
+
+def _decode_color_blocks(color0, color1, bits, punch_through):
+    """
+    Decode the color part of DXT blocks
+
+    Parameters:
+    -----------
+    color0          - numpy array   - (N,) first 565 endpoints
+    color1          - numpy array   - (N,) second 565 endpoints
+    bits            - numpy array   - (N,) 2 bit color indices of the 16 pixels
+    punch_through   - boolean       - Whether color0 <= color1 switches to 3 color + black mode (DXT1)
+    -----------
+
+    Returns:
+    -----------
+    numpy array - (N, 16, 3) uint8 colors
+    -----------
+    """
+    color0 = color0.astype(np.int32)
+    color1 = color1.astype(np.int32)
+
+    # 565 endpoint expansion
+    c0 = np.stack((((color0 >> 11) & 0x1f) << 3, ((color0 >> 5) & 0x3f) << 2, (color0 & 0x1f) << 3), axis=1)
+    c1 = np.stack((((color1 >> 11) & 0x1f) << 3, ((color1 >> 5) & 0x3f) << 2, (color1 & 0x1f) << 3), axis=1)
+
+    # palette construction
+    palette = np.empty((len(color0), 4, 3), dtype=np.uint8)
+    palette[:, 0] = c0
+    palette[:, 1] = c1
+    if(punch_through):
+        four_colors = (color0 > color1)[:, None]
+        palette[:, 2] = np.where(four_colors, (2 * c0 + c1) // 3, (c0 + c1) // 2)
+        palette[:, 3] = np.where(four_colors, (2 * c1 + c0) // 3, 0)
+    else:
+        palette[:, 2] = (2 * c0 + c1) // 3
+        palette[:, 3] = (2 * c1 + c0) // 3
+
+    # index extraction
+    codes = (bits.astype(np.uint32)[:, None] >> (2 * np.arange(16, dtype=np.uint32))) & 3
+    return palette[np.arange(len(color0))[:, None], codes]
+
+
+def decode_dxt1_numpy(byte_data, width, height):
+    block_count = ((width + 3) // 4) * ((height + 3) // 4)
+    blocks = np.frombuffer(byte_data, dtype=np.dtype([('color0', '<u2'), ('color1', '<u2'), ('bits', '<u4')]), count=block_count)
+
+    pixels = np.empty((block_count, 16, 4), dtype=np.uint8)
+    pixels[:, :, :3] = _decode_color_blocks(blocks['color0'], blocks['color1'], blocks['bits'], True)
+    pixels[:, :, 3] = 255
+
+    return _blocks_to_image(pixels, width, height).tobytes()
+
+
+def decode_dxt1(byte_data, width, height):
+    if np is None:
+        return decode_dxt1_python(byte_data, width, height)
+    return decode_dxt1_numpy(byte_data, width, height)
+
+
+def decode_dxt3_numpy(byte_data, width, height):
+    block_count = ((width + 3) // 4) * ((height + 3) // 4)
+    blocks = np.frombuffer(byte_data, dtype=np.dtype([('alpha', '<u8'), ('color0', '<u2'), ('color1', '<u2'), ('bits', '<u4')]), count=block_count)
+
+    pixels = np.empty((block_count, 16, 4), dtype=np.uint8)
+    pixels[:, :, :3] = _decode_color_blocks(blocks['color0'], blocks['color1'], blocks['bits'], False)
+    # 4 bit explicit alpha expanded to 8 bits
+    pixels[:, :, 3] = ((blocks['alpha'][:, None] >> (4 * np.arange(16, dtype=np.uint64))) & 0xf) * 17
+
+    return _blocks_to_image(pixels, width, height).tobytes()
+
+
+def decode_dxt5_numpy(byte_data, width, height):
+    block_count = ((width + 3) // 4) * ((height + 3) // 4)
+    blocks = np.frombuffer(byte_data, dtype=np.dtype([('alpha0', 'u1'), ('alpha1', 'u1'), ('alphabits', 'V6'), ('color0', '<u2'), ('color1', '<u2'), ('bits', '<u4')]), count=block_count)
+
+    # 48 bit alpha indices, padded to 64 bits
+    alphabits = np.zeros((block_count, 8), dtype=np.uint8)
+    alphabits[:, :6] = np.frombuffer(blocks['alphabits'].tobytes(), dtype=np.uint8).reshape(block_count, 6)
+    alphabits = alphabits.view('<u8')[:, 0]
+    alphacodes = (alphabits[:, None] >> (3 * np.arange(16, dtype=np.uint64))) & 7
+
+    # interpolated alpha palette
+    a0 = blocks['alpha0'].astype(np.int32)[:, None]
+    a1 = blocks['alpha1'].astype(np.int32)[:, None]
+    codes = np.arange(8, dtype=np.int32)
+    eight_alphas = ((8 - codes) * a0 + (codes - 1) * a1) // 7
+    six_alphas = ((6 - codes) * a0 + (codes - 1) * a1) // 5
+    six_alphas[:, 6] = 0
+    six_alphas[:, 7] = 0xff
+    alpha_palette = np.where(a0 > a1, eight_alphas, six_alphas)
+    alpha_palette[:, 0] = a0[:, 0]
+    alpha_palette[:, 1] = a1[:, 0]
+
+    pixels = np.empty((block_count, 16, 4), dtype=np.uint8)
+    pixels[:, :, :3] = _decode_color_blocks(blocks['color0'], blocks['color1'], blocks['bits'], False)
+    pixels[:, :, 3] = alpha_palette[np.arange(block_count)[:, None], alphacodes.astype(np.intp)]
+
+    return _blocks_to_image(pixels, width, height).tobytes()
+
+
+def decode_dxt3(byte_data, width, height):
+    if np is None:
+        return decode_dxt3_python(byte_data, width, height)
+    return decode_dxt3_numpy(byte_data, width, height)
+
+
+def decode_dxt5(byte_data, width, height):
+    if np is None:
+        return decode_dxt5_python(byte_data, width, height)
+    return decode_dxt5_numpy(byte_data, width, height)
+
+
+def to_float32(byte_data, width, height, flip=True):
+    """
+    Convert RGBA pixel data into normalized float32 pixels
+
+    Parameters:
+    -----------
+    byte_data   - bytes/memoryview  - RGBA pixel data
+    width       - int               - Width of the image
+    height      - int               - Height of the image
+    flip        - boolean           - Whether to flip the rows, so the first row is the bottom one (as Blender expects)
+    -----------
+
+    Returns:
+    -----------
+    numpy array/array - contiguous float32 pixels in the 0-1 range
+    -----------
+    """
+    row = 4 * width
+    if np is None:
+        data = memoryview(byte_data).cast('B')[:row * height]
+        if flip:
+            data = b''.join(data[y * row:(y + 1) * row] for y in reversed(range(height)))
+        return array('f', [x / 255 for x in data])
+
+    pixels = np.frombuffer(byte_data, dtype=np.uint8, count=row * height).reshape(height, row)
+    if flip:
+        pixels = pixels[::-1]
+    ret = np.empty((height, row), dtype=np.float32)
+    np.divide(pixels, np.float32(255), out=ret, dtype=np.float32)
+    return ret.reshape(-1)
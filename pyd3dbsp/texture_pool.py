@@ -0,0 +1,264 @@
+import os
+import sys
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# shared memory is only available from python 3.8, older pythons (blender 2.81 ships 3.7) decode the textures in this process
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+from . import read_texture as TEXTUREREADER
+from . import texture_decoder as DECODER
+from . import cache as CACHE
+from . import binary_cursor as CURSOR
+from . import instrument as INSTRUMENT
+
+TEXTURES_IN_FLIGHT = 2 # number of textures submitted to each worker process at a time
+TEXTURE_POLL_INTERVAL = 0.05 # seconds decode_textures waits for a worker before it yields without a texture
+
+_worker_caches = {} # texture caches of a worker process by their settings
+
+class DecodedTexture:
+    """
+    DecodedTexture class for storing a texture decoded by a worker process. The pixels live in
+    shared memory, so they are not copied when they are passed back from the worker.
+    """
+
+    def __init__(self, name, width, height, texture_data, shm=None):
+        """
+        Class constructor to initialize the class properties.
+
+        Properties:
+        -----------
+        name            - string        - Name of the texture
+        width           - int           - Width of the image
+        height          - int           - Height of the image
+        texture_data    - memoryview    - RGBA pixel data
+        -----------
+        """
+        self.name = name
+        self.width = width
+        self.height = height
+        self.texture_data = texture_data
+        self._shm = shm
+
+    def pixels_float32(self, flip=True):
+        """
+        Return the decoded pixels as normalized float32 values
+
+        Parameters:
+        -----------
+        flip - boolean - Whether to flip the rows, so the first row is the bottom one (as Blender expects)
+        -----------
+
+        Returns:
+        --------
+        numpy array - contiguous float32 RGBA pixels in the 0-1 range
+        --------
+        """
+        return DECODER.to_float32(self.texture_data, self.width, self.height, flip)
+
+    def close(self):
+        """
+        Release the shared memory of the texture.
+        """
+        if(self._shm is not None):
+            self.texture_data.release()
+            self.texture_data = None
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+def _python_executable():
+    """
+    Return the python interpreter the worker processes are started with. Inside Blender
+    sys.executable might be the Blender binary itself.
+
+    Returns:
+    --------
+    String - path to the python interpreter
+    --------
+    """
+    try:
+        import bpy
+        binary_path_python = getattr(bpy.app, 'binary_path_python', None)
+        if(binary_path_python):
+            return binary_path_python
+    except ImportError:
+        pass
+    return sys.executable
+
+def _texture_size(filepath, mip_level, max_dimension):
+    """
+    Read the header of a texture and return the size of the decoded pixel data.
+
+    Parameters:
+    -----------
+    filepath        - string    - Path to the file
+    mip_level       - int       - Mip level to decode
+    max_dimension   - int/None  - Largest allowed width/height
+    -----------
+
+    Returns:
+    --------
+    Int/None - size of the RGBA pixel data in bytes, None if the file is not a valid texture
+    --------
+    """
+    texture = TEXTUREREADER.Texture()
+    try:
+        with CURSOR.BinaryCursor.open(filepath) as cursor:
+            texture._read_header(cursor)
+    except:
+        return None
+    if(texture.header.magic != TEXTUREREADER.TextureEnums.MAGIC.value or texture.header.version != TEXTUREREADER.TextureEnums.VERSION.value):
+        return None
+    width, height, size = texture._mip_size(texture._select_mip_level(mip_level, max_dimension))
+    return width * height * 4
+
+def _decode_worker(filepath, shm_name, mip_level, max_dimension, cache_settings):
+    """
+    Decode a texture into shared memory. Runs in a worker process.
+
+    Parameters:
+    -----------
+    filepath        - string        - Path to the file
+    shm_name        - string        - Name of the shared memory block allocated by the parent process
+    mip_level       - int           - Mip level to decode
+    max_dimension   - int/None      - Largest allowed width/height
+    cache_settings  - tuple/None    - Directory and size cap of the texture cache
+    -----------
+
+    Returns:
+    --------
+    Tuple/None - width, height, whether the texture came from the cache and the counters of the decode, None on failure
+    --------
+    """
+    cache = None
+    if(cache_settings):
+        # every worker process keeps its cache, so its size is not scanned again for every texture
+        if(cache_settings not in _worker_caches):
+            _worker_caches[cache_settings] = CACHE.DiskCache(*cache_settings)
+        cache = _worker_caches[cache_settings]
+        hits = cache.hits
+    texture = TEXTUREREADER.Texture()
+    # the counters are recorded here and added to the profiler of the parent process
+    profiler = INSTRUMENT.Profiler()
+    try:
+        with INSTRUMENT.profile(profiler):
+            if(not texture.load_texture(filepath, mip_level, max_dimension, cache)):
+                return None
+    except:
+        return None
+
+    size = texture.width * texture.height * 4
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        shm.buf[:size] = texture.texture_data[:size]
+    finally:
+        shm.close()
+    return texture.width, texture.height, bool(cache and cache.hits > hits), profiler.counters
+
+def decode_textures(filepaths, max_workers=0, mip_level=0, max_dimension=None, texture_cache=None):
+    """
+    Decode textures in parallel in a process pool. Only TEXTURES_IN_FLIGHT textures per worker are
+    submitted at a time, so shared memory is only allocated for the textures being decoded. While the
+    workers are busy it yields every TEXTURE_POLL_INTERVAL seconds, so the caller can report progress.
+
+    Parameters:
+    -----------
+    filepaths       - dictionary    - Texture name -> path to the .iwi file
+    max_workers     - int           - Number of worker processes, 0 means one less than the number of CPUs
+    mip_level       - int           - Mip level to decode
+    max_dimension   - int/None      - Largest allowed width/height
+    texture_cache   - DiskCache     - Cache of decoded textures
+    -----------
+
+    Yields:
+    -------
+    Tuple - number of finished textures and the DecodedTexture that was finished (in the order they are finished),
+            None if the texture could not be decoded or no texture was finished yet. The textures have to be closed by the caller
+    -------
+    """
+    if(not max_workers):
+        max_workers = max(1, (os.cpu_count() or 1) - 1)
+    max_workers = min(max_workers, len(filepaths))
+
+    if(max_workers <= 1 or shared_memory is None):
+        # not worth starting processes, decode in this process
+        for i, (name, filepath) in enumerate(filepaths.items()):
+            texture = TEXTUREREADER.Texture()
+            try:
+                loaded = texture.load_texture(filepath, mip_level, max_dimension, texture_cache)
+            except:
+                loaded = False
+            yield i + 1, DecodedTexture(name, texture.width, texture.height, texture.texture_data) if loaded else None
+        return
+
+    cache_settings = (texture_cache.directory, texture_cache.max_size) if texture_cache else None
+    context = multiprocessing.get_context('spawn')
+    context.set_executable(_python_executable())
+    executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+
+    # the parent process owns the shared memory, so it outlives the worker processes on every platform
+    pending = iter(filepaths.items())
+    blocks = {} # future -> (name, shared memory block) of the submitted textures that were not handed out yet
+    finished = 0
+    try:
+        while(True):
+            # keep the workers busy with a bounded number of textures
+            while(len(blocks) < max_workers * TEXTURES_IN_FLIGHT):
+                name, filepath = next(pending, (None, None))
+                if(name is None):
+                    break
+                size = _texture_size(filepath, mip_level, max_dimension)
+                if(not size):
+                    finished += 1
+                    continue
+                shm = shared_memory.SharedMemory(create=True, size=size)
+                try:
+                    future = executor.submit(_decode_worker, filepath, shm.name, mip_level, max_dimension, cache_settings)
+                except:
+                    shm.close()
+                    shm.unlink()
+                    raise
+                blocks[future] = (name, shm)
+
+            if(not len(blocks)):
+                break
+
+            done, not_done = wait(blocks, timeout=TEXTURE_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            if(not len(done)):
+                yield finished, None
+            for future in done:
+                name, shm = blocks.pop(future)
+                finished += 1
+                try:
+                    result = future.result()
+                except:
+                    result = None
+
+                if(result is None):
+                    shm.close()
+                    shm.unlink()
+                    yield finished, None
+                    continue
+
+                width, height, cache_hit, counters = result
+                # the workers don't record into the profiler of this process
+                for counter, value in counters.items():
+                    INSTRUMENT.count(counter, value)
+                if(texture_cache):
+                    if(cache_hit):
+                        texture_cache.hits += 1
+                    else:
+                        texture_cache.misses += 1
+                yield finished, DecodedTexture(name, width, height, shm.buf[:width * height * 4], shm)
+    finally:
+        executor.shutdown(wait=True)
+        # the blocks of textures that were never handed out (failure or the caller stopped early)
+        for name, shm in blocks.values():
+            shm.close()
+            shm.unlink()